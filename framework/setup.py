@@ -5,7 +5,7 @@ requirements = ['numpy', 'redis', 'Pillow', 'six',]
 
 if six.PY3:
     # cannot be installed on nao
-    requirements += ["paramiko", "scp"]
+    requirements += ["paramiko"]
 
 setup(
     name='sic_framework',
@@ -14,4 +14,9 @@ setup(
     author_email='k.v.hindriks@vu.nl',
     packages=['sic_framework'],
     install_requires=requirements,
+    entry_points={
+        "console_scripts": [
+            "sic-top = sic_framework.core.sic_top:main",
+        ],
+    },
 )
@@ -0,0 +1,496 @@
+"""
+An asyncio version of the SICConnector and SICRedis client API, so a single application can drive several devices and
+services concurrently without a thread per call. Python 3 only, and requires redis-py >= 4.2 for redis.asyncio.
+
+Example:
+    async def main():
+        async with AsyncSICRedis() as redis:
+            dialogflow = await AsyncSICConnector.create(Dialogflow, conf=conf, redis=redis)
+            tts = AsyncSICConnector.from_connector(pepper.tts, redis=redis)
+
+            # speak and listen at the same time
+            _, reply = await asyncio.gather(tts.arequest(NaoqiTextToSpeechRequest("Hello!")),
+                                            dialogflow.arequest(GetIntentRequest(session_id)))
+
+            async for message in dialogflow.messages():
+                print(message)
+
+    asyncio.run(main())
+"""
+import asyncio
+import logging
+import os
+
+import six
+
+from sic_framework.core import clock_python2 as clock
+from sic_framework.core import tracing_python2 as tracing
+from sic_framework.core import utils
+from sic_framework.core.component_python2 import ConnectRequest
+from sic_framework.core.connector import SICComponentStarter, SICConnector
+from sic_framework.core.message_python2 import SICMessage, SICRequest, SICStopRequest
+from sic_framework.core.sic_logging import SIC_LOG_SUBSCRIBER
+from sic_framework.core.sic_redis import SICRedis, get_redis_db_ip_password
+from sic_framework.core.utils import is_sic_instance
+
+try:
+    import redis
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+
+class _Subscription(object):
+    """
+    An asynchronous iterator over the SICMessages received on one or more channels.
+    """
+
+    def __init__(self, redis, channels, ignore_requests, maxsize):
+        self._redis = redis
+        self.channels = channels
+        self.ignore_requests = ignore_requests
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.closed = False
+
+    def put(self, message):
+        if self.queue.full():
+            # drop the oldest message, a slow consumer should not block the other subscriptions
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed:
+            raise StopAsyncIteration
+        message = await self.queue.get()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+    async def close(self):
+        if not self.closed:
+            self.closed = True
+            self.put(None)
+            await self._redis._unsubscribe(self)
+
+
+class AsyncSICRedis(object):
+    """
+    The asyncio counterpart of SICRedis. All subscriptions share one pubsub connection that is read by a single
+    task, and replies to requests arrive on a reply channel that is subscribed to once.
+    """
+
+    def __init__(self, parent_name=None):
+        """
+        :param parent_name: The name of the module that uses this redis connection, for easier debugging
+        """
+        if aioredis is None:
+            raise ImportError("AsyncSICRedis requires redis.asyncio, install it with `pip install 'redis>=4.2'`")
+
+        self.service_name = parent_name
+        self.stopping = False
+
+        self._redis = None
+        self._pubsub = None
+        self._reader_task = None
+
+        # channel -> list of _Subscription
+        self._subscriptions = dict()
+
+        self._reply_channel = "sic:reply:{}".format(utils.str_if_bytes(utils.random_hex()))
+        self._pending_replies = dict()
+        self._connect_lock = None
+
+    async def connect(self):
+        """
+        Connect to redis, with the same password and TLS fallbacks as SICRedis. Does nothing if already connected.
+        """
+        if self._connect_lock is None:
+            # created here, as it must be created within the running event loop
+            self._connect_lock = asyncio.Lock()
+
+        async with self._connect_lock:
+            if self._redis is None:
+                await self._connect()
+
+        return self
+
+    async def _connect(self):
+        host, password = get_redis_db_ip_password()
+
+        try:
+            client = aioredis.Redis(host=host, ssl=False, password=password)
+            await client.ping()
+        except redis.exceptions.AuthenticationError:
+            # redis is running without a password, do not supply it.
+            client = aioredis.Redis(host=host, ssl=False)
+            await client.ping()
+        except redis.exceptions.ConnectionError as e:
+            # Must be a connection error; so now let's try to connect with TLS
+            ssl_ca_certs = os.path.join(os.path.dirname(__file__), 'cert.pem')
+            print('TLS required. Looking for certificate here:', ssl_ca_certs, "(Source error {})".format(e))
+            client = aioredis.Redis(host=host, ssl=True, ssl_ca_certs=ssl_ca_certs, password=password)
+            try:
+                await client.ping()
+            except redis.exceptions.ConnectionError:
+                six.raise_from(Exception("Could not connect to redis at {} \n\n Have you started redis? Use: "
+                                         "`redis-server conf/redis/redis.conf`".format(host)), None)
+
+        self._redis = client
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+
+        # replies are handled by the reader task, wait for the subscription so no reply can be missed
+        await self._pubsub.subscribe(self._reply_channel)
+        self._reader_task = asyncio.ensure_future(self._read_messages())
+        while (await self._redis.pubsub_numsub(self._reply_channel))[0][1] == 0:
+            await asyncio.sleep(0.001)
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def _read_messages(self):
+        """
+        Receive the messages of all channels and hand them to the waiting requests and subscriptions.
+        """
+        while not self.stopping:
+            try:
+                pubsub_msg = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                if self.stopping:
+                    break
+                print("{}: error while reading messages: {}".format(self.service_name or "AsyncSICRedis", e))
+                await asyncio.sleep(0.1)
+                continue
+
+            if pubsub_msg is None or pubsub_msg["type"] != "message":
+                continue
+
+            channel = utils.str_if_bytes(pubsub_msg["channel"])
+
+            try:
+                message = SICMessage.deserialize(pubsub_msg["data"])
+            except Exception as e:
+                print("{}: could not deserialize message on {}: {}".format(self.service_name or "AsyncSICRedis",
+                                                                           channel, e))
+                continue
+
+            if channel == self._reply_channel:
+                future = self._pending_replies.pop(message._request_id, None)
+                if future is not None and not future.done():
+                    future.set_result(message)
+                continue
+
+            for subscription in self._subscriptions.get(channel, []):
+                if subscription.ignore_requests and is_sic_instance(message, SICRequest):
+                    continue
+                subscription.put(message)
+
+    async def subscribe(self, channels, ignore_requests=True, maxsize=100):
+        """
+        Subscribe to one or more channels.
+
+        Example:
+            async for message in await redis.subscribe("my_channel"):
+                print(message)
+
+        :param channels: channel or channels to listen to
+        :param ignore_requests: Do not yield SICRequests sent on the channels
+        :param maxsize: The number of messages to buffer for a slow consumer, older messages are dropped.
+        :return: an asynchronous iterator of SICMessages, close it with `await subscription.close()`
+        """
+        await self.connect()
+
+        channels = utils.str_if_bytes(channels)
+        if isinstance(channels, six.text_type):
+            channels = [channels]
+        channels = [utils.str_if_bytes(c) for c in channels]
+
+        subscription = _Subscription(self, channels, ignore_requests, maxsize)
+
+        new_channels = [c for c in channels if c not in self._subscriptions]
+        for c in channels:
+            self._subscriptions.setdefault(c, []).append(subscription)
+
+        if new_channels:
+            await self._pubsub.subscribe(*new_channels)
+
+        return subscription
+
+    async def _unsubscribe(self, subscription):
+        unused_channels = []
+        for c in subscription.channels:
+            subscriptions = self._subscriptions.get(c, [])
+            if subscription in subscriptions:
+                subscriptions.remove(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(c, None)
+                unused_channels.append(c)
+
+        if unused_channels and not self.stopping:
+            await self._pubsub.unsubscribe(*unused_channels)
+
+    async def send_message(self, channel, message):
+        """
+        Send a SICMessage to a service/device listening on the channel.
+        :return: The number of subscribers that received the message.
+        """
+        assert isinstance(message, SICMessage), "Message must inherit from SICMessage (got {})".format(type(message))
+        await self.connect()
+
+        return await self._redis.publish(channel, message.serialize())
+
+    async def request(self, channel, request, timeout=5, block=True):
+        """
+        Send a request, and wait for the reply on the reply channel. If the reply takes longer than
+        `timeout` seconds to arrive, a TimeoutError is raised.
+        :param channel: The redis pubsub channel to communicate on.
+        :param request: The SICRequest
+        :param timeout: Timeout in seconds in case the reply takes too long.
+        :param block: If false, returns None after sending the request.
+        :return: the SICMessage reply
+        """
+        if request._request_id is None:
+            raise ValueError("Invalid request id for request {}".format(request.get_message_name()))
+
+        await self.connect()
+
+        if not block:
+            await self.send_message(channel, request)
+            return None
+
+        request._reply_channel = self._reply_channel
+        future = asyncio.get_event_loop().create_future()
+        self._pending_replies[request._request_id] = future
+
+        try:
+            await self.send_message(channel, request)
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            six.raise_from(
+                TimeoutError("Waiting for reply to {} to request timed out".format(request.get_message_name())), None)
+        finally:
+            self._pending_replies.pop(request._request_id, None)
+
+    async def get_values(self, keys):
+        """
+        Get the strings stored at several keys in a single round trip (see SICRedis.get_values).
+        """
+        await self.connect()
+
+        return [utils.str_if_bytes(value) if value is not None else None for value in await self._redis.mget(keys)]
+
+    async def close(self):
+        """
+        Stop listening to all channels and disconnect redis.
+        """
+        if self.stopping:
+            return
+        self.stopping = True
+
+        for subscriptions in list(self._subscriptions.values()):
+            for subscription in subscriptions:
+                subscription.closed = True
+                subscription.put(None)
+
+        for future in self._pending_replies.values():
+            future.cancel()
+
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except asyncio.CancelledError:
+                pass
+
+        for connection in [self._pubsub, self._redis]:
+            if connection is None:
+                continue
+            # aclose was added in redis-py 5, close is deprecated since
+            close = getattr(connection, "aclose", None) or connection.close
+            await close()
+
+
+class AsyncSICConnector(object):
+    """
+    The asyncio counterpart of SICConnector, for any component that has a SICConnector.
+
+    Example:
+        camera = await AsyncSICConnector.create(NaoqiTopCamera, ip="192.168.0.151")
+        async for image_message in camera.messages():
+            ...
+    """
+
+    # define how long an "instant" reply should take at most (see SICComponentStarter)
+    _PING_TIMEOUT = SICComponentStarter.PING_TIMEOUT
+
+    def __init__(self, connector_class, ip="localhost", log_level=logging.INFO, conf=None, redis=None):
+        """
+        Create the connector, use `await connector.start()` or AsyncSICConnector.create to start the component.
+        :param connector_class: The SICConnector subclass of the component, e.g. NaoqiTopCamera
+        :param ip: the ip adress of the device the component is running on
+        :param log_level: Controls the verbosity of the connected component logging.
+        :param conf: Optional SICConfMessage to set component parameters.
+        :param redis: An AsyncSICRedis to share between connectors. If None, the connector creates its own.
+        """
+        assert issubclass(connector_class, SICConnector), "Component connector must be a SICConnector"
+        assert isinstance(ip, str), "IP must be string"
+
+        if ip in ["localhost", "127.0.0.1"]:
+            ip = utils.get_ip_adress()
+
+        self.connector_class = connector_class
+        self._ip = ip
+        self._log_level = log_level
+        self._conf = conf
+
+        self._owns_redis = redis is None
+        self._redis = redis if redis is not None else AsyncSICRedis(parent_name=self.component_class.get_component_name())
+        self._subscriptions = []
+
+        self._request_reply_channel = self.component_class.get_request_reply_channel(ip)
+        self.output_channel = self.component_class.get_output_channel(ip)
+        self.input_channel = "{}:input:{}".format(self.component_class.get_component_name(), ip)
+
+        # the registry entry of the component, see SICConnector
+        self.component_info = None
+
+    @property
+    def component_class(self):
+        return self.connector_class.component_class
+
+    @classmethod
+    async def create(cls, connector_class, ip="localhost", log_level=logging.INFO, conf=None, redis=None):
+        """
+        Create a connector and start the component if it is not yet running.
+        :return: AsyncSICConnector
+        """
+        connector = cls(connector_class, ip=ip, log_level=log_level, conf=conf, redis=redis)
+        await connector.start()
+        return connector
+
+    @classmethod
+    def from_connector(cls, connector, redis=None):
+        """
+        Create an asyncio connector for a component a SICConnector is already connected to, for example a device
+        property such as `pepper.tts`.
+        :param connector: The started SICConnector
+        :param redis: An AsyncSICRedis to share between connectors. If None, the connector creates its own.
+        :return: AsyncSICConnector
+        """
+        async_connector = cls(type(connector), ip=connector._ip, log_level=connector._log_level,
+                              conf=connector._conf, redis=redis)
+        async_connector.input_channel = connector.input_channel
+        return async_connector
+
+    async def start(self):
+        """
+        Request the component to be started if it is not alive, and connect the input channel of this connector to it.
+        """
+        SIC_LOG_SUBSCRIBER.subscribe_to_log_channel_once()
+
+        await self._redis.connect()
+
+        # the startup is the same as for SICConnector, so it is executed in a thread instead of being reimplemented
+        self.component_info = await asyncio.get_event_loop().run_in_executor(None, self._start_component)
+        return self
+
+    def _start_component(self):
+        redis = SICRedis(parent_name=self.component_class.get_component_name())
+        try:
+            starter = SICComponentStarter(redis, self.component_class, self._ip, self._log_level, self._conf)
+            return starter.start(self.input_channel)
+        finally:
+            redis.close()
+
+    def _get_timestamp(self):
+        return clock.get_timestamp()
+
+    async def arequest(self, request, timeout=100.0, block=True):
+        """
+        Request data from the component, and wait for the reply without blocking the event loop.
+        :param request: The request to the component
+        :type request: SICRequest
+        :param timeout: A timeout in case the action takes too long. Only works when block=True.
+        :param block: If false, returns None after sending the request.
+        :return: the SICMessage reply from the component, or none if block=False
+        :rtype: SICMessage | None
+        """
+        assert utils.is_sic_instance(request, SICRequest), "Cannot send requests that do not inherit from " \
+                                                           "SICRequest (type: {req})".format(req=type(request))
+
+        request._timestamp = self._get_timestamp()
+        if request._trace is None:
+            request._trace = tracing.get_current_trace()
+
+        reply = await self._redis.request(self._request_reply_channel, request, timeout=timeout, block=block)
+
+        if reply is not None and reply._trace is not None:
+            # the trace of a request ends when the reply is received (see SICConnector.request)
+            name = self.connector_class.__name__
+            reply._trace = tracing.add_transport_span(reply._trace, name)
+            hop = tracing.get_hop(name, reply._trace)
+            if hop is not None:
+                await self._redis.send_message(tracing.get_trace_channel(), hop)
+
+        return reply
+
+    async def asend_message(self, message):
+        """
+        Send a message to the input of the component.
+        """
+        message._timestamp = self._get_timestamp()
+        if message._trace is None:
+            message._trace = tracing.get_current_trace()
+        await self._redis.send_message(self.input_channel, message)
+
+    async def aconnect(self, component):
+        """
+        Connect the output of a component to the input of this component.
+        :param component: The component connector providing the input to this component
+        :type component: AsyncSICConnector | SICConnector
+        """
+        await self.arequest(ConnectRequest(component.output_channel), timeout=self._PING_TIMEOUT)
+
+    async def messages(self, maxsize=100):
+        """
+        Iterate over the output messages of the component.
+
+        Example:
+            async for message in connector.messages():
+                print(message)
+
+        :param maxsize: The number of messages to buffer for a slow consumer, older messages are dropped.
+        """
+        subscription = await self._redis.subscribe(self.output_channel, maxsize=maxsize)
+        self._subscriptions.append(subscription)
+        try:
+            async for message in subscription:
+                yield message
+        finally:
+            await subscription.close()
+            self._subscriptions.remove(subscription)
+
+    async def astop(self):
+        """
+        Stop the component and close the connection to redis if it is not shared.
+        """
+        await self._redis.send_message(self._request_reply_channel, SICStopRequest())
+
+        for subscription in list(self._subscriptions):
+            await subscription.close()
+
+        if self._owns_redis:
+            await self._redis.close()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *args):
+        await self.astop()
@@ -0,0 +1,167 @@
+"""
+Device clocks synchronized to the clock of the redis server.
+
+The clocks of devices (especially robots) are often off by a second or more, which makes data from different devices
+impossible to align by timestamp. Every process therefore estimates the offset of its clock to the redis server with
+NTP-style measurements of the redis TIME command, and all framework timestamps use the redis server's time:
+
+    offset = server time - (send time + receive time) / 2
+
+Each synchronization takes a few measurements and keeps the one with the shortest round trip, as it has the least
+uncertainty (at most half the round trip). The drift of the local clock is the slope of a least squares fit of the
+offsets over time, so timestamps stay accurate between synchronizations.
+
+Usage:
+    from sic_framework.core import clock_python2 as clock
+    message._timestamp = clock.get_timestamp()
+"""
+import collections
+import threading
+import time
+
+from .sic_redis import SICRedis
+
+
+class SICClock(object):
+    """
+    Estimates the offset of the local clock to the redis server in a background thread.
+    """
+
+    # Seconds between synchronizations
+    SYNC_INTERVAL = 10
+    # Measurements per synchronization, the one with the shortest round trip is used
+    MEASUREMENTS_PER_SYNC = 5
+    # The number of synchronizations used to estimate the drift
+    WINDOW = 30
+    # The maximum drift in seconds per second (500 ppm), to not extrapolate measurement noise
+    MAX_DRIFT = 5e-4
+    # If the offset changes more than this many seconds, the local clock was set, and the old measurements are dropped
+    RESET_THRESHOLD = .5
+
+    def __init__(self, redis, logger=None):
+        """
+        :param redis: the SICRedis connection used to measure the redis server time
+        :param logger: logger for synchronization errors
+        """
+        self.redis = redis
+        self.logger = logger
+
+        self._lock = threading.Lock()
+        # (local time, offset, round trip time) of every synchronization
+        self._measurements = collections.deque(maxlen=self.WINDOW)
+        self.offset = 0.0
+        self.drift = 0.0
+        self.round_trip_time = None
+        self._reference_time = time.time()
+
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Synchronize once, and keep synchronizing in a background thread.
+        """
+        self.sync()
+
+        self._thread = threading.Thread(target=self._run)
+        self._thread.name = "SICClock"
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def time(self, local_time=None):
+        """
+        :param local_time: a time.time() of this device to convert, e.g. the time a sensor captured its data, or None
+                           for the current time
+        :return: the time of the redis server, in seconds since the epoch
+        """
+        if local_time is None:
+            local_time = time.time()
+        with self._lock:
+            return local_time + self.offset + self.drift * (local_time - self._reference_time)
+
+    def _run(self):
+        while not self._stop_event.wait(self.SYNC_INTERVAL):
+            try:
+                self.sync()
+            except Exception as e:
+                # keep using the previous estimate, e.g. while the connection to redis is lost
+                if self.logger and not self._stop_event.is_set():
+                    self.logger.warning("Could not synchronize the clock with redis: {}".format(e))
+
+    def _measure(self):
+        """
+        :return: tuple of the local time, offset and round trip time of the measurement with the shortest round trip
+        """
+        best = None
+        for _ in range(self.MEASUREMENTS_PER_SYNC):
+            sent = time.time()
+            seconds, microseconds = self.redis.time()
+            received = time.time()
+
+            local_time = (sent + received) / 2.0
+            measurement = (local_time, seconds + microseconds / 1e6 - local_time, received - sent)
+            if best is None or measurement[2] < best[2]:
+                best = measurement
+        return best
+
+    def sync(self):
+        """
+        Measure the offset to the redis server, and update the estimate of the offset and drift.
+        """
+        local_time, offset, round_trip_time = self._measure()
+
+        with self._lock:
+            predicted = self.offset + self.drift * (local_time - self._reference_time)
+            if self._measurements and abs(offset - predicted) > self.RESET_THRESHOLD:
+                self._measurements.clear()
+
+            self._measurements.append((local_time, offset, round_trip_time))
+            self.round_trip_time = round_trip_time
+            self._estimate()
+
+    def _estimate(self):
+        # measurements with a long round trip (e.g. during network congestion) are likely asymmetric, so ignore them
+        shortest = min(rtt for _, _, rtt in self._measurements)
+        measurements = [(t, offset) for t, offset, rtt in self._measurements if rtt <= 2 * shortest + .001]
+
+        reference_time = sum(t for t, _ in measurements) / len(measurements)
+        mean_offset = sum(offset for _, offset in measurements) / len(measurements)
+
+        drift = 0.0
+        variance = sum((t - reference_time) ** 2 for t, _ in measurements)
+        if len(measurements) >= 3 and variance > 0:
+            covariance = sum((t - reference_time) * (offset - mean_offset) for t, offset in measurements)
+            drift = max(-self.MAX_DRIFT, min(self.MAX_DRIFT, covariance / variance))
+
+        self._reference_time = reference_time
+        self.offset = mean_offset
+        self.drift = drift
+
+
+_clock = None
+_clock_lock = threading.Lock()
+
+
+def get_clock():
+    """
+    Get the clock of this process, which is started (and synchronized) on first use.
+    :rtype: SICClock
+    """
+    global _clock
+    with _clock_lock:
+        if _clock is None:
+            clock = SICClock(SICRedis(parent_name="SICClock"))
+            clock.start()
+            _clock = clock
+    return _clock
+
+
+def get_timestamp(local_time=None):
+    """
+    :param local_time: a time.time() of this device to convert instead of the current time
+    :return: the time, synchronized with all devices through the redis server
+    """
+    return get_clock().time(local_time)
@@ -1,15 +1,22 @@
 import copy
+import multiprocessing
+import os
 import threading
 import time
 from signal import signal, SIGTERM, SIGINT
 from sys import exit
 
+import six
+
 import sic_framework.core.sic_logging
 from sic_framework.core.utils import is_sic_instance, MAGIC_STARTED_COMPONENT_MANAGER_TEXT
 
+from . import clock_python2 as clock
+from . import registry_python2 as registry
 from . import utils, sic_logging
 from .message_python2 import SICMessage, SICStopRequest, SICRequest, SICIgnoreRequestMessage, SICSuccessMessage
 from .sic_redis import SICRedis
+from .worker_pool_python2 import SICFuture, SICWorkerPool
 
 
 class SICStartComponentRequest(SICRequest):
@@ -30,17 +37,103 @@ class SICNotStartedMessage(SICMessage):
         self.message = message
 
 
+def _create_component(component_class, **kwargs):
+    """
+    Create a component. If its constructor raises, e.g. because a model fails to load, the registry entry and redis
+    connection the SICComponent constructor already created are closed, as there is no component to stop.
+    """
+    component = component_class.__new__(component_class)
+    try:
+        component.__init__(**kwargs)
+    except Exception:
+        # connectors should not wait for a component that failed to start
+        if getattr(component, "_registry", None) is not None:
+            component._registry.close()
+        if getattr(component, "_redis", None) is not None:
+            component._redis.close()
+        raise
+    return component
+
+
+def _run_component_process(component_class, log_level, conf, ready_event, stop_event, errors):
+    """
+    The main function of a component process. Runs the component until its stop event is set.
+    """
+    component = None
+    try:
+        component = _create_component(component_class, stop_event=stop_event, ready_event=ready_event,
+                                      log_level=log_level, conf=conf)
+        component._start()
+
+        # components such as actuators return from start, they are kept alive by their redis threads
+        while not stop_event.is_set():
+            stop_event.wait(.1)
+    except Exception as e:
+        # the exception itself might not be picklable, so only send its description
+        errors.put("{}: {}".format(type(e).__name__, e))
+        if component is not None:
+            component.stop()
+        raise
+    except KeyboardInterrupt:
+        # the manager stops the component
+        pass
+
+
+class SICComponentProcess(object):
+    """
+    The manager's handle to a component running in a child process.
+    """
+
+    # Seconds to wait for a component process to exit before it is terminated
+    STOP_TIMEOUT = 5
+
+    def __init__(self, component_class, process, ready_event, stop_event, errors):
+        self.component_class = component_class
+        self.process = process
+        self._ready_event = ready_event
+        self._stop_event = stop_event
+        self.errors = errors
+
+    def get_component_name(self):
+        return self.component_class.get_component_name()
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+    def get_error(self, timeout=0):
+        """
+        :return: the description of the exception that stopped the component, or None.
+        """
+        try:
+            return self.errors.get(timeout=timeout)
+        except six.moves.queue.Empty:
+            return None
+
+    def stop(self, *args):
+        self._stop_event.set()
+        self.process.join(self.STOP_TIMEOUT)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
 class SICComponentManager(object):
-    # The maximum error between the redis server and this device's clocks in seconds
+    # The clock difference between the redis server and this device in seconds above which the user is warned. The
+    # difference is corrected for, but usually means the clock of the device is not set.
     MAX_REDIS_SERVER_TIME_DIFFERENCE = 2
 
     # Number of seconds we wait at most for a component to start
     COMPONENT_START_TIMEOUT = 10
 
-    def __init__(self, component_classes, auto_serve=True):
+    # The number of components that are started at the same time at most
+    MAX_CONCURRENT_STARTS = 8
+
+    def __init__(self, component_classes, auto_serve=True, prewarm=None):
         """
         A component manager to start components when requested by users.
         :param component_classes: List of SICService components to be started
+        :param prewarm: List of component classes (of component_classes) to start and warm up right away, with their
+                        default configuration. Connectors attach to the running instance instead of waiting for models
+                        to load.
         """
 
         # Redis initialization
@@ -57,17 +150,39 @@ class SICComponentManager(object):
         self.logger = self.get_manager_logger()
         self.redis.parent_logger = self.logger
 
-        # The _handle_request function is calls execute directly, as we must reply when execution done to allow the user
-        # to wait for this. New messages will be buffered by redis. The component manager listens to
+        # components are started by a worker pool, so a slow component does not delay the start of other components
+        self._start_pool = SICWorkerPool(self.MAX_CONCURRENT_STARTS, name="{}_start".format(self.__class__.__name__),
+                                         exception_handler=self.logger.exception)
+        # component name -> (start options, SICFuture of the start), to share the start between simultaneous requests
+        self._starting = dict()
+        self._starting_lock = threading.Lock()
+
+        # The _handle_request function returns a future of the reply, which is sent when the component started, so the
+        # user can wait for this while other start requests are handled.
         self.redis.register_request_handler(self.ip, self._handle_request)
 
-        # TODO FIXME
-        # self._sync_time()
+        self._sync_time()
+
+        # components of a previous run of this manager (e.g. when SIC is restarted on the robot) are not running anymore
+        registry.remove_components(self.redis, self.component_classes, self.ip)
+
+        # advertise the components this manager can start, so connectors do not have to probe for them
+        self._registry = registry.SICRegistry(self.redis)
+        for component_name in self.component_classes:
+            self._registry.register(registry.get_manager_key(component_name, self.ip),
+                                    {"ip": self.ip, "pid": os.getpid(), "manager": self.__class__.__name__})
 
         self.logger.info(MAGIC_STARTED_COMPONENT_MANAGER_TEXT + ' on ip "{}" with components:'.format(self.ip))
         for c in self.component_classes.values():
             self.logger.info(" - {}".format(c.get_component_name()))
 
+        for component_class in prewarm or []:
+            assert component_class.get_component_name() in self.component_classes, \
+                "Cannot prewarm {}, it is not a component of this manager".format(component_class.get_component_name())
+            self.logger.info("Prewarming {}".format(component_class.get_component_name()))
+            self._start_component_async(SICStartComponentRequest(component_class.get_component_name(),
+                                                                 log_level=sic_logging.INFO))
+
         self.ready_event.set()
         if auto_serve:
             self.serve()
@@ -90,18 +205,17 @@ class SICComponentManager(object):
 
     def _sync_time(self):
         """
-        WORK IN PROGRESS: Does not work!
-        clock on devices is often not correct, so we need to correct for this
+        Start synchronizing the clock of this device with the redis server, as the clock on devices is often not
+        correct. All timestamps of the components on this device are corrected for the offset (see clock_python2.py).
         """
-        # Check if the time of this device is off, because that would interfere with sensor fusion across devices
-        time_diff_seconds = abs(time.time() - float("{}.{}".format(*self.redis.time())))
-        if time_diff_seconds > .1:
-            print("Warning: device time difference to redis server is {} seconds".format(time_diff_seconds))
-            print("This is allowed (max: {}), but might cause data to fused incorrectly in components.".format(
-                self.MAX_REDIS_SERVER_TIME_DIFFERENCE))
-        if time_diff_seconds > self.MAX_REDIS_SERVER_TIME_DIFFERENCE:
-            raise ValueError("The time on this device differs by {} seconds from the redis server (max: {}s)".format(
-                time_diff_seconds, self.MAX_REDIS_SERVER_TIME_DIFFERENCE))
+        device_clock = clock.get_clock()
+        device_clock.logger = self.logger
+
+        self.logger.debug("Clock offset to redis server is {:.1f} ms (round trip {:.1f} ms)".format(
+            device_clock.offset * 1000, device_clock.round_trip_time * 1000))
+        if abs(device_clock.offset) > self.MAX_REDIS_SERVER_TIME_DIFFERENCE:
+            self.logger.warning("The time on this device differs by {:.1f} seconds from the redis server, timestamps "
+                                "are corrected but the device clock should be set".format(device_clock.offset))
 
     def _handle_request(self, request):
         """
@@ -120,7 +234,7 @@ class SICComponentManager(object):
         if request.component_name in self.component_classes:
             print("{} handling request {}".format(self.__class__.__name__, request.component_name))
 
-            return self.start_component(request)
+            return self._start_component_async(request)
         else:
             print("{} ignored request {}".format(self.__class__.__name__, request.component_name))
             return SICIgnoreRequestMessage()
@@ -137,6 +251,59 @@ class SICComponentManager(object):
 
         return logger
 
+    def _start_component_async(self, request):
+        """
+        Start a component in the worker pool. If the same component is already being started for another request, the
+        request shares that start instead of starting a second instance. A request with other options (configuration
+        or log level) than the start in progress is not started, as both instances would use the same channels.
+        :return: SICFuture of the reply
+        """
+        options = self._get_start_options(request)
+        reply = SICFuture()
+
+        with self._starting_lock:
+            starting = self._starting.get(request.component_name)
+            if starting is None:
+                start = self._start_pool.submit(self._start_component_once, request)
+                self._starting[request.component_name] = (options, start)
+            elif starting[0] == options:
+                start = starting[1]
+                self.logger.debug("Component {} is already starting, waiting for it".format(request.component_name))
+            else:
+                message = "Component {} is already being started with another configuration or log level".format(
+                    request.component_name)
+                self.logger.warning(message)
+                reply.set_result(SICNotStartedMessage(message))
+                return reply
+
+        # every request gets its own copy of the reply, as the reply is addressed to the request
+
+        def on_started(future):
+            exception = future.exception()
+            if exception is not None:
+                reply.set_result(SICNotStartedMessage(exception))
+            else:
+                reply.set_result(copy.copy(future.result()))
+
+        start.add_done_callback(on_started)
+        return reply
+
+    @staticmethod
+    def _get_start_options(request):
+        """
+        :return: the options of a start request that determine the component instance, to compare requests
+        """
+        # SICMessage equality only compares the message type, so compare the serialized configuration
+        conf = request.conf.serialize() if request.conf is not None else None
+        return conf, request.log_level
+
+    def _start_component_once(self, request):
+        try:
+            return self.start_component(request)
+        finally:
+            with self._starting_lock:
+                self._starting.pop(request.component_name, None)
+
     def start_component(self, request):
         """
         Start a component on this device as requested by a user. A thread is started to run the component in.
@@ -147,15 +314,22 @@ class SICComponentManager(object):
 
         component_class = self.component_classes[request.component_name]  # SICComponent
 
+        if component_class.RUN_IN_SUBPROCESS:
+            if six.PY3:
+                return self.start_component_process(request)
+            self.logger.warning("Running components in a subprocess requires python 3, starting {} in a thread".format(
+                request.component_name))
+
         component = None
         try:
             stop_event = threading.Event()
             ready_event = threading.Event()
-            component = component_class(stop_event=stop_event,
-                                        ready_event=ready_event,
-                                        log_level=request.log_level,
-                                        conf=request.conf,
-                                        )
+            component = _create_component(component_class,
+                                          stop_event=stop_event,
+                                          ready_event=ready_event,
+                                          log_level=request.log_level,
+                                          conf=request.conf,
+                                          )
             self.active_components.append(component)
 
             # TODO daemon=False could be set to true, but then the component cannot clean up properly
@@ -184,10 +358,77 @@ class SICComponentManager(object):
                 component.stop()
             return SICNotStartedMessage(e)
 
+    def start_component_process(self, request):
+        """
+        Start a component in a child process, and supervise it. Processes are spawned (not forked), so the component
+        does not inherit the redis connections and threads of the manager.
+        :param request: The SICStartServiceRequest request
+        :return: SICSuccessMessage, or SICNotStartedMessage if the component failed to start.
+        """
+        component_class = self.component_classes[request.component_name]  # SICComponent
+        context = multiprocessing.get_context("spawn")
+
+        ready_event = context.Event()
+        stop_event = context.Event()
+        errors = context.Queue()
+
+        process = context.Process(target=_run_component_process,
+                                  args=(component_class, request.log_level, request.conf, ready_event, stop_event,
+                                        errors),
+                                  name=component_class.get_component_name())
+        component = SICComponentProcess(component_class, process, ready_event, stop_event, errors)
+
+        try:
+            process.start()
+        except Exception as e:
+            self.logger.exception(e)
+            return SICNotStartedMessage(e)
+
+        # wait till the component is ready to receive input, or failed to start
+        deadline = time.time() + component_class.COMPONENT_STARTUP_TIMEOUT
+        while not ready_event.is_set() and process.is_alive() and time.time() < deadline:
+            ready_event.wait(.05)
+
+        if not ready_event.is_set():
+            error = component.get_error(timeout=.5 if not process.is_alive() else 0)
+            if error is not None or not process.is_alive():
+                component.stop()
+                message = error or "Component process exited with code {}".format(process.exitcode)
+                self.logger.error("Component {} failed to start: {}".format(component.get_component_name(), message))
+                return SICNotStartedMessage(message)
+
+            self.logger.error("Component {} refused to start within {} seconds!".format(
+                component.get_component_name(), component_class.COMPONENT_STARTUP_TIMEOUT))
+
+        self.active_components.append(component)
+
+        supervisor = threading.Thread(target=self._supervise_component_process, args=(component,))
+        supervisor.name = "{}_supervisor".format(component.get_component_name())
+        supervisor.daemon = True
+        supervisor.start()
+
+        return SICSuccessMessage()
+
+    def _supervise_component_process(self, component):
+        """
+        Wait for a component process to exit, and report it if it was not stopped.
+        """
+        component.process.join()
+
+        if component in self.active_components:
+            self.active_components.remove(component)
+
+        if not component._stop_event.is_set() and not self.stop_event.is_set():
+            error = component.get_error()
+            self.logger.error("Component {} exited unexpectedly with code {}{}".format(
+                component.get_component_name(), component.process.exitcode, ": " + error if error else ""))
+
     def stop(self, *args):
         self.stop_event.set()
         print('Trying to exit manager gracefully...')
         try:
+            self._start_pool.stop()
+            self._registry.close()
             self.redis.close()
             for component in self.active_components:
                 component.stop()
@@ -1,5 +1,5 @@
+import os
 import threading
-import time
 from abc import ABCMeta, abstractmethod
 
 import six
@@ -9,7 +9,14 @@ from sic_framework.core.utils import is_sic_instance
 from . import sic_logging, utils
 from .message_python2 import SICConfMessage, SICRequest, SICMessage, SICSuccessMessage, \
     SICControlRequest, SICPingRequest, SICPongMessage, SICStopRequest
+from . import clock_python2 as clock
+from . import registry_python2 as registry
+from . import tracing_python2 as tracing
+from .metrics_python2 import SICMetrics, SICMetricsMessage, get_metrics_channel
+from .profiler_python2 import SICSamplingProfiler, StartProfilingRequest, StopProfilingRequest, \
+    get_component_thread_name_prefix
 from .sic_redis import SICRedis
+from .worker_pool_python2 import SICLatestValue
 
 
 class ConnectRequest(SICControlRequest):
@@ -33,6 +40,27 @@ class SICComponent:
     # For example, when the robot has to stand up or model parameters need to load to GPU this might be set higher
     COMPONENT_STARTUP_TIMEOUT = 2
 
+    # Send the output through shared memory to components on the same host (python 3 only). Useful for components
+    # with large outputs, such as images, as it avoids sending them through redis and compressing them.
+    SHARED_MEMORY_TRANSPORT = False
+
+    # Let the component manager run this component in its own process instead of a thread (python 3 only), so
+    # CPU heavy components do not compete for the GIL of the manager and other components.
+    RUN_IN_SUBPROCESS = False
+
+    # Only keep the newest message of an input, and handle it on a dedicated thread. Messages that arrive while
+    # on_message is busy replace each other, so a component that is slower than its input always handles the most
+    # recent data instead of a growing backlog. True for all inputs, or a list of message classes to conflate.
+    CONFLATE_INPUTS = False
+
+    # How often (in seconds) the metrics of this component are published on the metrics channel, None to disable.
+    METRICS_INTERVAL = 1
+
+    # Start a latency trace for every message this component outputs that does not continue a trace already, e.g. on
+    # the sensor at the start of a chain. Traced messages are traced by every component they pass through, see
+    # tracing_python2.py.
+    TRACE = False
+
     def __init__(self, ready_event=None, stop_event=None, log_level=sic_logging.INFO, conf=None):
         self._ip = utils.get_ip_adress()
 
@@ -41,6 +69,9 @@ class SICComponent:
         self._stop_event = stop_event if stop_event else threading.Event()
 
         self._input_channels = []
+        # (message name, source component name) -> SICLatestValue
+        self._conflated_inputs = dict()
+        self._conflated_inputs_lock = threading.Lock()
         self._output_channel = self.get_output_channel(self._ip)
 
         self.params = None
@@ -52,6 +83,20 @@ class SICComponent:
         self.logger = self._get_logger(log_level)
         self._redis.parent_logger = self.logger
 
+        # runtime metrics, redis records the serialization time and published bytes
+        self.metrics = SICMetrics()
+        self._redis.metrics = self.metrics
+
+        # the sampling profiler, while it is started by a StartProfilingRequest
+        self._profiler = None
+
+        # advertises this component and its state to connectors, see registry_python2.py. If the constructor of a
+        # subclass raises, the component manager closes the registry (see _create_component). The worker processes of
+        # a SICService are not advertised, the service itself is.
+        self._registry = registry.SICRegistry(self._redis)
+        if not getattr(self, "_is_worker_process", False):
+            self._set_registry_state(registry.STARTING)
+
         # load config if set by user
         self.set_config(conf)
 
@@ -71,24 +116,73 @@ class SICComponent:
         Wrapper for actual user implemented start to enable logging to the user.
         """
         try:
+            self._set_registry_state(registry.WARMING_UP)
+            try:
+                self.warmup()
+            except Exception as e:
+                self.logger.warning("Warming up {} failed: {}".format(self.get_component_name(), e))
+
             self.start()
         except Exception as e:
             self.logger.exception(e)
+            # connectors should not wait for a component that failed to start
+            self._registry.close()
             raise e
 
+    def warmup(self):
+        """
+        Prepare the component for its first message, e.g. run a dummy inference so the first message is not delayed by
+        lazy initialization of the model. Called before start(), connectors wait for the component until it is ready.
+        """
+        pass
+
     def start(self):
         """
         Start the service. Should be called by overriding functions to communicate the service
         has started successfully.
         """
+        # components connect to the output after the ready event is set, so shared memory is enabled before it
+        if self.SHARED_MEMORY_TRANSPORT:
+            self._redis.enable_shared_memory(self._output_channel)
+
         # register a request handler to handle control requests, e.g. ConnectRequest
         self._redis.register_request_handler(self.get_request_reply_channel(self._ip), self._handle_request)
 
+        if self.METRICS_INTERVAL:
+            thread = threading.Thread(target=self._publish_metrics_periodically)
+            thread.name = "{}_metrics".format(self.get_component_name())
+            thread.daemon = True
+            thread.start()
+
+        # advertise the component is ready before the manager replies it started, see registry_python2.py
+        self._set_registry_state(registry.READY)
+
         # communicate the service is set up and listening to its inputs
         self._ready_event.set()
 
         self.logger.info("Started component {}".format(self.get_component_name()))
 
+    def _set_registry_state(self, state):
+        self._registry.register(registry.get_component_key(self.get_component_name(), self._ip),
+                                self._get_registry_info(state))
+
+    def _get_registry_info(self, state):
+        """
+        The registry entry of this component, with its channels, capabilities and state, see registry_python2.py.
+        """
+        output = self.get_output()
+        return {
+            "name": self.get_component_name(),
+            "ip": self._ip,
+            "pid": os.getpid(),
+            "output_channel": self._output_channel,
+            "request_reply_channel": self.get_request_reply_channel(self._ip),
+            "inputs": [message_class.get_message_name() for message_class in self.get_inputs()],
+            "output": output.get_message_name() if output is not None else None,
+            "started": self._get_timestamp(),
+            "state": state,
+        }
+
     def _connect(self, connection_request):
         """
         Connect the output of a component to the input of this component, by registering the output channel
@@ -105,7 +199,77 @@ class SICComponent:
         self._redis.register_message_handler(channel, self._handle_message)
 
     def _handle_message(self, message):
-        return self.on_message(message)
+        self.metrics.increment("messages_in")
+
+        if message._trace is not None:
+            message._trace = tracing.add_transport_span(message._trace, self.get_component_name())
+
+        if self._is_conflated_input(message):
+            return self._conflate_message(message)
+
+        return self._on_message(message)
+
+    def _on_message(self, message):
+        """
+        Call on_message, and keep track of its duration.
+        """
+        with self.metrics.time("on_message"), self._trace_span("on_message", message._trace):
+            return self.on_message(message)
+
+    def _trace_span(self, stage, trace):
+        """
+        Create the span of this component handling a message, see tracing_python2.SICSpan.
+        """
+        return tracing.SICSpan(self._redis, self.get_component_name(), stage, trace)
+
+    def _is_conflated_input(self, message):
+        if self.CONFLATE_INPUTS is True:
+            return True
+        if not self.CONFLATE_INPUTS:
+            return False
+        return message.get_message_name() in [m.get_message_name() for m in self.CONFLATE_INPUTS]
+
+    def _conflate_message(self, message):
+        """
+        Replace the newest message of the input of message, and start the thread handling the input if it is new.
+        """
+        key = (message.get_message_name(), message._previous_component_name)
+
+        with self._conflated_inputs_lock:
+            slot = self._conflated_inputs.get(key)
+            if slot is None:
+                slot = self._conflated_inputs[key] = SICLatestValue()
+
+                thread = threading.Thread(target=self._handle_conflated_messages, args=(slot,))
+                thread.name = "{}_conflated_{}".format(self.get_component_name(), key[0])
+                thread.daemon = True
+                thread.start()
+
+        if slot.put(message):
+            self.metrics.increment("dropped")
+            if slot.dropped in {5, 10, 50, 100, 200, 1000, 5000, 10000}:
+                self.logger.debug_framework("Conflated {} messages of type {}".format(slot.dropped, key[0]))
+
+    def _handle_conflated_messages(self, slot):
+        while not self._stop_event.is_set():
+            try:
+                message = slot.get(timeout=.1)
+            except six.moves.queue.Empty:
+                continue
+
+            try:
+                self._on_message(message)
+            except Exception as e:
+                self.logger.exception(e)
+
+    def get_conflation_stats(self):
+        """
+        The counters of the conflated inputs, see CONFLATE_INPUTS.
+        :return: dict of (message name, source component name) to a dict with the number of dropped and handled
+                 messages, and the mean and max seconds the handled messages waited (their staleness).
+        """
+        with self._conflated_inputs_lock:
+            return dict((key, slot.stats()) for key, slot in self._conflated_inputs.items())
 
     def _handle_request(self, request):
         """
@@ -128,11 +292,55 @@ class SICComponent:
             self._connect(request)
             return SICSuccessMessage()
 
+        if is_sic_instance(request, StartProfilingRequest):
+            self._start_profiling(request)
+            return SICSuccessMessage()
+
+        if is_sic_instance(request, StopProfilingRequest):
+            return self._stop_profiling()
+
         if not is_sic_instance(request, SICControlRequest):
-            return self.on_request(request)
+            self.metrics.increment("requests")
+
+            if request._trace is not None:
+                request._trace = tracing.add_transport_span(request._trace, self.get_component_name())
+
+            with self.metrics.time("on_request"), self._trace_span("on_request", request._trace) as span:
+                reply = self.on_request(request)
+
+                # the reply continues the trace of the request
+                if reply is not None and reply._trace is None:
+                    reply._trace = span.get_trace()
+            return reply
 
         raise TypeError("Unknown request type {}".format(type(request)))
 
+    def _start_profiling(self, request):
+        """
+        Start sampling the threads of this component, see profiler_python2.py.
+        :type request: StartProfilingRequest
+        """
+        if self._profiler is not None:
+            self._profiler.stop()
+
+        prefix = None if request.all_threads else get_component_thread_name_prefix(self.get_component_name())
+        self._profiler = SICSamplingProfiler(thread_name_prefix=prefix, interval=request.interval)
+        self._profiler.start()
+        self.logger.info("Started profiling (every {} s)".format(request.interval))
+
+    def _stop_profiling(self):
+        """
+        :return: the ProfileMessage since profiling was started, which is empty if it was not started
+        """
+        profiler, self._profiler = self._profiler, None
+        if profiler is None:
+            self.logger.warning("Profiling was not started")
+            profiler = SICSamplingProfiler()
+
+        profile = profiler.stop()
+        self.logger.info("Stopped profiling, collected {} samples".format(profile.samples))
+        return profile
+
     @classmethod
     def get_component_name(cls):
         """
@@ -195,7 +403,45 @@ class SICComponent:
         :param message:
         """
         message._previous_component_name = self.get_component_name()
+
+        if message._trace is None:
+            message._trace = tracing.get_current_trace()
+        if message._trace is None and self.TRACE:
+            message._trace = tracing.add_span(tracing.new_trace(), self.get_component_name(), "output",
+                                            clock.get_timestamp(), 0.0)
+
         self._redis.send_message(self._output_channel, message)
+        self.metrics.increment("messages_out")
+
+    def _get_queue_depth(self):
+        """
+        The number of input messages waiting to be handled. Overridden by subclasses that buffer their input.
+        """
+        with self._conflated_inputs_lock:
+            return sum(1 for slot in self._conflated_inputs.values() if not slot.empty())
+
+    def _update_metrics(self):
+        """
+        Update the gauges of this component before its metrics are published.
+        """
+        self.metrics.set_gauge("queue_depth", self._get_queue_depth())
+
+    def _publish_metrics(self):
+        self._update_metrics()
+        interval, counters, gauges, histograms = self.metrics.collect()
+
+        message = SICMetricsMessage(self.get_component_name(), self._ip, os.getpid(), interval, counters, gauges,
+                                    histograms)
+        self._redis.send_message(get_metrics_channel(), message)
+
+    def _publish_metrics_periodically(self):
+        while not self._stop_event.wait(self.METRICS_INTERVAL):
+            try:
+                self._publish_metrics()
+            except Exception as e:
+                # redis is closed when the component stops
+                if not self._stop_event.is_set():
+                    self.logger.exception(e)
 
     @staticmethod
     @abstractmethod
@@ -241,13 +487,20 @@ class SICComponent:
 
         self.params = conf
 
-    def _get_timestamp(self):
-        # TODO this needs to be synchronized with all devices, because if a nao is off by a second or two
-        # its data will align wrong with other sources
-        return time.time()
+    def _get_timestamp(self, local_time=None):
+        """
+        Get the current time, or convert a time.time() of this device, to the time synchronized with all devices.
+        Because if a nao is off by a second or two its data will align wrong with other sources.
+        :param local_time: a time.time() of this device, e.g. the capture time of sensor data, or None for now
+        """
+        return clock.get_timestamp(local_time)
 
     def stop(self, *args):
         self.logger.debug('Trying to exit {} gracefully...'.format(self.get_component_name()))
+        if self._profiler is not None:
+            self._profiler.stop()
+        # connectors should start a new instance from now on
+        self._registry.close()
         try:
             self._redis.close()
             self._stop_event.set()
@@ -7,84 +7,133 @@ import six
 from sic_framework.core.component_python2 import ConnectRequest
 from sic_framework.core.sensor_python2 import SICSensor
 from sic_framework.core.utils import is_sic_instance
+from . import clock_python2 as clock
+from . import registry_python2 as registry
+from . import tracing_python2 as tracing
 from . import utils
 from .component_manager_python2 import SICStartComponentRequest, SICNotStartedMessage
 from .message_python2 import SICMessage, SICRequest, SICStopRequest, SICPingRequest
 from .sic_logging import SIC_LOG_SUBSCRIBER
 from .sic_redis import SICRedis
+from .worker_pool_python2 import TimeoutError
 
 
 class ComponentNotStartedError(Exception):
     pass
 
 
-class SICConnector(object):
-    __metaclass__ = ABCMeta
+class SICComponentStarter(object):
+    """
+    Makes sure a component is running, by requesting it to be started from the component manager on its device if it is
+    not, and connects an input channel to it. Used by SICConnector, and by AsyncSICConnector (in an executor).
+    """
 
     # define how long an "instant" reply should take at most (ping sometimes takes more than 150ms)
-    _PING_TIMEOUT = 1
+    PING_TIMEOUT = 1
+    # seconds between lookups of the state of a component that is starting
+    REGISTRY_POLL_INTERVAL = .1
 
-    def __init__(self, ip="localhost", log_level=logging.INFO, conf=None):
+    def __init__(self, redis, component_class, ip, log_level=logging.INFO, conf=None):
         """
-        A proxy that enables communication with a component that has been started. We can send messages to, and receive
-        from the component that is running on potentially another computer.
-        
-        :param ip: the ip adress of the device the service is running on
+        :param redis: The SICRedis to send the requests with
+        :param component_class: The SICComponent class to start
+        :param ip: the ip adress of the device the component is running on
         :param log_level: Controls the verbosity of the connected component logging.
         :param conf: Optional SICConfMessage to set component parameters.
         """
-        self._redis = SICRedis()
+        self._redis = redis
+        self.component_class = component_class
+        self._ip = ip
+        self._log_level = log_level
+        self._conf = conf
+        self._request_reply_channel = component_class.get_request_reply_channel(ip)
 
-        assert isinstance(ip, str), "IP must be string"
+    def start(self, input_channel):
+        """
+        Start the component if it is not alive, and subscribe it to the input channel.
+        :return: the registry entry of the component (see registry_python2.py), or None for managers that do not use
+                 the registry
+        """
+        started = False
 
-        # default ip adress is local ip adress (the actual inet, not localhost or 127.0.0.1)
+        # if the component is not alive, request it to be started from the ComponentManager
+        alive, component_info = self._is_alive()
+        if not alive:
+            self._start_component()
+            component_info = self._wait_until_ready(self._lookup_component())
+            started = True
 
-        if ip in ["localhost", "127.0.0.1"]:
-            ip = utils.get_ip_adress()
+        try:
+            self._request(ConnectRequest(input_channel), timeout=self.PING_TIMEOUT)
+        except TimeoutError:
+            if started:
+                raise
+            # the registry entry may be of a component that stopped less than registry.SICRegistry.TTL seconds ago
+            self._start_component()
+            component_info = self._wait_until_ready(self._lookup_component())
+            self._request(ConnectRequest(input_channel), timeout=self.PING_TIMEOUT)
 
-        self._ip = ip
+        return component_info
 
-        self._callback_threads = []
+    def _request(self, request, timeout):
+        request._timestamp = clock.get_timestamp()
+        return self._redis.request(self._request_reply_channel, request, timeout=timeout)
 
-        self._request_reply_channel = self.component_class.get_request_reply_channel(ip)
-        self._log_level = log_level
-        self._conf = conf
+    def _is_alive(self):
+        """
+        Look up the component in the registry, so a component that is not running is started without waiting for a
+        ping to time out. Managers that do not use the registry (older versions) are still pinged.
+        :return: tuple of whether the component is alive, and its registry entry
+        """
+        component_entry, manager_entry = registry.lookup(self._redis, self.component_class.get_component_name(),
+                                                         self._ip)
+        if component_entry is not None:
+            # e.g. a component that is prewarmed by its manager
+            component_info = self._wait_until_ready(component_entry)
+            return component_info is not None, component_info
+        if manager_entry is not None:
+            return False, None
+        return self._ping(), None
+
+    def _lookup_component(self):
+        return registry.lookup_component(self._redis, self.component_class.get_component_name(), self._ip)
+
+    def _wait_until_ready(self, component_entry):
+        """
+        Wait while the component is starting, e.g. loading a model or warming up. The startup timeout of the component
+        applies to every state, so a component that takes long but makes progress does not time out.
+        :param component_entry: the registry entry of the component, or None
+        :return: the registry entry of the ready component, or None if it stopped or failed to start
+        """
+        name = self.component_class.get_component_name()
+        state = None
+        deadline = None
 
-        # Subscribe to the log channel to display to the user
-        SIC_LOG_SUBSCRIBER.subscribe_to_log_channel_once()
+        while component_entry is not None and component_entry["state"] != registry.READY:
+            if component_entry["state"] != state:
+                state = component_entry["state"]
+                deadline = time.time() + self.component_class.COMPONENT_STARTUP_TIMEOUT
+                print("Waiting for {} to start ({})".format(name, state))
+            elif time.time() > deadline:
+                raise TimeoutError("{} did not start within {} seconds (state: {})".format(
+                    name, self.component_class.COMPONENT_STARTUP_TIMEOUT, state))
 
-        self.output_channel = self.component_class.get_output_channel(self._ip)
+            time.sleep(self.REGISTRY_POLL_INTERVAL)
+            component_entry = self._lookup_component()
 
-        # if we cannot ping the component, request it to be started from the ComponentManager
-        if not self._ping():
-            self._start_component()
-
-        # subscribe the component to a channel that the user is able to send a message on if needed
-        self.input_channel = "{}:input:{}".format(self.component_class.get_component_name(), self._ip)
-        self.request(ConnectRequest(self.input_channel), timeout=self._PING_TIMEOUT)
+        return component_entry
 
     def _ping(self):
         try:
-            self.request(SICPingRequest(), timeout=self._PING_TIMEOUT)
+            self._request(SICPingRequest(), timeout=self.PING_TIMEOUT)
             return True
 
         except TimeoutError:
             return False
 
-    @property
-    def component_class(self):
-        """
-        This abstract property should be set by the subclass creating a connector for the specific component.
-        e.g.
-        component_class = NaoCamera
-        :return: The component class this connector is for
-        :rtype: type[SICComponent]
-        """
-        raise NotImplementedError("Abstract member component_class not set.")
-
     def _start_component(self):
         """
-        Request the component to be started. This connector provides the input and output channels, as it determines which
+        Request the component to be started. The connector provides the input and output channels, as it determines which
         components is connected to which other components.
         log_level allows the user to control the verbosity of the connected component.
 
@@ -115,9 +164,67 @@ class SICConnector(object):
                     "\n\nComponent did not start, error should be logged above. ({})".format(component_info.message))
 
         except TimeoutError as e:
-            six.raise_from(
-                TimeoutError("Could not connect to {}. Is SIC running on the device (ip:{})?".format(self.component_class.get_component_name(), self._ip)),
-                None)
+            # the component may still be starting, which it reports in the registry
+            if self._wait_until_ready(self._lookup_component()) is None:
+                six.raise_from(
+                    TimeoutError("Could not connect to {}. Is SIC running on the device (ip:{})?".format(self.component_class.get_component_name(), self._ip)),
+                    None)
+
+
+class SICConnector(object):
+    __metaclass__ = ABCMeta
+
+    # define how long an "instant" reply should take at most (ping sometimes takes more than 150ms)
+    _PING_TIMEOUT = SICComponentStarter.PING_TIMEOUT
+
+    def __init__(self, ip="localhost", log_level=logging.INFO, conf=None):
+        """
+        A proxy that enables communication with a component that has been started. We can send messages to, and receive
+        from the component that is running on potentially another computer.
+        
+        :param ip: the ip adress of the device the service is running on
+        :param log_level: Controls the verbosity of the connected component logging.
+        :param conf: Optional SICConfMessage to set component parameters.
+        """
+        self._redis = SICRedis()
+
+        assert isinstance(ip, str), "IP must be string"
+
+        # default ip adress is local ip adress (the actual inet, not localhost or 127.0.0.1)
+
+        if ip in ["localhost", "127.0.0.1"]:
+            ip = utils.get_ip_adress()
+
+        self._ip = ip
+
+        self._callback_threads = []
+
+        self._request_reply_channel = self.component_class.get_request_reply_channel(ip)
+        self._log_level = log_level
+        self._conf = conf
+
+        # Subscribe to the log channel to display to the user
+        SIC_LOG_SUBSCRIBER.subscribe_to_log_channel_once()
+
+        self.output_channel = self.component_class.get_output_channel(self._ip)
+
+        # subscribe the component to a channel that the user is able to send a message on if needed
+        self.input_channel = "{}:input:{}".format(self.component_class.get_component_name(), self._ip)
+
+        # the registry entry of the component, with its channels and capabilities (see registry_python2.py)
+        self.component_info = SICComponentStarter(self._redis, self.component_class, self._ip, log_level,
+                                                  conf).start(self.input_channel)
+
+    @property
+    def component_class(self):
+        """
+        This abstract property should be set by the subclass creating a connector for the specific component.
+        e.g.
+        component_class = NaoCamera
+        :return: The component class this connector is for
+        :rtype: type[SICComponent]
+        """
+        raise NotImplementedError("Abstract member component_class not set.")
 
     def register_callback(self, callback):
         """
@@ -125,20 +232,37 @@ class SICConnector(object):
         :param callback: the function to execute.
         """
 
-        ct = self._redis.register_message_handler(self.output_channel, callback)
+        ct = self._redis.register_message_handler(self.output_channel, self._traced_callback(callback))
 
         self._callback_threads.append(ct)
 
+    def _traced_callback(self, callback):
+        """
+        Wrap a callback so traced messages continue their trace in the callback, e.g. to requests sent from it.
+        """
+        name = self.__class__.__name__
+
+        def traced_callback(message):
+            if message._trace is None:
+                return callback(message)
+
+            message._trace = tracing.add_transport_span(message._trace, name)
+            with tracing.SICSpan(self._redis, name, "callback", message._trace):
+                return callback(message)
+
+        return traced_callback
+
     def send_message(self, message):
         # Update the timestamp, as it should be set by the device of origin
         message._timestamp = self._get_timestamp()
+        if message._trace is None:
+            message._trace = tracing.get_current_trace()
         self._redis.send_message(self.input_channel, message)
 
     def _get_timestamp(self):
-        # TODO this needs to be synchronized with all devices, because if a nao is off by a second or two
+        # synchronized with all devices through the redis server, because if a nao is off by a second or two
         # its data will align wrong with other sources
-        # possible solution: do redis.time, and use a custom get time functions that is aware of the offset
-        return time.time()
+        return clock.get_timestamp()
 
     def connect(self, component):
         """
@@ -175,8 +299,33 @@ class SICConnector(object):
 
         # Update the timestamp, as it is not yet set (normally be set by the device of origin, e.g a camera)
         request._timestamp = self._get_timestamp()
+        if request._trace is None:
+            request._trace = tracing.get_current_trace()
+
+        reply = self._redis.request(self._request_reply_channel, request, timeout=timeout, block=block)
 
-        return self._redis.request(self._request_reply_channel, request, timeout=timeout, block=block)
+        if reply is not None and reply._trace is not None:
+            # the trace of a request ends when the reply is received
+            name = self.__class__.__name__
+            reply._trace = tracing.add_transport_span(reply._trace, name)
+            tracing.publish_hop(self._redis, name, reply._trace)
+
+        return reply
+
+    def request_many(self, requests, timeout=100.0):
+        """
+        Send multiple requests to the device at once, and wait for all replies. This takes one round trip instead
+        of one per request. The device handles the requests in order.
+        :param requests: The requests to the device
+        :type requests: list[SICRequest]
+        :param timeout: A timeout in case the actions take too long.
+        :return: the SICMessage replies from the device, in the same order as the requests
+        :rtype: list[SICMessage]
+        """
+        batch = SICRequestBatch(timeout=timeout)
+        for request in requests:
+            batch.request(self, request)
+        return batch.send()
 
     def stop(self):
         """
@@ -207,3 +356,72 @@ class SICConnector(object):
         except Exception:
             print("Error in clean shutdown")
             pass
+
+
+class SICRequestBatch(object):
+    """
+    Collect requests to one or more components, and send them in one redis pipeline. Requests to the same component
+    are handled in order, requests to different components may be handled concurrently.
+
+    Example:
+        with SICRequestBatch() as batch:
+            batch.request(nao.autonomous, NaoBasicAwarenessRequest(False))
+            batch.request(nao.autonomous, NaoBackgroundMovingRequest(False))
+            batch.request(nao.stiffness, Stiffness(0.0, joints=["Head"]))
+        print(batch.replies)
+    """
+
+    def __init__(self, timeout=100.0):
+        """
+        :param timeout: A timeout in case the actions take too long.
+        """
+        self.timeout = timeout
+        self.replies = None
+        self._requests = []
+        self._redis = None
+
+    def request(self, connector, request):
+        """
+        Add a request to the batch.
+        :param connector: The connector of the component to send the request to.
+        :type connector: SICConnector
+        :param request: The request to the component
+        :type request: SICRequest
+        :return: the index of the reply in the replies of this batch
+        """
+        assert utils.is_sic_instance(request, SICRequest), "Cannot send requests that do not inherit from " \
+                                                           "SICRequest (type: {req})".format(req=type(request))
+
+        # Update the timestamp, as it is not yet set (normally be set by the device of origin, e.g a camera)
+        request._timestamp = connector._get_timestamp()
+        if request._trace is None:
+            request._trace = tracing.get_current_trace()
+
+        if self._redis is None:
+            # any redis connection can publish to all components, the replies are sent to its reply channel
+            self._redis = connector._redis
+
+        self._requests.append((connector._request_reply_channel, request))
+        return len(self._requests) - 1
+
+    def send(self):
+        """
+        Send all requests and wait for the replies.
+        :return: the SICMessage replies, in the order the requests were added.
+        :rtype: list[SICMessage]
+        """
+        if not self._requests:
+            self.replies = []
+            return self.replies
+
+        self.replies = self._redis.request_many(self._requests, timeout=self.timeout)
+        self._requests = []
+        return self.replies
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # only send the requests if the batch was created without errors
+        if exc_type is None:
+            self.send()
@@ -1,8 +1,10 @@
 # import dataclasses
 import io
-import random
+import itertools
 import os
+import struct
 import time
+import zlib
 
 
 import numpy as np
@@ -46,12 +48,49 @@ except (RuntimeError, ImportError):
 
     turbojpeg = FakeTurboJpeg()
 
+# Binary framing used by messages with _binary_serialization = True. Layout:
+#   header      : magic, version, number of fields, length of the pickled skeleton
+#   descriptors : per field its kind, name, dtype, shape and the number of bytes in its buffer
+#   skeleton    : the message pickled without the fields described above
+#   buffers     : the raw field buffers, each aligned to _BINARY_ALIGNMENT bytes
+# The pickle protocol 2 header starts with \x80\x02, so both formats can be told apart by the magic.
+_BINARY_MAGIC = b"SICB"
+_BINARY_VERSION = 1
+_BINARY_ALIGNMENT = 8
+_BINARY_HEADER = struct.Struct("<4sBHI")
+_BINARY_FIELD = struct.Struct("<BB")
+_BINARY_SIZE = struct.Struct("<Q")
+
+_FIELD_NUMPY = 0
+_FIELD_JPEG = 1
+_FIELD_SIC_MESSAGE = 2
+
+# The dtype kinds (bool, integers, floats and complex numbers) of the arrays stored as raw buffers, other arrays are
+# pickled with the skeleton as their dtype string does not describe them completely
+_BINARY_DTYPE_KINDS = "biufc"
+
+# Attribute used to cache the encoded (JPEG or np.save) fields, which is never sent
+_ENCODED_FIELDS_CACHE = "_sic_encoded_fields"
+# Attribute with the received fields that are not decoded yet
+_LAZY_FIELDS = "_sic_lazy_fields"
+# Attribute with the SICMetrics that records the time to decode the lazy fields, see _set_decode_metrics
+_DECODE_METRICS = "_sic_decode_metrics"
+_CACHE_ATTRIBUTES = (_ENCODED_FIELDS_CACHE, _LAZY_FIELDS, _DECODE_METRICS)
+
 
 class SICMessage(object):
     """
     The abstract message structure to pass messages around the SIC framework. Supports python types, numpy arrays
     and JPEG compression using libturbo-jpeg.
     _compress_images=True allow arrays of WxHx3 to be jpeg compressed for higher transfer speed.
+
+    Serializing does not modify the message. The JPEG and np.save encodings of numpy arrays are cached together with a
+    checksum of the array, so a message that is sent multiple times is only encoded once, while an array that is
+    modified in place (e.g. drawn on) is encoded again.
+
+    Received JPEG, np.save and nested message fields are only decoded when they are first accessed, so messages that
+    are dropped or of which only the metadata is used are cheap to receive. Fields that are never accessed are
+    forwarded as the bytes they were received as.
     """
 
     # timestamp of the creation date of the data at its origin, e.g. camera, but not face detection (as it uses the
@@ -63,8 +102,49 @@ class SICMessage(object):
     __JPEG_VALUES = []
     __SIC_MESSAGES = []
     _compress_images = False
+    # Use the binary framing instead of pickling numpy arrays with np.save. Arrays are then received as views on the
+    # received bytes (np.frombuffer) instead of being copied by np.load.
+    _binary_serialization = False
     # this request id must be set when the message is sent as a reply to a SICRequest
     _request_id = None
+    # the latency trace this message is part of, as (trace id, spans), see tracing_python2.py
+    _trace = None
+
+    def __setattr__(self, name, value):
+        # a changed field has to be encoded again. Assigning the same object again (e.g. _previous_component_name) keeps
+        # its cached encoding.
+        if name not in _CACHE_ATTRIBUTES and self.__dict__.get(name, _CACHE_ATTRIBUTES) is not value:
+            encoded_fields = self.__dict__.get(_ENCODED_FIELDS_CACHE)
+            if encoded_fields:
+                encoded_fields.pop(name, None)
+            lazy_fields = self.__dict__.get(_LAZY_FIELDS)
+            if lazy_fields:
+                lazy_fields.pop(name, None)
+        object.__setattr__(self, name, value)
+
+    def __getattr__(self, name):
+        # only called if the attribute is not found, which is the case for fields that are not decoded yet
+        lazy_fields = self.__dict__.get(_LAZY_FIELDS) if not name.startswith("__") else None
+        if not lazy_fields or name not in lazy_fields:
+            raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
+
+        return self._decode_lazy_field(name)
+
+    def __getstate__(self):
+        # the caches are never pickled, also not when a message is pickled directly
+        self._decode_lazy_fields()
+        return self._get_fields()
+
+    def __copy__(self):
+        # the caches belong to a single message, so only copy the fields (including those not decoded yet)
+        other = object.__new__(self.__class__)
+        lazy_fields = self._get_lazy_fields()
+        other.__dict__.update(self._get_fields())
+        if lazy_fields:
+            other.__dict__[_LAZY_FIELDS] = lazy_fields
+            if _DECODE_METRICS in self.__dict__:
+                other.__dict__[_DECODE_METRICS] = self.__dict__[_DECODE_METRICS]
+        return other
 
     def __eq__(self, other):
         """
@@ -135,27 +215,319 @@ class SICMessage(object):
         with support for numpy arrays.
         :return: 'bytes' in python3, 'str' in python2 (which are roughly the same)
         """
-        self.__NP_VALUES = []
-        self.__JPEG_VALUES = []
-        self.__SIC_MESSAGES = []
+        if self._binary_serialization:
+            return self._serialize_binary()
+        return self._serialize_pickle()
 
-        # Compress np arrays with np.save
-        for attr in vars(self):
-            attr_value = getattr(self, attr)
-
-            if isinstance(attr_value, SICMessage):
-                setattr(self, attr, attr_value.serialize())
-                self.__SIC_MESSAGES.append(attr)
+    def _serialize_pickle(self):
+        """
+        Pickle a copy of the message, in which numpy arrays are replaced by their np.save or JPEG bytes.
+        :return: the byte string
+        """
+        lazy_fields = self._get_lazy_fields()
+        fields = self._get_fields()
+        np_values = []
+        jpeg_values = []
+        sic_messages = []
+
+        # fields that were never decoded are sent as they were received
+        encoded_values = {"jpeg": jpeg_values, "npy": np_values, "sic": sic_messages}
+        for attr, (encoding, data) in lazy_fields.items():
+            fields[attr] = data
+            encoded_values[encoding].append(attr)
+
+        for attr, attr_value in list(fields.items()):
+            if attr in lazy_fields:
+                continue
+            elif isinstance(attr_value, SICMessage):
+                fields[attr] = attr_value.serialize()
+                sic_messages.append(attr)
             elif isinstance(attr_value, np.ndarray):
                 if self._compress_images and attr_value.ndim == 3 and attr_value.shape[-1] == 3:
-                    setattr(self, attr, self.np2jpeg(attr_value))
-                    self.__JPEG_VALUES.append(attr)
+                    fields[attr] = self._encode_field(attr, attr_value, "jpeg")
+                    jpeg_values.append(attr)
                 else:
-                    setattr(self, attr, self._np2base(attr_value))
-                    self.__NP_VALUES.append(attr)
+                    fields[attr] = self._encode_field(attr, attr_value, "npy")
+                    np_values.append(attr)
+
+        skeleton = self._create_skeleton(fields, np_values, jpeg_values, sic_messages)
+        return pickle.dumps(skeleton, protocol=2)
+
+    def _get_fields(self):
+        """
+        :return: a copy of the attributes of this message, without the serialization caches.
+        """
+        fields = dict(self.__dict__)
+        for attr in _CACHE_ATTRIBUTES:
+            fields.pop(attr, None)
+        return fields
+
+    def _get_lazy_fields(self):
+        """
+        :return: a copy of the fields that are not decoded yet, as attribute -> (encoding, bytes). Must be called before
+                 _get_fields, so a field that is decoded concurrently is always in one of both.
+        """
+        return dict(self.__dict__.get(_LAZY_FIELDS) or {})
+
+    @classmethod
+    def _decode_field(cls, encoding, data):
+        if encoding == "jpeg":
+            return cls.jpeg2np(data)
+        elif encoding == "npy":
+            return cls._base2np(data)
+        return SICMessage.deserialize(data)
+
+    def _set_lazy_field(self, attr, encoding, data):
+        """
+        Store a received field to decode it when it is first accessed.
+        """
+        if hasattr(type(self), attr):
+            # __getattr__ is not called for attributes with a class default, so these are decoded right away
+            self.__dict__[attr] = self._decode_field(encoding, data)
+            return
+
+        self.__dict__.pop(attr, None)
+        lazy_fields = self.__dict__.get(_LAZY_FIELDS)
+        if lazy_fields is None:
+            lazy_fields = self.__dict__[_LAZY_FIELDS] = dict()
+        lazy_fields[attr] = (encoding, data)
+
+    def _set_decode_metrics(self, metrics):
+        """
+        Record the time it takes to decode the lazy fields of this message (when they are first accessed) as
+        "deserialize" time in the metrics of the receiving component, as part of deserializing the message.
+        """
+        self.__dict__[_DECODE_METRICS] = metrics
+
+    def _decode_lazy_field(self, attr):
+        lazy_fields = self.__dict__.get(_LAZY_FIELDS) or {}
+        entry = lazy_fields.get(attr)
+        if entry is None:
+            # decoded by another thread in the meantime
+            return self.__dict__[attr]
+
+        encoding, data = entry
+        metrics = self.__dict__.get(_DECODE_METRICS)
+        start = time.time()
+        value = self._decode_field(encoding, data)
+        if metrics is not None:
+            metrics.observe("deserialize", time.time() - start)
+            if encoding == "sic":
+                value._set_decode_metrics(metrics)
+
+        # set the value before removing the lazy field, so other threads always find one of both. The received bytes
+        # are not kept, the decoded array may be modified (e.g. drawn on) before the message is forwarded.
+        self.__dict__[attr] = value
+        lazy_fields.pop(attr, None)
+
+        return value
+
+    def _decode_lazy_fields(self):
+        """
+        Decode all fields that are not decoded yet.
+        """
+        for attr in list(self._get_lazy_fields()):
+            self._decode_lazy_field(attr)
+
+    def _create_skeleton(self, fields, np_values=(), jpeg_values=(), sic_messages=()):
+        """
+        Create a message of the same class with the given attributes, to be pickled instead of this message.
+        """
+        skeleton = object.__new__(self.__class__)
+        skeleton.__dict__.update(fields)
+        skeleton.__dict__["_SICMessage__NP_VALUES"] = list(np_values)
+        skeleton.__dict__["_SICMessage__JPEG_VALUES"] = list(jpeg_values)
+        skeleton.__dict__["_SICMessage__SIC_MESSAGES"] = list(sic_messages)
+        return skeleton
+
+    def _encode_field(self, attr, value, encoding):
+        """
+        Encode a numpy array field as "jpeg" or "npy" (np.save) bytes, or reuse the bytes of a previous encoding of
+        the same array, if its contents did not change since.
+        """
+        cached = self._get_encoded_fields().get(attr)
+        if cached is not None and cached[0] == encoding and cached[1] is value and \
+                cached[2] is not None and cached[2] == self._fingerprint(value):
+            return cached[3]
+
+        if encoding == "jpeg":
+            encoded = self.np2jpeg(value)
+        else:
+            encoded = self._np2base(value)
+
+        self._cache_encoded_field(attr, value, encoding, encoded)
+        return encoded
+
+    def _get_encoded_fields(self):
+        encoded_fields = self.__dict__.get(_ENCODED_FIELDS_CACHE)
+        if encoded_fields is None:
+            encoded_fields = self.__dict__[_ENCODED_FIELDS_CACHE] = dict()
+        return encoded_fields
+
+    def _cache_encoded_field(self, attr, value, encoding, encoded):
+        """
+        Store the bytes of an encoded field, so the field is not encoded again when the message is sent again unchanged.
+        """
+        self._get_encoded_fields()[attr] = (encoding, value, self._fingerprint(value), encoded)
+
+    def _invalidate_serialization_cache(self):
+        self.__dict__.pop(_ENCODED_FIELDS_CACHE, None)
+
+    @classmethod
+    def _fingerprint(cls, array):
+        """
+        A checksum of the contents of a numpy array, to detect that an array was modified in place after it was
+        encoded. It takes about a tenth of the time of JPEG compressing the array.
+        :return: the checksum, or None for arrays that are not of a plain numeric dtype (see _BINARY_DTYPE_KINDS)
+        """
+        if array.dtype.kind not in _BINARY_DTYPE_KINDS:
+            return None
+        return array.shape, array.dtype.str, zlib.crc32(cls._array_buffer(array))
+
+    @staticmethod
+    def _array_buffer(array):
+        """
+        Get the raw bytes of a numpy array, without copying if it is C contiguous.
+        :param array: a numpy array of a plain numeric dtype (see _BINARY_DTYPE_KINDS)
+        :return: a bytes-like object
+        """
+        if six.PY3:
+            # unlike memoryview(array).cast("B"), this also works for arrays without elements
+            return np.ascontiguousarray(array).reshape(-1).view(np.uint8)
+        return array.tostring()
+
+    def _serialize_binary(self, compress_images=None):
+        """
+        Convert the object to the binary framing described at _BINARY_MAGIC. Numpy arrays are stored as raw buffers, so
+        they can be viewed with np.frombuffer on the receiving side instead of being copied by np.load.
+        :param compress_images: Overrides _compress_images, e.g. to skip JPEG compression when sending through shared
+                                memory.
+        :return: the byte string
+        """
+        if compress_images is None:
+            compress_images = self._compress_images
+
+        lazy_fields = self._get_lazy_fields()
+        skeleton_dict = self._get_fields()
 
-        # Pickle dataclass
-        return pickle.dumps(self, protocol=2)
+        # attribute -> (kind, dtype, shape, buffer)
+        binary_fields = dict()
+
+        for attr, (encoding, data) in lazy_fields.items():
+            # fields that were never decoded are sent as they were received, if possible
+            if encoding == "sic":
+                binary_fields[attr] = (_FIELD_SIC_MESSAGE, b"", (), data)
+            elif encoding == "jpeg" and compress_images:
+                binary_fields[attr] = (_FIELD_JPEG, b"", (), data)
+            else:
+                skeleton_dict[attr] = getattr(self, attr)
+
+        for attr, attr_value in skeleton_dict.items():
+            if attr in binary_fields:
+                continue
+            elif isinstance(attr_value, SICMessage):
+                binary_fields[attr] = (_FIELD_SIC_MESSAGE, b"", (), attr_value.serialize())
+            elif isinstance(attr_value, np.ndarray):
+                if compress_images and attr_value.ndim == 3 and attr_value.shape[-1] == 3:
+                    binary_fields[attr] = (_FIELD_JPEG, b"", (), self._encode_field(attr, attr_value, "jpeg"))
+                elif attr_value.dtype.kind in _BINARY_DTYPE_KINDS:
+                    # other arrays (e.g. datetime64, structured or object arrays) cannot be described by a dtype
+                    # string and a buffer, they are pickled with the rest of the message
+                    binary_fields[attr] = (_FIELD_NUMPY, attr_value.dtype.str.encode("ascii"), attr_value.shape,
+                                           self._array_buffer(attr_value))
+
+        descriptors = []
+        buffers = []
+        for attr, (kind, dtype, shape, buffer) in binary_fields.items():
+            name = attr.encode("utf-8")
+            descriptor = [_BINARY_FIELD.pack(kind, len(name)), name,
+                          struct.pack("<B", len(dtype)), dtype,
+                          struct.pack("<B{}Q".format(len(shape)), len(shape), *shape),
+                          _BINARY_SIZE.pack(len(buffer))]
+            descriptors.append(b"".join(descriptor))
+            buffers.append(buffer)
+            skeleton_dict[attr] = None
+
+        # pickle a copy of the message without the (large) buffers
+        skeleton = self._create_skeleton(skeleton_dict)
+        skeleton_bytes = pickle.dumps(skeleton, protocol=2)
+
+        parts = [_BINARY_HEADER.pack(_BINARY_MAGIC, _BINARY_VERSION, len(descriptors), len(skeleton_bytes))]
+        parts.extend(descriptors)
+        parts.append(skeleton_bytes)
+
+        offset = sum(len(p) for p in parts)
+        for buffer in buffers:
+            padding = -offset % _BINARY_ALIGNMENT
+            parts.append(b"\0" * padding)
+            parts.append(buffer)
+            offset += padding + len(buffer)
+
+        return b"".join(parts)
+
+    @classmethod
+    def _deserialize_binary(cls, byte_string):
+        """
+        Convert an object from the binary framing described at _BINARY_MAGIC. Numpy fields are writable views on
+        byte_string (or on a copy of it, if it is not a bytearray), JPEG and nested message fields are decoded when
+        they are first accessed.
+        :param byte_string: the bytes created by _serialize_binary
+        :return: a SICMessage subclass
+        """
+        magic, version, n_fields, skeleton_length = _BINARY_HEADER.unpack_from(byte_string, 0)
+        if version > _BINARY_VERSION:
+            raise ValueError("Received a SICMessage with binary format version {}, but only versions up to {} are "
+                             "supported. Please update the framework on all devices.".format(version, _BINARY_VERSION))
+
+        offset = _BINARY_HEADER.size
+        fields = []
+        for _ in range(n_fields):
+            kind, name_length = _BINARY_FIELD.unpack_from(byte_string, offset)
+            offset += _BINARY_FIELD.size
+            name = byte_string[offset:offset + name_length].decode("utf-8")
+            offset += name_length
+
+            dtype_length, = struct.unpack_from("<B", byte_string, offset)
+            offset += 1
+            dtype = byte_string[offset:offset + dtype_length].decode("ascii")
+            offset += dtype_length
+
+            ndim, = struct.unpack_from("<B", byte_string, offset)
+            shape = struct.unpack_from("<{}Q".format(ndim), byte_string, offset + 1)
+            offset += 1 + 8 * ndim
+
+            nbytes, = _BINARY_SIZE.unpack_from(byte_string, offset)
+            offset += _BINARY_SIZE.size
+
+            fields.append((kind, str(name), dtype, shape, nbytes))
+
+        if not isinstance(byte_string, bytearray) and any(field[0] == _FIELD_NUMPY for field in fields):
+            # received arrays can be modified in place (e.g. drawn on), as with pickled arrays and arrays received
+            # through shared memory (which are read into a bytearray). Copying the message once is cheap.
+            byte_string = bytearray(byte_string)
+        # slices of a memoryview are not copied until they are converted to bytes
+        view = memoryview(byte_string)
+
+        obj = cls._pickle_load(view[offset:offset + skeleton_length].tobytes())
+        offset += skeleton_length
+
+        for kind, name, dtype, shape, nbytes in fields:
+            offset += -offset % _BINARY_ALIGNMENT
+
+            if kind == _FIELD_NUMPY:
+                dtype = np.dtype(dtype)
+                value = np.frombuffer(byte_string, dtype=dtype, count=nbytes // dtype.itemsize, offset=offset)
+                obj.__dict__[name] = value.reshape(shape)
+            elif kind == _FIELD_JPEG:
+                obj._set_lazy_field(name, "jpeg", view[offset:offset + nbytes].tobytes())
+            elif kind == _FIELD_SIC_MESSAGE:
+                obj._set_lazy_field(name, "sic", view[offset:offset + nbytes].tobytes())
+            else:
+                raise ValueError("Unknown binary field type {} for field {}".format(kind, name))
+
+            offset += nbytes
+
+        return obj
 
     @staticmethod
     def _pickle_load(byte_string):
@@ -192,29 +564,19 @@ class SICMessage(object):
         with support for numpy arrays.
         :return: a SICMessage subclass
         """
+        if byte_string[:len(_BINARY_MAGIC)] == _BINARY_MAGIC:
+            return cls._deserialize_binary(byte_string)
+
         # Read pickle object
         obj = cls._pickle_load(byte_string)
 
-        # Decompress SICMessage bytes to SICMessage
-        for field in obj.__SIC_MESSAGES:
-            field_val = getattr(obj, field)
-            if not isinstance(field_val, bytes):
-                field_val = field_val.encode('latin1')
-            setattr(obj, field, SICMessage.deserialize(field_val))
-
-        # Decompress numpy bytes to numpy arrays
-        for field in obj.__NP_VALUES:
-            field_val = getattr(obj, field)
-            if not isinstance(field_val, bytes):
-                field_val = field_val.encode('latin1')
-            setattr(obj, field, obj._base2np(field_val))
-
-        # Decompress JPEG images to numpy arrays
-        for field in obj.__JPEG_VALUES:
-            field_val = getattr(obj, field)
-            if not isinstance(field_val, bytes):
-                field_val = field_val.encode('latin1')
-            setattr(obj, field, obj.jpeg2np(field_val))
+        # The fields are decoded when they are first accessed
+        for encoding, fields in [("sic", obj.__SIC_MESSAGES), ("npy", obj.__NP_VALUES), ("jpeg", obj.__JPEG_VALUES)]:
+            for field in fields:
+                field_val = obj.__dict__[field]
+                if not isinstance(field_val, bytes):
+                    field_val = field_val.encode('latin1')
+                obj._set_lazy_field(field, encoding, field_val)
 
         return obj
 
@@ -222,8 +584,9 @@ class SICMessage(object):
         max_len = 20
         out = str(self.__class__.__name__) + "\n"
 
+        self._decode_lazy_fields()
         for attr in sorted(vars(self)):
-            if attr.startswith("__"):
+            if attr.startswith("__") or attr in _CACHE_ATTRIBUTES:
                 continue
 
             attr_value = str(getattr(self, attr))
@@ -241,6 +604,38 @@ class SICMessage(object):
 #                             Message types                                          #
 ######################################################################################
 
+def _new_request_id_prefix():
+    """
+    A random prefix for the request ids of this process. 31 random bits make a collision between the processes on all
+    devices very unlikely, and leave 32 bits for the counter so ids fit in a signed 64 bit integer.
+    """
+    return (struct.unpack("<I", os.urandom(4))[0] & 0x7FFFFFFF) << 32
+
+
+_request_id_prefix = _new_request_id_prefix()
+# next() on itertools.count is atomic, so no lock is needed to generate ids from multiple threads
+_request_id_counter = itertools.count(1)
+
+
+def _next_request_id():
+    """
+    Generate a request id that is unique across processes and devices: the process prefix and a counter.
+    :return: a positive integer smaller than 2**63
+    """
+    return _request_id_prefix | (next(_request_id_counter) & 0xFFFFFFFF)
+
+
+def _reset_request_ids():
+    # a forked child process would otherwise generate the same ids as its parent
+    global _request_id_prefix, _request_id_counter
+    _request_id_prefix = _new_request_id_prefix()
+    _request_id_counter = itertools.count(1)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_request_ids)
+
+
 class SICConfMessage(SICMessage):
     """
     A type of message that carries configuration information for services.
@@ -250,17 +645,18 @@ class SICConfMessage(SICMessage):
 
 class SICRequest(SICMessage):
     """
-    A type of message that must be met with a reply, a SICMessage with the same request id, on the same channel.
+    A type of message that must be met with a reply, a SICMessage with the same request id, on the reply channel of
+    the request (or on the same channel if it is not set).
     """
     _request_id = None
+    # The channel the requesting SICRedis listens to for replies, set when sending the request
+    _reply_channel = None
 
     def __init__(self, request_id=None):
-        if request_id:
+        if request_id is not None:
             self._request_id = request_id
         else:
-            # TODO https://softwareengineering.stackexchange.com/questions/339125/acceptable-to-rely-on-random-ints-being-unique
-            # should be a global that gets incremented, or 512
-            self._request_id = random.getrandbits(128)
+            self._request_id = _next_request_id()
 
 
 class SICControlMessage(SICMessage):
@@ -317,6 +713,7 @@ class CompressedImage(object):
     Non-image array content will be destroyed by this compression.
     """
     _compress_images = True
+    _binary_serialization = True
 
     def __init__(self, image):
         self.image = image
@@ -343,10 +740,11 @@ class CompressedImageRequest(CompressedImage, SICRequest):
 class UncompressedImageMessage(SICMessage):
     """
     Message class to send images/np array without JPEG compression. The data is
-    compressed using default np.save lossless compression. In other words: the
-    data does not change after compression, but this is much slower than JPEGCompressedImageMessage
+    sent as raw bytes using the binary message format. In other words: the
+    data does not change after compression, but the message is much larger than a CompressedImageMessage.
     """
     _compress_images = False
+    _binary_serialization = True
 
     def __init__(self, image):
         self.image = image
@@ -0,0 +1,162 @@
+"""
+Runtime metrics of components.
+
+Every component keeps a SICMetrics registry with counters (e.g. messages in and out, drops, published bytes), gauges
+(e.g. queue depth) and latency histograms (e.g. on_message, execute, serialize and deserialize time). The component
+periodically publishes the metrics of the last interval as a SICMetricsMessage on the metrics channel, where they can
+be monitored with sic-top (see sic_top.py).
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from .message_python2 import SICMessage
+
+
+def get_metrics_channel():
+    """
+    Get the global metrics channel. All components on any device publish their metrics to this channel.
+    """
+    return "sic:metrics"
+
+
+class LatencyHistogram(object):
+    """
+    A histogram of durations in exponentially growing buckets, from 10 microseconds to about 20 seconds, so percentiles
+    can be estimated (within a factor 2) without storing every observation.
+    """
+
+    BUCKET_BOUNDS = [1e-5 * 2 ** i for i in range(22)]
+
+    def __init__(self, counts=None, total=0.0, maximum=0.0):
+        # the last bucket holds the observations above the largest bound
+        self.counts = list(counts) if counts else [0] * (len(self.BUCKET_BOUNDS) + 1)
+        self.total = total
+        self.maximum = maximum
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def observe(self, seconds):
+        index = 0
+        while index < len(self.BUCKET_BOUNDS) and seconds > self.BUCKET_BOUNDS[index]:
+            index += 1
+
+        self.counts[index] += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+        self.maximum = max(self.maximum, other.maximum)
+
+    def mean(self):
+        count = self.count
+        return self.total / count if count else 0.0
+
+    def percentile(self, percentage):
+        """
+        :param percentage: e.g. 99 for the 99th percentile
+        :return: the upper bound of the bucket containing the percentile, in seconds
+        """
+        count = self.count
+        if not count:
+            return 0.0
+
+        rank = count * percentage / 100.0
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= rank and bucket_count:
+                if index < len(self.BUCKET_BOUNDS):
+                    return min(self.BUCKET_BOUNDS[index], self.maximum)
+                break
+
+        return self.maximum
+
+    def to_dict(self):
+        return {"counts": self.counts, "total": self.total, "maximum": self.maximum}
+
+    @classmethod
+    def from_dict(cls, histogram):
+        return cls(histogram["counts"], histogram["total"], histogram["maximum"])
+
+
+class SICMetrics(object):
+    """
+    A thread safe registry of counters, gauges and latency histograms. Counters and histograms are collected per
+    interval (and reset), gauges keep their last value.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = dict()
+        self._gauges = dict()
+        self._histograms = dict()
+        self._interval_start = time.time()
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def time(self, name):
+        """
+        Observe the duration of a block of code, e.g.
+            with metrics.time("execute"):
+                self.execute(messages)
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start)
+
+    def collect(self):
+        """
+        Get the metrics of the interval since the previous collect, and start a new interval.
+        :return: tuple of the interval in seconds, counters, gauges and histograms (as dicts, see LatencyHistogram)
+        """
+        now = time.time()
+        with self._lock:
+            interval = now - self._interval_start
+            counters = self._counters
+            gauges = dict(self._gauges)
+            histograms = dict((name, histogram.to_dict()) for name, histogram in self._histograms.items())
+
+            self._interval_start = now
+            self._counters = dict()
+            self._histograms = dict()
+
+        return interval, counters, gauges, histograms
+
+
+class SICMetricsMessage(SICMessage):
+    def __init__(self, component_name, ip, pid, interval, counters, gauges, histograms):
+        """
+        The metrics of a component over the last interval, see SICMetrics.collect.
+        :param component_name: the name of the component
+        :param ip: the ip of the device the component runs on
+        :param pid: the process the component runs in, to distinguish component managers on the same device
+        :param interval: the duration of the interval in seconds
+        """
+        self.component_name = component_name
+        self.ip = ip
+        self.pid = pid
+        self.interval = interval
+        self.counters = counters
+        self.gauges = gauges
+        self.histograms = histograms
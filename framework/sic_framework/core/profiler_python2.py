@@ -0,0 +1,174 @@
+"""
+A sampling profiler that can be started and stopped in a running component, on python 2 (robots) and python 3.
+
+A profiler thread periodically samples the stacks of the threads of the component (sys._current_frames), so the
+component does not have to be restarted under a profiler, and the overhead is independent of the number of function
+calls. Sampling every 10 ms costs in the order of a percent of CPU.
+
+Example:
+    face_detection.request(StartProfilingRequest())
+    time.sleep(30)
+    profile = face_detection.request(StopProfilingRequest())
+    print(profile.format_top())
+
+    # or view it as flamegraph, e.g. with speedscope or flamegraph.pl
+    with open("profile.txt", "w") as f:
+        f.write(profile.collapsed())
+"""
+import collections
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+from .message_python2 import SICControlRequest, SICControlMessage
+
+
+class StartProfilingRequest(SICControlRequest):
+    def __init__(self, interval=.01, all_threads=False):
+        """
+        Start the sampling profiler of a component. Starting it again restarts the profile.
+        :param interval: the number of seconds between samples
+        :param all_threads: sample all threads of the process instead of only the threads of the component, e.g. to
+                            include other components started by the same component manager.
+        """
+        super(StartProfilingRequest, self).__init__()
+        self.interval = interval
+        self.all_threads = all_threads
+
+
+class StopProfilingRequest(SICControlRequest):
+    """
+    Stop the sampling profiler of a component. The reply is a ProfileMessage.
+    """
+
+
+class ProfileMessage(SICControlMessage):
+    def __init__(self, stacks, samples, duration, interval):
+        """
+        The profile collected by a sampling profiler.
+        :param stacks: dict of stack to the number of times it was sampled. A stack is a string of the thread name
+                       and the functions from outer to inner, separated by ";".
+        :param samples: the number of times the threads were sampled
+        :param duration: the number of seconds the profiler ran
+        :param interval: the number of seconds between samples
+        """
+        self.stacks = stacks
+        self.samples = samples
+        self.duration = duration
+        self.interval = interval
+
+    def collapsed(self):
+        """
+        :return: the stacks in the "collapsed" format of flamegraph.pl (one "stack count" line per stack)
+        """
+        return "".join("{} {}\n".format(stack, count) for stack, count in sorted(self.stacks.items()))
+
+    def top(self, n=20):
+        """
+        The functions that were sampled most.
+        :return: list of (function, self samples, total samples), sorted by self samples. Self samples are the samples
+                 in which the function was running itself, total samples also include the functions it called.
+        """
+        self_counts = collections.Counter()
+        total_counts = collections.Counter()
+
+        for stack, count in self.stacks.items():
+            # the first element is the thread name
+            functions = stack.split(";")[1:]
+            if not functions:
+                continue
+            self_counts[functions[-1]] += count
+            for function in set(functions):
+                total_counts[function] += count
+
+        top = sorted(total_counts, key=lambda function: (self_counts[function], total_counts[function]), reverse=True)
+        return [(function, self_counts[function], total_counts[function]) for function in top[:n]]
+
+    def format_top(self, n=20):
+        """
+        :return: the top n functions as a table, with the percentage of the sampled stacks (of all threads)
+        """
+        stacks = max(sum(self.stacks.values()), 1)
+
+        lines = ["{} samples in {:.1f} s".format(self.samples, self.duration),
+                 "{:>7} {:>7}  {}".format("SELF%", "TOTAL%", "FUNCTION")]
+        for function, self_count, total_count in self.top(n):
+            lines.append("{:>7.1f} {:>7.1f}  {}".format(100.0 * self_count / stacks, 100.0 * total_count / stacks,
+                                                        function))
+        return "\n".join(lines)
+
+
+class SICSamplingProfiler(object):
+    """
+    Samples the stacks of a set of threads in the background, see the module documentation.
+    """
+
+    def __init__(self, thread_name_prefix=None, interval=.01):
+        """
+        :param thread_name_prefix: only sample the threads of which the name starts with this prefix, or None to
+                                   sample all threads
+        :param interval: the number of seconds between samples
+        """
+        self.thread_name_prefix = thread_name_prefix
+        self.interval = interval
+
+        self._stacks = collections.Counter()
+        self._samples = 0
+        self._start_time = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._start_time = time.time()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.name = "SICSamplingProfiler"
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        :return: the collected ProfileMessage
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+        duration = time.time() - self._start_time if self._start_time else 0.0
+        return ProfileMessage(dict(self._stacks), self._samples, duration, self.interval)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        own_thread = threading.current_thread().ident
+        names = dict((thread.ident, thread.name) for thread in threading.enumerate())
+
+        for thread_id, frame in sys._current_frames().items():
+            name = names.get(thread_id, str(thread_id))
+            if thread_id == own_thread or (self.thread_name_prefix and not name.startswith(self.thread_name_prefix)):
+                continue
+
+            functions = []
+            while frame is not None:
+                code = frame.f_code
+                functions.append("{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename),
+                                                     code.co_firstlineno))
+                frame = frame.f_back
+
+            functions.append(name)
+            self._stacks[";".join(reversed(functions))] += 1
+
+        self._samples += 1
+
+
+def get_component_thread_name_prefix(component_name):
+    """
+    The prefix of the names of the threads of a component, or None if the component runs in its own process (see
+    SICComponent.RUN_IN_SUBPROCESS), as all threads then belong to the component.
+    """
+    if multiprocessing.current_process().name == component_name:
+        return None
+    return component_name
@@ -0,0 +1,159 @@
+"""
+A registry of the component managers and components that are running, stored in redis.
+
+Managers and components advertise themselves with an entry that expires after TTL seconds, and is refreshed by a
+heartbeat thread while they are running. Connectors look up a component to know if it is alive (and its channels and
+capabilities), instead of sending a ping and waiting for it to time out.
+
+    sic:registry:manager:<ip>:<component name>    {"ip": ..., "pid": ..., "manager": manager class name}
+    sic:registry:component:<ip>:<component name>  {"name": ..., "ip": ..., "pid": ..., "output_channel": ...,
+                                                   "request_reply_channel": ..., "inputs": [message names],
+                                                   "output": message name, "started": timestamp, "state": ...}
+
+The state of a component is reported progressively, so connectors can wait for components that take long to start:
+
+    starting:    the component is being created, e.g. loading model weights in its __init__
+    warming_up:  SICComponent.warmup() is running, e.g. a dummy inference
+    ready:       the component handles messages and requests
+
+Entries are removed when a manager or component stops, or expire within TTL seconds if it crashed.
+"""
+import json
+import threading
+
+
+STARTING = "starting"
+WARMING_UP = "warming_up"
+READY = "ready"
+
+
+def get_manager_key(component_name, ip):
+    """
+    The key of the manager that can start a component on a device. Several managers may run on a device, so managers
+    register every component they can start.
+    """
+    return "sic:registry:manager:{}:{}".format(ip, component_name)
+
+
+def get_component_key(component_name, ip):
+    return "sic:registry:component:{}:{}".format(ip, component_name)
+
+
+class SICRegistry(object):
+    """
+    Keeps the registry entries of a manager or component alive.
+    """
+
+    # Seconds after which an entry expires if it is not refreshed
+    TTL = 5
+
+    def __init__(self, redis):
+        """
+        :param redis: the SICRedis connection of the manager or component
+        """
+        self.redis = redis
+
+        # key -> json value
+        self._entries = dict()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def register(self, key, info):
+        """
+        Add an entry to the registry, and keep refreshing it until it is unregistered.
+        :param info: dict that can be converted to json
+        """
+        value = json.dumps(info)
+        with self._lock:
+            self._entries[key] = value
+        self.redis.set_value(key, value, ttl=self.TTL)
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._heartbeat)
+            self._thread.name = "SICRegistry_heartbeat"
+            self._thread.daemon = True
+            self._thread.start()
+
+    def unregister(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        self.redis.delete_value(key)
+
+    def close(self):
+        """
+        Stop refreshing, and remove all entries.
+        """
+        self._stop_event.set()
+        with self._lock:
+            keys = list(self._entries)
+            self._entries = dict()
+
+        for key in keys:
+            try:
+                self.redis.delete_value(key)
+            except Exception:
+                # the entry expires by itself
+                pass
+
+    def _heartbeat(self):
+        while not self._stop_event.wait(self.TTL / 3.0):
+            with self._lock:
+                entries = list(self._entries.items())
+
+            for key, value in entries:
+                try:
+                    self.redis.set_value(key, value, ttl=self.TTL)
+                except Exception:
+                    # e.g. redis is closed while stopping, or the connection is lost for a moment
+                    if self._stop_event.is_set():
+                        return
+
+
+def remove_components(redis, component_names, ip):
+    """
+    Remove the entries of components, e.g. those of the previous run of a manager that is restarted. Connectors would
+    otherwise trust them until they expire.
+    """
+    for component_name in component_names:
+        redis.delete_value(get_component_key(component_name, ip))
+
+
+def _parse(value):
+    return json.loads(value) if value is not None else None
+
+
+def get_lookup_keys(component_name, ip):
+    return [get_component_key(component_name, ip), get_manager_key(component_name, ip)]
+
+
+def parse_lookup(values):
+    """
+    :param values: the values of the keys of get_lookup_keys
+    :return: tuple of the registry entries of the component and of the manager, as dict, or None if it is not
+             registered (or expired)
+    """
+    return tuple(_parse(value) for value in values)
+
+
+def lookup(redis, component_name, ip):
+    """
+    Look up a component and the manager that can start it, in a single round trip.
+    :return: see parse_lookup
+    """
+    return parse_lookup(redis.get_values(get_lookup_keys(component_name, ip)))
+
+
+def lookup_component(redis, component_name, ip):
+    return _parse(redis.get_value(get_component_key(component_name, ip)))
+
+
+def list_components(redis):
+    """
+    :return: the registry entries of all running components, on all devices
+    """
+    keys = redis.get_keys(get_component_key("*", "*"))
+    if not keys:
+        return []
+    entries = [_parse(value) for value in redis.get_values(keys)]
+    return [entry for entry in entries if entry is not None]
@@ -1,17 +1,113 @@
+import time
 from abc import abstractmethod
 
+from sic_framework.core import tracing_python2 as tracing
 from sic_framework.core.component_python2 import SICComponent
 from .message_python2 import SICMessage
 
 
+class SICPacer(object):
+    """
+    Paces a loop at a target rate. The deadlines are fixed multiples of the period from the first iteration, so the rate
+    does not drift when iterations take a varying amount of time. An iteration that takes longer than the period is an
+    overrun, after which the next iteration starts immediately. If skip_on_overrun is set, deadlines that are more than
+    a period behind are skipped, instead of running iterations back to back to catch up.
+    """
+
+    def __init__(self, rate, skip_on_overrun=True, metrics=None):
+        """
+        :param rate: the target rate in Hz
+        :param skip_on_overrun: skip missed deadlines instead of catching up
+        :param metrics: SICMetrics to record the jitter, overruns and skipped deadlines in
+        """
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.skip_on_overrun = skip_on_overrun
+        self.metrics = metrics
+
+        self._deadline = None
+        self._start_time = None
+
+        self.iterations = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.total_jitter = 0.0
+        self.max_jitter = 0.0
+
+    def wait(self, stop_event):
+        """
+        Wait for the deadline of the next iteration.
+        :param stop_event: stop waiting when this event is set
+        :return: False if the stop event was set while waiting
+        """
+        now = time.time()
+
+        if self._deadline is None:
+            self._deadline = self._start_time = now
+        else:
+            self._deadline += self.period
+
+            if now > self._deadline:
+                self.overruns += 1
+                missed = int((now - self._deadline) / self.period) if self.skip_on_overrun else 0
+                self._deadline += missed * self.period
+                self.skipped += missed
+
+                if self.metrics:
+                    self.metrics.increment("overruns")
+                    self.metrics.increment("skipped", missed)
+
+        delay = self._deadline - now
+        if delay > 0 and stop_event.wait(delay):
+            return False
+
+        # how late this iteration starts
+        jitter = time.time() - self._deadline
+        self.iterations += 1
+        self.total_jitter += jitter
+        self.max_jitter = max(self.max_jitter, jitter)
+        if self.metrics:
+            self.metrics.observe("jitter", jitter)
+
+        return True
+
+    def stats(self):
+        """
+        :return: dict with the target and achieved rate (Hz), the mean and max jitter (seconds late), the number of
+                 overruns and the number of skipped deadlines
+        """
+        duration = time.time() - self._start_time if self._start_time else 0.0
+        return {
+            "target_rate": self.rate,
+            "achieved_rate": self.iterations / duration if duration > 0 else 0.0,
+            "mean_jitter": self.total_jitter / self.iterations if self.iterations else 0.0,
+            "max_jitter": self.max_jitter,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+        }
+
+
 class SICSensor(SICComponent):
     """
     Abstract class for sensors that provides data for the Social Interaction Cloud.
     """
 
+    # The maximum number of seconds between capturing data and returning it from execute. Capture times further from
+    # the current time are from another clock than time.time(), see _get_capture_timestamp.
+    MAX_CAPTURE_DELAY = 5
+
+    # The rate (Hz) at which execute is called, or None to call it again as soon as it returns. Can be set per sensor
+    # with a target_rate field in its configuration, see _get_target_rate.
+    TARGET_RATE = None
+    # Skip the executions that could not be started in time, instead of catching up by executing back to back
+    SKIP_ON_OVERRUN = True
+
     def __init__(self, *args, **kwargs):
         super(SICSensor, self).__init__(*args, **kwargs)
 
+        self._warned_capture_clock = False
+        self._pacer = None
+
     def start(self):
         """
         Start the service. This method must be called by the user at the end of the constructor
@@ -25,20 +121,67 @@ class SICSensor(SICComponent):
     @abstractmethod
     def execute(self):
         """
-        Main function of the sensor
+        Main function of the sensor. If the sensor knows when its data was captured, it should set the _timestamp of
+        the message with _get_capture_timestamp, otherwise the time execute returned is used.
         :return: A SICMessage
         :rtype: SICMessage
         """
         raise NotImplementedError("You need to define sensor execution.")
 
+    def _get_target_rate(self):
+        """
+        :return: the target_rate of the configuration, or TARGET_RATE
+        """
+        rate = getattr(self.params, "target_rate", None)
+        return rate if rate else self.TARGET_RATE
+
+    def get_pacing_stats(self):
+        """
+        :return: the rate, jitter and overruns of producing at the target rate (see SICPacer.stats), or None if the
+                 sensor has no target rate
+        """
+        return self._pacer.stats() if self._pacer is not None else None
+
     def _produce(self):
+        rate = self._get_target_rate()
+        if rate:
+            self._pacer = SICPacer(rate, skip_on_overrun=self.SKIP_ON_OVERRUN, metrics=self.metrics)
+            self.metrics.set_gauge("target_rate", rate)
+
         while not self._stop_event.is_set():
-            output = self.execute()
+            if self._pacer is not None and not self._pacer.wait(self._stop_event):
+                break
+
+            trace = tracing.new_trace() if self.TRACE else None
+
+            with self._trace_span("capture", trace):
+                with self.metrics.time("execute"):
+                    output = self.execute()
 
-            output._timestamp = self._get_timestamp()
+                if output._timestamp is None:
+                    output._timestamp = self._get_timestamp()
 
-            self.output_message(output)
+                self.output_message(output)
 
             self.logger.debug_framework_verbose("Outputting message {}".format(output))
 
+        if self._pacer is not None:
+            self.logger.debug("Pacing: {}".format(self._pacer.stats()))
         self.logger.debug("Stopped producing")
+
+    def _get_capture_timestamp(self, capture_time):
+        """
+        Convert the time the data was captured, according to the clock of this device (e.g. a hardware timestamp), to
+        the synchronized framework time. If the capture time is not from the same clock as time.time() (e.g. time since
+        boot), the current time is used instead.
+        :param capture_time: seconds since the epoch
+        :return: the timestamp for the message of the data
+        """
+        if abs(time.time() - capture_time) > self.MAX_CAPTURE_DELAY:
+            if not self._warned_capture_clock:
+                self._warned_capture_clock = True
+                self.logger.warning("Capture time {} is not from the system clock, using the time of publishing "
+                                    "instead".format(capture_time))
+            return self._get_timestamp()
+
+        return self._get_timestamp(capture_time)
@@ -1,39 +1,23 @@
 import collections
+import multiprocessing
+import threading
 from abc import ABCMeta, abstractmethod
 from threading import Event
 
+import six
+
 from sic_framework.core.component_python2 import SICComponent
 from sic_framework.core.utils import is_sic_instance
 
 from . import sic_logging
+from . import tracing_python2 as tracing
 from .message_python2 import SICMessage, SICConfMessage
+from .synchronizer_python2 import SICSynchronizer, SynchronizationError, POLICY_NEAREST
+from .worker_pool_python2 import SICWorkerPool
 
 
-class MessageQueue(collections.deque):
-    def __init__(self, logger):
-        """
-        A message buffer, with logging to notify of excessive dropped messages.
-        """
-        self.logger = logger
-        self.dropped_messages_counter = 0
-        super(MessageQueue, self).__init__(maxlen=SICService.MAX_MESSAGE_BUFFER_SIZE)
-
-    def appendleft(self, x):
-        # TODO when inputs arrive faster than processing, the buffer might fill up. Do we want to handle this better or
-        # just silence the logging. Maybe its better to log only when receiving lots of messages but never executing.
-
-        if len(self) == self.maxlen:
-            self.dropped_messages_counter += 1
-            if self.dropped_messages_counter in {5, 10, 50, 100, 200, 1000, 5000, 10000}:
-                self.logger.warning("Dropped {} messages of type {}".format(self.dropped_messages_counter,
-                                                                            x.get_message_name()))
-        return super(MessageQueue, self).appendleft(x)
-
-
-class PopMessageException(ValueError):
-    """
-    An exception to raise whenever the conditions to pop messages from the input message buffers were not met.
-    """
+# kept for backwards compatibility, the synchronizer raises SynchronizationErrors
+PopMessageException = SynchronizationError
 
 
 class SICMessageDictionary:
@@ -79,6 +63,33 @@ class SICMessageDictionary:
         raise IndexError("Input of type {} with source: {} not found.".format(type, source_component))
 
 
+# The service executed by the worker processes of a SICService with EXECUTE_WORKER_TYPE = "process". The processes are
+# spawned, so every worker process creates its own instance of the service, with its own redis connection and logger.
+_worker_process_service = None
+
+
+def _init_worker_process(service_class, log_level, conf):
+    """
+    The initializer of a worker process. Runs the constructor of the service (e.g. to load a model), but the worker is
+    not registered in the registry and does not listen to the inputs, as the service itself does.
+    """
+    global _worker_process_service
+    service = service_class.__new__(service_class)
+    service._is_worker_process = True
+    service.__init__(log_level=log_level, conf=conf)
+    _worker_process_service = service
+
+
+def _execute_in_worker_process(serialized_messages):
+    # messages are sent serialized, so fields that are not decoded yet are only decoded in the worker process
+    message_dict = SICMessageDictionary()
+    for serialized_message in serialized_messages:
+        message_dict.set(SICMessage.deserialize(serialized_message))
+
+    output = _worker_process_service.execute(message_dict)
+    return output.serialize() if output else None
+
+
 class SICService(SICComponent):
     """
     Abstract class for services that provides data fusion based on the timestamp of the data origin.
@@ -87,18 +98,52 @@ class SICService(SICComponent):
     MAX_MESSAGE_BUFFER_SIZE = 10
     MAX_MESSAGE_AGE_DIFF_IN_SECONDS = .5  # TODO tune? maybe in config? Can be use case dependent
 
+    # How the inputs are aligned, one of synchronizer_python2.POLICIES
+    SYNCHRONIZATION_POLICY = POLICY_NEAREST
+    # Windows for specific inputs that differ from MAX_MESSAGE_AGE_DIFF_IN_SECONDS, as message class -> seconds
+    INPUT_WINDOWS = {}
+
+    # The number of aligned input sets that are executed concurrently. With more than one worker, execute() must be
+    # thread safe (or use processes). Outputs are always sent in the order of their timestamps.
+    EXECUTE_WORKERS = 1
+    # "thread" for execute functions that release the GIL (e.g. OpenCV or torch), "process" for execute functions that
+    # do not. Every process creates its own instance of the service, so changes to the service made in execute() are
+    # not shared, and the service class and its configuration must be picklable.
+    EXECUTE_WORKER_TYPE = "thread"
+    # The maximum number of input sets that are executing or waiting for an earlier output, None for EXECUTE_WORKERS
+    MAX_IN_FLIGHT = None
+
     def __init__(self, *args, **kwargs):
         super(SICService, self).__init__(*args, **kwargs)
 
         # this event is set whenever a new message arrives.
         self._new_data_event = Event()
 
-        self._input_buffers = dict()
+        windows = dict()
+        for message_class, window in self.INPUT_WINDOWS.items():
+            windows[message_class.get_message_name()] = window
+
+        self._synchronizer = SICSynchronizer(policy=self.SYNCHRONIZATION_POLICY,
+                                             window=self.MAX_MESSAGE_AGE_DIFF_IN_SECONDS,
+                                             windows=windows,
+                                             maxlen=self.MAX_MESSAGE_BUFFER_SIZE,
+                                             logger=self.logger,
+                                             metrics=self.metrics)
+
+        # the executing input sets, as (timestamp, future) in the order they were popped
+        self._in_flight = collections.deque()
+        self._in_flight_lock = threading.Lock()
+        self._in_flight_slots = threading.Semaphore(self.MAX_IN_FLIGHT or self.EXECUTE_WORKERS)
+        self._workers = None
+        self._process_pool = None
 
     def start(self):
         """
         Start the service. This method must be called by the user at the end of the constructor
         """
+        if self.EXECUTE_WORKERS > 1:
+            self._start_workers()
+
         super(SICService, self).start()
 
         self._listen()
@@ -117,61 +162,29 @@ class SICService(SICComponent):
     def _pop_messages(self):
         """
         Collect all input SICdata messages gathered in the buffers into a dictionary to use in the execute method.
-        Make sure all input messages are aligned to the newest timestamp to synchronise the input data.
-        If multiple channels contain the same type, give them an index in the service_input dict.
+        The messages are aligned to the newest timestamp for which all inputs have data, according to the
+        SYNCHRONIZATION_POLICY. If multiple channels contain the same type, they are distinguished by their source.
 
         If the buffers do not contain an aligned set of messages, a PopMessageException is raised.
         :raises: PopMessageException
-        :return: tuple of dictionary of messages and the shared timestamp
+        :return: tuple of dictionary of messages, the shared timestamp and the trace to continue (or None)
         """
 
-        self.logger.debug_framework_verbose(
-            "input buffers: {}".format([(k, len(v)) for k, v in self._input_buffers.items()]))
+        self.logger.debug_framework_verbose("input buffers: {}".format(self._synchronizer.buffer_sizes()))
 
+        messages, timestamp = self._synchronizer.pop(len(self.get_inputs()))
 
-
-        # First, get the most recent message for all buffers. Then, select the oldest message from these messages.
-        # The timestamp of this message corresponds to the most recent timestamp for which we have all information
-        # available
-        try:
-            selected_timestamp = min([buffer[0]._timestamp for buffer in self._input_buffers.values()])
-        except IndexError:
-            # Not all buffers are full, so do not pop messages
-            raise PopMessageException("Could not collect aligned input data from buffers, not all buffers filled")
-
-        # Buffers are created dynamically, based on the source components. Only start executing once
-        # we have at least one buffer per message type
-        if len(self._input_buffers) != len(self.get_inputs()):
-            raise PopMessageException("Not enough buffer has been created yet")
-
-        # Second, we go through each buffer and check if we can find a message that is within the time difference
-        # threshold. Duplicate input types are in separate buffers based on their _previous_component attribute.
-
-
-        # TODO might raise
-        # RuntimeError: deque mutated during iteration
-        # in for msg in buffer: as on_message could be set while iterating
         message_dict = SICMessageDictionary()
-        messages_to_remove = []
-        for name, buffer in self._input_buffers.items():
-            # get the newest message in the buffer closest to the selected timestamp
-            # if there is none, we raise a ValueError to stop searching and wait for new data again
-            for msg in buffer:
-                if abs(msg._timestamp - selected_timestamp) <= self.MAX_MESSAGE_AGE_DIFF_IN_SECONDS:
-
-                    message_dict.set(msg)
-                    messages_to_remove.append(msg)
-                    break
-            else:
-                # the timestamps across all buffers did not align within the threshold, so do not pop messages
-                raise PopMessageException("Could not collect aligned input data from buffers, no matching timestamps")
+        for message in messages:
+            message_dict.set(message)
 
-        # Third, we now know all buffers contain a valid (aligned) message for the timestamp
-        # only then, consume these messages from the buffers and return the messages.
-        for buffer, msg in zip(self._input_buffers.values(), messages_to_remove):
-            buffer.remove(msg)
+        # the output continues the trace of the oldest input, the traces of the other inputs end here
+        trace = tracing.get_oldest_trace([message._trace for message in messages])
+        for message in messages:
+            if message._trace is not None and message._trace is not trace:
+                tracing.publish_hop(self._redis, self.get_component_name(), message._trace)
 
-        return message_dict, selected_timestamp
+        return message_dict, timestamp, trace
 
     def on_message(self, message):
         """
@@ -183,16 +196,15 @@ class SICService(SICComponent):
         # for b in msg.__class__.__mro__:
         #     if issubclass(b, SICMessage):
 
-        idx = (message.get_message_name(), message._previous_component_name)
-
-        try:
-            self._input_buffers[idx].appendleft(message)
-        except KeyError:
-            self._input_buffers[idx] = MessageQueue(self.logger)
-            self._input_buffers[idx].appendleft(message)
+        self._synchronizer.add(message)
 
         self._new_data_event.set()
 
+    def _on_message(self, message):
+        # inputs are only buffered here, their trace continues when they are executed
+        with self.metrics.time("on_message"):
+            return self.on_message(message)
+
     def _listen(self):
         """
         Wait for data and execute the service when possible.
@@ -211,21 +223,105 @@ class SICService(SICComponent):
             # pop messages if all buffers contain a timestamp aligned message, if not a PopMessageException is raised
             # and we will have to wait for new data
             try:
-                messages, timestamp = self._pop_messages()
+                messages, timestamp, trace = self._pop_messages()
             except PopMessageException:
                 self.logger.debug_framework_verbose("Did not pop messages from buffers.")
                 continue
 
-            output = self.execute(messages)
+            if self.EXECUTE_WORKERS > 1:
+                self._submit(messages, timestamp, trace)
+            else:
+                self._output(self._execute(messages, trace), timestamp)
 
-            self.logger.debug_framework_verbose("Outputting message {}".format(output))
+        self.logger.debug("Stopped listening")
+        self._stop_workers()
+        self.stop()
 
-            if output:
-                # To keep track of the creation time of this data, the output timestamp is the oldest timestamp of all
-                # the timestamp sources.
-                output._timestamp = timestamp
+    def _output(self, output, timestamp):
+        self.logger.debug_framework_verbose("Outputting message {}".format(output))
 
-                self.output_message(output)
+        if output:
+            # To keep track of the creation time of this data, the output timestamp is the oldest timestamp of all
+            # the timestamp sources.
+            output._timestamp = timestamp
 
-        self.logger.debug("Stopped listening")
-        self.stop()
+            self.output_message(output)
+
+    def _execute(self, messages, trace=None):
+        with self.metrics.time("execute"), self._trace_span("execute", trace) as span:
+            if self._process_pool is not None:
+                output = self._execute_in_process(messages)
+            else:
+                output = self.execute(messages)
+
+            if output and output._trace is None:
+                output._trace = span.get_trace()
+            return output
+
+    def _get_queue_depth(self):
+        buffered = sum(self._synchronizer.buffer_sizes().values())
+        return super(SICService, self)._get_queue_depth() + buffered
+
+    def _update_metrics(self):
+        super(SICService, self)._update_metrics()
+
+        with self._in_flight_lock:
+            self.metrics.set_gauge("in_flight", len(self._in_flight))
+
+    def _start_workers(self):
+        """
+        Create the worker pool. Processes are spawned (not forked), as the service already runs threads and has redis
+        connections that a forked process would inherit. Processes require python 3, otherwise threads are used.
+        """
+        if self.EXECUTE_WORKER_TYPE == "process":
+            if six.PY3:
+                context = multiprocessing.get_context("spawn")
+                self._process_pool = context.Pool(self.EXECUTE_WORKERS, initializer=_init_worker_process,
+                                                  initargs=(type(self), self.logger.level, self.params))
+            else:
+                self.logger.warning("Worker processes require python 3, using threads instead")
+
+        name = "{}_execute_worker".format(self.get_component_name())
+        self._workers = SICWorkerPool(self.EXECUTE_WORKERS, name=name, exception_handler=self.logger.exception)
+
+    def _execute_in_process(self, messages):
+        serialized_messages = [m.serialize() for messages_of_type in messages.messages.values()
+                               for m in messages_of_type]
+        output = self._process_pool.apply(_execute_in_worker_process, (serialized_messages,))
+        return SICMessage.deserialize(output) if output else None
+
+    def _submit(self, messages, timestamp, trace=None):
+        """
+        Execute an input set on a worker, once there are less than MAX_IN_FLIGHT input sets in flight. Input messages
+        keep being buffered (and dropped if the buffers are full) while waiting.
+        """
+        while not self._in_flight_slots.acquire(False):
+            if self._stop_event.wait(.01):
+                return
+
+        with self._in_flight_lock:
+            # with worker processes, the worker threads only wait for the worker processes
+            future = self._workers.submit(self._execute, messages, trace)
+            self._in_flight.append((timestamp, future))
+
+        future.add_done_callback(lambda _: self._output_completed())
+
+    def _output_completed(self):
+        """
+        Send the outputs of the completed input sets, in the order the input sets were popped. An input set that
+        completes early waits until all earlier input sets are completed.
+        """
+        with self._in_flight_lock:
+            while self._in_flight and self._in_flight[0][1].done():
+                timestamp, future = self._in_flight.popleft()
+                self._in_flight_slots.release()
+
+                # exceptions are logged by the worker pool
+                if future.exception() is None:
+                    self._output(future.result(), timestamp)
+
+    def _stop_workers(self):
+        if self._workers is not None:
+            self._workers.stop()
+        if self._process_pool is not None:
+            self._process_pool.terminate()
@@ -0,0 +1,194 @@
+"""
+Shared memory transport for components on the same host.
+
+A publisher that enables shared memory for its output channel writes each message into a ring buffer in shared memory,
+and only publishes a small SharedMemoryDescriptor through redis on "<channel>:shm". Subscribers on the same host
+subscribe to that channel instead, and copy the message out of shared memory. Subscribers on other hosts keep
+subscribing to the normal channel, which still receives the full message. Images are not JPEG compressed in shared
+memory, so local pipelines skip both the JPEG encoding and decoding.
+
+Which host a channel is published from is stored in redis at "sic:shm:<channel>". Subscribers only check this when
+they subscribe, so a publisher must enable shared memory before subscribers connect to it (e.g. in start()).
+
+Only available on python 3.8+ (multiprocessing.shared_memory), on other versions everything uses redis.
+"""
+import itertools
+import struct
+import threading
+
+from sic_framework.core import utils
+from sic_framework.core.message_python2 import SICMessage
+
+try:
+    from multiprocessing import shared_memory, resource_tracker
+except ImportError:
+    shared_memory = None
+
+
+def is_available():
+    return shared_memory is not None
+
+
+def get_host_id():
+    """
+    The id of this host (and user, as shared memory segments are only accessible to the user that created them).
+    """
+    return utils.get_username_hostname_ip()
+
+
+def get_registry_key(channel):
+    """
+    The redis key that stores the host id of a shared memory publisher of a channel.
+    """
+    return "sic:shm:{}".format(channel)
+
+
+def get_shared_memory_channel(channel):
+    """
+    The channel on which the descriptors of the messages in shared memory are published.
+    """
+    return "{}:shm".format(channel)
+
+
+class SharedMemoryDescriptor(SICMessage):
+    def __init__(self, segment, offset, sequence, size):
+        """
+        A reference to a message in a SharedMemoryRing.
+        :param segment: the name of the shared memory segment
+        :param offset: the offset of the slot in the segment
+        :param sequence: the sequence number of the write, to detect if the slot has been overwritten
+        :param size: the number of bytes of the message
+        """
+        self.segment = segment
+        self.offset = offset
+        self.sequence = sequence
+        self.size = size
+
+
+# the rings created by this process, by segment name, so local readers do not have to attach to them again
+_local_rings = dict()
+
+
+class SharedMemoryRing(object):
+    """
+    A ring buffer of fixed size slots in a shared memory segment, with a single writer. Each slot starts with a header
+    containing the sequence number of the write and the number of bytes in the slot. The sequence number is set to 0
+    while writing, so readers can detect that a slot was overwritten while they were copying it (a sequence lock).
+    """
+
+    NUMBER_OF_SLOTS = 4
+    # fits an uncompressed 1280x960 RGB image
+    SLOT_SIZE = 4 * 1024 * 1024
+
+    SLOT_HEADER = struct.Struct("<QQ")
+
+    def __init__(self, n_slots=None, slot_size=None):
+        if not is_available():
+            raise RuntimeError("Shared memory is not available on this python version")
+
+        self.n_slots = n_slots or self.NUMBER_OF_SLOTS
+        self.slot_size = slot_size or self.SLOT_SIZE
+        self._slot_stride = self.SLOT_HEADER.size + self.slot_size
+
+        self.shm = shared_memory.SharedMemory(create=True, size=self.n_slots * self._slot_stride)
+        self.name = self.shm.name
+
+        self._sequence = itertools.count(1)
+        self._lock = threading.Lock()
+        _local_rings[self.name] = self
+
+    def write(self, data):
+        """
+        Write data to the next slot.
+        :param data: bytes-like object
+        :return: SharedMemoryDescriptor, or None if the data does not fit in a slot
+        """
+        size = len(data)
+        if size > self.slot_size:
+            return None
+
+        with self._lock:
+            sequence = next(self._sequence)
+            offset = (sequence % self.n_slots) * self._slot_stride
+            start = offset + self.SLOT_HEADER.size
+
+            self.SLOT_HEADER.pack_into(self.shm.buf, offset, 0, size)
+            self.shm.buf[start:start + size] = data
+            self.SLOT_HEADER.pack_into(self.shm.buf, offset, sequence, size)
+
+        return SharedMemoryDescriptor(self.name, offset, sequence, size)
+
+    def close(self):
+        _local_rings.pop(self.name, None)
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _read_slot(shm, descriptor):
+    """
+    Copy the data a descriptor refers to out of a segment.
+    :return: bytearray, or None if the slot is being or has been overwritten
+    """
+    header = SharedMemoryRing.SLOT_HEADER
+
+    sequence, _ = header.unpack_from(shm.buf, descriptor.offset)
+    if sequence != descriptor.sequence:
+        return None
+
+    start = descriptor.offset + header.size
+    data = bytearray(shm.buf[start:start + descriptor.size])
+
+    # check the writer did not start overwriting the slot while copying
+    sequence, _ = header.unpack_from(shm.buf, descriptor.offset)
+    if sequence != descriptor.sequence:
+        return None
+
+    return data
+
+
+def _attach(name):
+    try:
+        # python >= 3.13, do not let this process remove the segment when it exits
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        # the resource tracker would unlink the segment of the publisher when this process exits
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class SharedMemoryReader(object):
+    """
+    Read messages from the rings of all shared memory publishers on this host.
+    """
+
+    def __init__(self):
+        self._segments = dict()
+        self._lock = threading.Lock()
+
+    def read(self, descriptor):
+        """
+        Get the message bytes a descriptor refers to.
+        :return: bytearray, or None if the message has already been overwritten
+        """
+        ring = _local_rings.get(descriptor.segment)
+        if ring is not None:
+            return _read_slot(ring.shm, descriptor)
+
+        with self._lock:
+            shm = self._segments.get(descriptor.segment)
+            if shm is None:
+                try:
+                    shm = _attach(descriptor.segment)
+                except FileNotFoundError:
+                    # the publisher stopped
+                    return None
+                self._segments[descriptor.segment] = shm
+
+        return _read_slot(shm, descriptor)
+
+    def close(self):
+        with self._lock:
+            for shm in self._segments.values():
+                shm.close()
+            self._segments = dict()
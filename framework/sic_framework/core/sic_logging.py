@@ -32,8 +32,9 @@ class SICLogSubscriber(object):
 
     def __init__(self):
         self.redis = None
-        # TODO make this a mutex
         self.running = False
+        # connectors may be created concurrently, e.g. by SICDevice.prefetch
+        self._lock = threading.Lock()
 
     def subscribe_to_log_channel_once(self):
         """
@@ -42,10 +43,11 @@ class SICLogSubscriber(object):
         :return:
         """
 
-        if not self.running:
-            self.running = True
-            self.redis = SICRedis(parent_name="SICLogSubscriber")
-            self.redis.register_message_handler(get_log_channel(), self._handle_log_message)
+        with self._lock:
+            if not self.running:
+                self.running = True
+                self.redis = SICRedis(parent_name="SICLogSubscriber")
+                self.redis.register_message_handler(get_log_channel(), self._handle_log_message)
 
 
     def _handle_log_message(self, message):
@@ -11,7 +11,7 @@ Non-blocking:
         r.send_message("my_channel", SICMessage("abc"))
 
 
-Blocking:
+Blocking (the reply is sent to a reply channel the requesting SICRedis subscribes to once):
     ## DEVICE A
         def do_reply(channel, request):
             return SICMessage()
@@ -21,6 +21,14 @@ Blocking:
     ## DEVICE B
         reply = r.request("my_channel", NamedRequest("req_handling"), timeout=5)
 
+Shared memory (same host, python 3 only):
+    ## DEVICE A, before anyone subscribes to the channel
+        r.enable_shared_memory("my_channel")
+        r.send_message("my_channel", UncompressedImageMessage(image))
+
+    ## DEVICE B, on the same host, receives the message through shared memory instead of redis
+        r.register_message_handler("my_channel", do_something_fn)
+
 Note: You can send a non-blocking request by sending with send_message("channel", SICRequest()), but this
 is somewhat discouraged as it may lead to harder to understand behaviour. The same goes for sending messages
 to request handlers with
@@ -36,14 +44,20 @@ import six
 from sic_framework.core.message_python2 import SICMessage, SICRequest
 from sic_framework.core.utils import is_sic_instance
 from sic_framework.core import utils
-from six.moves import queue
+from sic_framework.core import shared_memory_transport
+from sic_framework.core.shared_memory_transport import SharedMemoryDescriptor, SharedMemoryRing
+from sic_framework.core.worker_pool_python2 import SICFuture, SICWorkerPool, TimeoutError
 
 
 class CallbackThread:
-    def __init__(self, function, pubsub, thread):
+    def __init__(self, function, pubsub, thread, channels=None, worker=None):
         self.function = function
+        # pubsub and thread are only set if the callback has its own connection (multiplexed=False)
         self.pubsub = pubsub
         self.thread = thread
+        self.channels = channels
+        # the SICWorkerPool (of one thread) to run this callback on, or None to run it on the dispatcher thread
+        self.worker = worker
 
 
 # keep track of all redis instances, so we can close them on exit
@@ -55,11 +69,13 @@ def cleanup_on_exit():
         s.close()
 
     time.sleep(.2)
-    if len([x.is_alive() for x in threading.enumerate()]) > 1:
+    # daemon threads, such as the clock synchronization, do not keep the program from exiting
+    left_over = [thread for thread in threading.enumerate() if thread.is_alive() and not thread.daemon and
+                 thread is not threading.current_thread() and thread.name != "SICRedisCleanup"]
+    if left_over:
         print("Left over threads:")
-        for thread in threading.enumerate():
-            if thread.is_alive() and thread.name != "SICRedisCleanup":
-                print(thread.name, " is still alive")
+        for thread in left_over:
+            print(thread.name, " is still alive")
 
 
 atexit.register(cleanup_on_exit)
@@ -81,16 +97,51 @@ class SICRedis:
 
     Redis pubsub API can also be quite fickle due to not-so-useful subscriber messages and blocking behaviour, and
     this is ignored by this extension. Using any other redis functions 'as is' is discouraged.
+
+    By default all subscriptions share a single pubsub connection and dispatcher thread, instead of a connection and
+    a polling thread per subscription. Every callback is executed by its own worker thread, which is started when the
+    first message arrives, so messages are handled in order and a slow callback does not delay other callbacks.
     """
 
-    def __init__(self, parent_name=None):
+    # How long the registration of a shared memory publisher stays valid in redis without being refreshed
+    SHARED_MEMORY_REGISTRATION_TTL = 10
+    # How often a shared memory publisher checks which of its channels have subscribers
+    SUBSCRIBER_COUNT_INTERVAL = .5
+    # How long a subscriber remembers whether a channel is published through shared memory on this host
+    SHARED_MEMORY_PUBLISHER_INTERVAL = 1
+
+    def __init__(self, parent_name=None, multiplexed=True):
         """
         :param parent_name: The name of the module that uses this redis connection, for easier debugging
+        :param multiplexed: Serve all subscriptions with one pubsub connection and dispatcher thread. If False,
+                            every registered callback gets its own connection and thread.
         """
 
         self.stopping = False
         self._running_callbacks = []
 
+        self.multiplexed = multiplexed
+        # channel -> list of CallbackThread, for the shared pubsub connection
+        self._channel_callbacks = dict()
+        self._channel_callbacks_lock = threading.Lock()
+        self._pubsub = None
+        self._dispatcher_thread = None
+
+        # the channel all replies to requests of this SICRedis are sent to, and the requests waiting for a reply
+        self._reply_channel = None
+        self._pending_replies = dict()
+        self._pending_replies_lock = threading.Lock()
+
+        # channel -> SharedMemoryRing for the channels this SICRedis publishes through shared memory
+        self._shared_memory_rings = dict()
+        # channel -> time the shared memory registration was last refreshed
+        self._shared_memory_registrations = dict()
+        # channel -> (time, subscribers to the shared memory channel, subscribers to the channel itself)
+        self._subscriber_counts = dict()
+        # channel -> (time, whether it is published through shared memory on this host), for subscribers
+        self._shared_memory_publishers = dict()
+        self._shared_memory_reader = None
+
         # we assume that a password is required
         host, password = get_redis_db_ip_password()
 
@@ -115,6 +166,8 @@ class SICRedis:
 
         # To be set by any component that requires exceptions in the callback threads to be logged to somewhere
         self.parent_logger = None
+        # To be set by any component that keeps track of the serialization time and published bytes (SICMetrics)
+        self.metrics = None
 
         # service name (assigned to thread to help debugging)
         self.service_name = parent_name
@@ -130,6 +183,17 @@ class SICRedis:
         :param ignore_requests: Flag to control whether the message handler should also trigger the callback if the
                                 message is a SICRequest
         :return: The CallbackThread object containing the the thread that is listening to the channel.
+
+        Every callback runs on its own thread, one message at a time. A callback may block (e.g. a request handler that
+        waits for a message received by another callback), but it delays the next messages on its own channels.
+        """
+        return self._register_message_handler(channels, callback, ignore_requests=ignore_requests)
+
+    def _register_message_handler(self, channels, callback, ignore_requests=True, inline=False):
+        """
+        See register_message_handler.
+        :param inline: Run the callback on the dispatcher thread instead of on a worker. Only for callbacks that return
+                       immediately, such as handing the message to a waiting thread.
         """
 
         # convert single channel case to list of channels case
@@ -139,14 +203,22 @@ class SICRedis:
 
         assert len(channels), "Must provide at least one channel"
 
-        # ignore subscribers messages as to not trigger the callback with useless information
-        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
-
         # unpack pubsub message to SICMessage
         def wrapped_callback(pubsub_msg):
             try:
+                start = time.time()
                 sic_message = self.parse_pubsub_message(pubsub_msg)
 
+                if is_sic_instance(sic_message, SharedMemoryDescriptor):
+                    sic_message = self._read_shared_memory(sic_message)
+                    if sic_message is None:
+                        return
+
+                if self.metrics is not None:
+                    # fields that are decoded when they are first accessed are timed by the message itself
+                    self.metrics.observe("deserialize", time.time() - start)
+                    sic_message._set_decode_metrics(self.metrics)
+
                 if ignore_requests and is_sic_instance(sic_message, SICRequest):
                     return
 
@@ -159,6 +231,18 @@ class SICRedis:
 
         channels = [utils.str_if_bytes(c) for c in channels]
 
+        if not inline:
+            # receive the messages of publishers on this host through shared memory
+            publishers = self._get_shared_memory_publishers(channels)
+            channels = [shared_memory_transport.get_shared_memory_channel(c) if c in publishers else c
+                        for c in channels]
+
+        if self.multiplexed:
+            return self._subscribe_multiplexed(channels, callback, wrapped_callback, inline)
+
+        # ignore subscribers messages as to not trigger the callback with useless information
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+
         pubsub.subscribe(**{c: wrapped_callback for c in channels})
 
         def exception_handler(e, pubsub, thread):
@@ -182,6 +266,83 @@ class SICRedis:
 
         return c
 
+    def _subscribe_multiplexed(self, channels, callback, wrapped_callback, inline):
+        """
+        Add a callback to the shared pubsub connection, and start the dispatcher thread if it is not yet running.
+        """
+        worker = None
+        if not inline:
+            name = "{}_callback_worker".format(self.service_name or "SICRedis")
+            worker = SICWorkerPool(1, name=name)
+
+        c = CallbackThread(callback, pubsub=None, thread=None, channels=channels, worker=worker)
+        c.wrapped_callback = wrapped_callback
+
+        with self._channel_callbacks_lock:
+            new_channels = [ch for ch in channels if ch not in self._channel_callbacks]
+            for ch in channels:
+                self._channel_callbacks.setdefault(ch, []).append(c)
+
+            if self._pubsub is None:
+                self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+
+            if new_channels:
+                self._pubsub.subscribe(*new_channels)
+
+            if self._dispatcher_thread is None:
+                # the pubsub connection only exists after the first subscribe, so only now start to listen to it
+                self._dispatcher_thread = threading.Thread(target=self._dispatch_messages)
+                self._dispatcher_thread.name = "{}_dispatcher_thread".format(self.service_name or "SICRedis")
+                # stopped in close(), which is also called at exit for all SICRedis instances
+                self._dispatcher_thread.daemon = True
+                self._dispatcher_thread.start()
+
+        self._running_callbacks.append(c)
+        return c
+
+    def _dispatch_messages(self):
+        """
+        Receive the messages of all subscribed channels on the shared pubsub connection, and hand them to the
+        callbacks subscribed to the channel.
+        """
+        while not self.stopping:
+            try:
+                # blocks until a message arrives, and at most .1 seconds to check the stop condition
+                pubsub_msg = self._pubsub.get_message(timeout=0.1)
+            except Exception as e:
+                # Ignore the exception if the main program is already stopping (which trigger ValueErrors)
+                if self.stopping:
+                    break
+                if self.parent_logger:
+                    self.parent_logger.exception(e)
+                time.sleep(0.1)
+                continue
+
+            if pubsub_msg is None or pubsub_msg["type"] != "message":
+                continue
+
+            channel = utils.str_if_bytes(pubsub_msg["channel"])
+            with self._channel_callbacks_lock:
+                callbacks = list(self._channel_callbacks.get(channel, []))
+
+            for c in callbacks:
+                if c.worker is None:
+                    self._run_inline_callback(c, pubsub_msg)
+                    continue
+
+                try:
+                    c.worker.submit(c.wrapped_callback, pubsub_msg)
+                except RuntimeError:
+                    # the callback was unregistered in the meantime
+                    pass
+
+    def _run_inline_callback(self, callback_thread, pubsub_msg):
+        try:
+            callback_thread.wrapped_callback(pubsub_msg)
+        except Exception:
+            # already logged by the wrapped callback, and the dispatcher thread must keep running
+            pass
+
     def unregister_callback(self, callback_thread):
         """
         Unhook a callback by unsubscribing from redis and stopping the thread. Will unregister all hooks if
@@ -189,10 +350,30 @@ class SICRedis:
         :param callback_thread: The CallbackThread to unregister
         """
 
-        callback_thread.pubsub.unsubscribe()
-        callback_thread.thread.stop()
+        if callback_thread.pubsub is None:
+            self._unsubscribe_multiplexed(callback_thread)
+        else:
+            callback_thread.pubsub.unsubscribe()
+            callback_thread.thread.stop()
         self._running_callbacks.remove(callback_thread)
 
+    def _unsubscribe_multiplexed(self, callback_thread):
+        with self._channel_callbacks_lock:
+            unused_channels = []
+            for ch in callback_thread.channels:
+                callbacks = self._channel_callbacks.get(ch, [])
+                if callback_thread in callbacks:
+                    callbacks.remove(callback_thread)
+                if not callbacks:
+                    self._channel_callbacks.pop(ch, None)
+                    unused_channels.append(ch)
+
+            if unused_channels and not self.stopping:
+                self._pubsub.unsubscribe(*unused_channels)
+
+        if callback_thread.worker is not None:
+            callback_thread.worker.stop()
+
     def send_message(self, channel, message):
         """
         Send a SICMessage to a service/device listening on the channel.
@@ -202,25 +383,209 @@ class SICRedis:
         """
         assert isinstance(message, SICMessage), "Message must inherit from SICMessage (got {})".format(type(message))
 
-        return self._redis.publish(channel, message.serialize())
+        if channel in self._shared_memory_rings:
+            return self._send_shared_memory(channel, message)
+
+        return self._redis.publish(channel, self._serialize(message))
+
+    def _serialize(self, message, compress_images=True):
+        """
+        Serialize a message to publish it, and record the serialization time and size if metrics are kept.
+        :param compress_images: False to skip the JPEG compression of binary serialized messages.
+        """
+        start = time.time()
+
+        if not compress_images and message._binary_serialization:
+            data = message._serialize_binary(compress_images=False)
+        else:
+            data = message.serialize()
+
+        if self.metrics is not None:
+            self.metrics.observe("serialize", time.time() - start)
+            self.metrics.increment("publish_bytes", len(data))
+
+        return data
+
+    def enable_shared_memory(self, channel, n_slots=None, slot_size=None):
+        """
+        Send the messages on this channel through shared memory to subscribers on the same host. Subscribers only
+        check whether a channel uses shared memory when they subscribe, so enable it before anyone subscribes.
+        :param channel: The redis pubsub channel this SICRedis publishes on.
+        :param n_slots: The number of messages that fit in the shared memory ring buffer.
+        :param slot_size: The maximum size of a message in bytes, larger messages are sent through redis.
+        :return: True if shared memory is used, False if it is not available on this python version.
+        """
+        if not shared_memory_transport.is_available():
+            return False
+
+        if channel not in self._shared_memory_rings:
+            self._shared_memory_rings[channel] = SharedMemoryRing(n_slots, slot_size)
+        self._register_shared_memory(channel)
+        return True
+
+    def _register_shared_memory(self, channel):
+        """
+        Store the host of the publisher of a channel, so subscribers can check if they are on the same host.
+        """
+        self._redis.set(shared_memory_transport.get_registry_key(channel), shared_memory_transport.get_host_id(),
+                        ex=self.SHARED_MEMORY_REGISTRATION_TTL)
+        self._shared_memory_registrations[channel] = time.time()
+
+    def _get_shared_memory_publishers(self, channels):
+        """
+        Check which of the channels are published through shared memory by a publisher on this host. The result is
+        remembered for SHARED_MEMORY_PUBLISHER_INTERVAL seconds, and the other channels are looked up in a single round
+        trip, as components often subscribe to the same channels.
+        :return: set of the channels that are published through shared memory
+        """
+        if not shared_memory_transport.is_available():
+            return set()
+
+        now = time.time()
+        expired = [c for c in channels
+                   if now - self._shared_memory_publishers.get(c, (0, False))[0] > self.SHARED_MEMORY_PUBLISHER_INTERVAL]
+
+        if expired:
+            host_ids = self.get_values([shared_memory_transport.get_registry_key(c) for c in expired])
+            for channel, host_id in zip(expired, host_ids):
+                self._shared_memory_publishers[channel] = (now, host_id == shared_memory_transport.get_host_id())
+
+        return set(c for c in channels if self._shared_memory_publishers[c][1])
+
+    def _get_subscriber_counts(self, channel):
+        """
+        Get the number of subscribers of the shared memory channel and of the channel itself, refreshed every
+        SUBSCRIBER_COUNT_INTERVAL seconds to avoid a round trip to redis for every message.
+        """
+        now = time.time()
+        last_update, shared_memory_subscribers, subscribers = self._subscriber_counts.get(channel, (0, 0, 0))
+
+        if now - last_update > self.SUBSCRIBER_COUNT_INTERVAL:
+            counts = self._redis.pubsub_numsub(shared_memory_transport.get_shared_memory_channel(channel), channel)
+            shared_memory_subscribers, subscribers = counts[0][1], counts[1][1]
+            self._subscriber_counts[channel] = (now, shared_memory_subscribers, subscribers)
+
+        return shared_memory_subscribers, subscribers
+
+    def _send_shared_memory(self, channel, message):
+        """
+        Write the message to shared memory and publish a SharedMemoryDescriptor for the subscribers on this host, and
+        publish the message as usual for the other subscribers. Subscribers that subscribe in between two subscriber
+        count updates might miss the messages sent in the meantime.
+        """
+        if time.time() - self._shared_memory_registrations[channel] > self.SHARED_MEMORY_REGISTRATION_TTL / 2.0:
+            self._register_shared_memory(channel)
+
+        shared_memory_subscribers, subscribers = self._get_subscriber_counts(channel)
+        received = 0
+
+        if shared_memory_subscribers:
+            # local subscribers do not gain anything from JPEG compression, the images are copied in memory anyway
+            data = self._serialize(message, compress_images=False)
+
+            descriptor = self._shared_memory_rings[channel].write(data)
+
+            # messages that do not fit in the ring are sent through redis instead
+            payload = descriptor.serialize() if descriptor is not None else data
+            received += self._redis.publish(shared_memory_transport.get_shared_memory_channel(channel), payload)
+
+        if subscribers:
+            received += self._redis.publish(channel, self._serialize(message))
+
+        return received
+
+    def _read_shared_memory(self, descriptor):
+        """
+        Get the message a SharedMemoryDescriptor refers to.
+        :return: SICMessage, or None if it was already overwritten by newer messages
+        """
+        if self._shared_memory_reader is None:
+            self._shared_memory_reader = shared_memory_transport.SharedMemoryReader()
+
+        data = self._shared_memory_reader.read(descriptor)
+        if data is None:
+            if self.parent_logger:
+                self.parent_logger.debug_framework("Dropped message from shared memory segment {}, it was already "
+                                                   "overwritten".format(descriptor.segment))
+            return None
+
+        return SICMessage.deserialize(data)
 
     def _reply(self, channel, request, reply):
         """
-        Send a reply to a specific request. This is done by sending a SICMessage to the same channel, where
-        the requesting thread/client is waiting for the reply.
+        Send a reply to a specific request. This is done by sending a SICMessage to the reply channel of the
+        requesting client, or to the same channel if the request has no reply channel.
         :param channel: The redis pubsub channel to communicate on.
         :param request: The SICRequest
         :param reply: The SICMessage reply to send back to the requesting client.
         """
         # auto-reply to the request if the request id is not set. Used for example when a service manager
         # does not want to reply to a request, so a reply is returned but its not a reply to the request
+        assert not is_sic_instance(reply, SICRequest) and is_sic_instance(reply, SICMessage), \
+            "Request handler callback must return a SICMessage but not SICRequest, " \
+            "received: {}".format(type(reply))
+
         if reply._request_id is None:
             reply._request_id = request._request_id
-        self.send_message(channel, reply)
+
+        reply_channel = getattr(request, "_reply_channel", None)
+        self.send_message(reply_channel or channel, reply)
+
+    def _get_reply_channel(self):
+        """
+        Get the channel on which this SICRedis receives the replies to all its requests. The channel is subscribed to
+        once, on the first request, and stays subscribed until this SICRedis is closed.
+        :return: channel name
+        """
+        with self._pending_replies_lock:
+            if self._reply_channel is None:
+                channel = "sic:reply:{}".format(utils.str_if_bytes(utils.random_hex()))
+                self._register_message_handler(channel, self._handle_reply, inline=True)
+                self._wait_for_subscription(channel)
+                self._reply_channel = channel
+
+        return self._reply_channel
+
+    def _wait_for_subscription(self, channel, timeout=1):
+        """
+        Subscribing is asynchronous, wait until redis confirms the subscription so a fast reply cannot be missed.
+        """
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self._redis.pubsub_numsub(channel)[0][1] > 0:
+                return
+            time.sleep(0.001)
+
+    def _handle_reply(self, reply):
+        """
+        Hand a reply received on the reply channel to the thread waiting for it.
+        """
+        with self._pending_replies_lock:
+            future = self._pending_replies.pop(reply._request_id, None)
+
+        # a missing future means the request timed out or no reply was expected (e.g. SICIgnoreRequestMessage)
+        if future is not None:
+            future.set_result(reply)
+
+    def _expect_reply(self, request):
+        """
+        Route the reply to this request to a future, which is completed when the reply arrives on the reply channel.
+        :return: SICFuture
+        """
+        request._reply_channel = self._get_reply_channel()
+
+        future = SICFuture()
+        with self._pending_replies_lock:
+            self._pending_replies[request._request_id] = future
+        return future
+
+    def _cancel_reply(self, request):
+        with self._pending_replies_lock:
+            self._pending_replies.pop(request._request_id, None)
 
     def request(self, channel, request, timeout=5, block=True):
         """
-        Send a request, and wait for the reply on the same channel. If the reply takes longer than
+        Send a request, and wait for the reply on the reply channel of this SICRedis. If the reply takes longer than
         `timeout` seconds to arrive, a TimeoutError is raised. If block is set to false, the reply is
         ignored and the function returns immediately.
         :param channel: The redis pubsub channel to communicate on.
@@ -233,78 +598,174 @@ class SICRedis:
         if request._request_id is None:
             raise ValueError("Invalid request id for request {}".format(request.get_message_name()))
 
-        # Set up a callback to listen to the same channel, where we expect the reply.
-        # Once we have the reply the queue passes the data back to this thread and the
-        # event signals we have received the reply. Subscribe first, as to not miss it
-        # if the reply is faster than our subscription.
-        done = threading.Event()
-        q = queue.Queue(1)
-
-        def await_reply(reply):
-            # If not our own request but is a SICMessage with the right id, then it is the reply
-            # we are waiting for
-            if not is_sic_instance(reply, SICRequest) and reply._request_id == request._request_id:
-                q.put(reply)
-                done.set()
-
-        if block:
-            callback_thread = self.register_message_handler(channel, await_reply)
-
-        self.send_message(channel, request)
-
         if not block:
+            self.send_message(channel, request)
             return None
 
-        else:
-
-            done.wait(timeout)
-
-            if not done.is_set():
-                raise TimeoutError("Waiting for reply to {} to request timed out".format(request.get_message_name()))
+        # Register the future before sending, as to not miss the reply if it is faster than this thread.
+        future = self._expect_reply(request)
 
-            # cleanup by unsubscribing and stopping the subscriber thread
-            self.unregister_callback(callback_thread)
+        try:
+            self.send_message(channel, request)
+            return future.result(timeout)
+        except TimeoutError:
+            six.raise_from(
+                TimeoutError("Waiting for reply to {} to request timed out".format(request.get_message_name())), None)
+        finally:
+            self._cancel_reply(request)
+
+    def request_many(self, requests, timeout=5):
+        """
+        Send multiple requests in one redis pipeline, and wait for all replies. The requests are sent in order, so
+        requests on the same channel are handled in order, but requests on different channels may be handled
+        concurrently. Requests on channels that use shared memory are sent as by send_message, outside the pipeline.
+        :param requests: list of (channel, SICRequest) tuples
+        :param timeout: Timeout in seconds for all replies to arrive.
+        :return: list of SICMessage replies, in the same order as the requests
+        """
+        for channel, request in requests:
+            if request._request_id is None:
+                raise ValueError("Invalid request id for request {}".format(request.get_message_name()))
 
-            return q.get()
+        futures = []
+        try:
+            pipeline = self._redis.pipeline(transaction=False)
+            for channel, request in requests:
+                assert isinstance(request, SICMessage), \
+                    "Message must inherit from SICMessage (got {})".format(type(request))
+                futures.append(self._expect_reply(request))
+                if channel in self._shared_memory_rings:
+                    self._send_shared_memory(channel, request)
+                else:
+                    pipeline.publish(channel, self._serialize(request))
+            pipeline.execute()
+
+            deadline = time.time() + timeout
+            replies = []
+            for (channel, request), future in zip(requests, futures):
+                try:
+                    replies.append(future.result(max(0, deadline - time.time())))
+                except TimeoutError:
+                    six.raise_from(TimeoutError("Waiting for reply to {} to request timed out".format(
+                        request.get_message_name())), None)
+            return replies
+        finally:
+            for channel, request in requests:
+                self._cancel_reply(request)
 
     def register_request_handler(self, channel, callback):
         """
         Register a function to listen to SICRequest's (and ignore SICMessages). Handler must return a SICMessage as a reply.
-        Will block receiving new messages until the callback is finished.
+        Will block receiving new messages until the callback is finished, unless the callback returns a SICFuture of the
+        reply, which is sent when the future is done. This way requests that take long do not block other requests.
         :param channel: The redis pubsub channel to communicate on.
-        :param callback: function to run upon receiving a SICRequest. Must return a SICMessage reply
+        :param callback: function to run upon receiving a SICRequest. Must return a SICMessage reply (or a SICFuture)
         """
 
         def wrapped_callback(request):
             if is_sic_instance(request, SICRequest):
                 reply = callback(request)
 
-                assert not is_sic_instance(reply, SICRequest) and is_sic_instance(reply, SICMessage), \
-                    "Request handler callback must return a SICMessage but not SICRequest, " \
-                    "received: {}".format(type(reply))
+                if isinstance(reply, SICFuture):
+                    reply.add_done_callback(lambda future: self._reply_future(channel, request, future))
+                    return
 
                 self._reply(channel, request, reply)
 
         return self.register_message_handler(channel, wrapped_callback, ignore_requests=False)
 
+    def _reply_future(self, channel, request, future):
+        """
+        Send the result of a SICFuture returned by a request handler as reply. Executed by the thread that completes the
+        future.
+        """
+        exception = future.exception()
+        if exception is not None:
+            if self.parent_logger and not self.stopping:
+                self.parent_logger.exception(exception)
+            return
+
+        try:
+            self._reply(channel, request, future.result())
+        except Exception as e:
+            if self.parent_logger and not self.stopping:
+                self.parent_logger.exception(e)
+
     def time(self):
         return self._redis.time()
 
+    def set_value(self, key, value, ttl=None):
+        """
+        Store a string in redis, e.g. for the component registry.
+        :param ttl: the number of seconds after which the key expires, or None to keep it
+        """
+        self._redis.set(key, value, ex=ttl)
+
+    def get_value(self, key):
+        """
+        :return: the string stored at key, or None
+        """
+        value = self._redis.get(key)
+        return utils.str_if_bytes(value) if value is not None else None
+
+    def get_values(self, keys):
+        """
+        Get the strings stored at several keys in a single round trip.
+        :return: list of the strings, or None for keys that do not exist
+        """
+        return [utils.str_if_bytes(value) if value is not None else None for value in self._redis.mget(keys)]
+
+    def delete_value(self, key):
+        self._redis.delete(key)
+
+    def get_keys(self, pattern):
+        """
+        :param pattern: glob-style pattern, e.g. "sic:registry:*"
+        :return: the keys matching the pattern
+        """
+        return [utils.str_if_bytes(key) for key in self._redis.scan_iter(match=pattern)]
+
     def close(self):
         """
         Cleanup function to stop listening to all callback channels and disconnect redis.
         """
         self.stopping = True
         for c in self._running_callbacks:
-            c.pubsub.unsubscribe()
-            c.thread.stop()
+            if c.pubsub is not None:
+                c.pubsub.unsubscribe()
+                c.thread.stop()
+
+        if self._pubsub is not None:
+            try:
+                self._pubsub.close()
+            except Exception:
+                # the dispatcher thread might still be reading from the connection
+                pass
+        for c in self._running_callbacks:
+            if c.worker is not None:
+                c.worker.stop()
+
+        for channel, ring in self._shared_memory_rings.items():
+            try:
+                self._redis.delete(shared_memory_transport.get_registry_key(channel))
+            except Exception:
+                # the registration expires by itself
+                pass
+            ring.close()
+        self._shared_memory_rings = dict()
+
+        if self._shared_memory_reader is not None:
+            self._shared_memory_reader.close()
+
         self._redis.close()
 
     def __del__(self):
         # we can no longer unregister_message_handler as python is shutting down, but we can still stop
         # any remaining threads
+        self.stopping = True
         for c in self._running_callbacks:
-            c.thread.stop()
+            if c.thread is not None:
+                c.thread.stop()
 
     @staticmethod
     def parse_pubsub_message(pubsub_msg):
@@ -0,0 +1,132 @@
+"""
+sic-top: monitor the runtime metrics of all components, on all devices, in the terminal.
+
+Every component publishes its metrics on the metrics channel (see metrics_python2.py), this tool subscribes to that
+channel and shows one row per component with the message rates, drops, queue depth and latency percentiles of the last
+interval, and a total over all components.
+
+Usage:
+    sic-top [--refresh SECONDS]
+"""
+from __future__ import print_function
+
+import argparse
+import threading
+import time
+
+from sic_framework.core.metrics_python2 import LatencyHistogram, get_metrics_channel
+from sic_framework.core.sic_redis import SICRedis
+
+COLUMNS = [("DEVICE", 15), ("PID", 7), ("COMPONENT", 32), ("IN/s", 8), ("OUT/s", 8), ("DROP/s", 8), ("QUEUE", 6),
+           ("ON_MSG p50/p99", 16), ("EXEC p50/p99", 16), ("SER p50", 9), ("DESER p50", 10), ("KB/s", 9)]
+
+
+def _format_row(values):
+    return " ".join(str(value)[:width].ljust(width) for value, (_, width) in zip(values, COLUMNS))
+
+
+def _format_ms(seconds):
+    return "{:.1f}".format(seconds * 1000)
+
+
+def _format_latency(histogram, percentiles=(50, 99)):
+    if histogram is None or not histogram.count:
+        return "-"
+    return "/".join(_format_ms(histogram.percentile(p)) for p in percentiles)
+
+
+class SICTop(object):
+    """
+    Collects the latest metrics of every component.
+    """
+
+    # Seconds after which components that stopped publishing metrics are removed
+    EXPIRE_AFTER = 5
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (ip, pid, component name) -> (receive time, SICMetricsMessage)
+        self._components = dict()
+
+        self.redis = SICRedis(parent_name="sic-top")
+        self.redis.register_message_handler(get_metrics_channel(), self._handle_metrics)
+
+    def _handle_metrics(self, message):
+        with self._lock:
+            self._components[(message.ip, message.pid, message.component_name)] = (time.time(), message)
+
+    def _get_metrics(self):
+        now = time.time()
+        with self._lock:
+            for key, (received, _) in list(self._components.items()):
+                if now - received > self.EXPIRE_AFTER:
+                    del self._components[key]
+
+            return [message for key, (_, message) in sorted(self._components.items())]
+
+    @staticmethod
+    def _get_row(device, pid, name, interval, counters, gauges, histograms):
+        def rate(counter):
+            return "{:.1f}".format(counters.get(counter, 0) / interval) if interval else "-"
+
+        return [device, pid, name, rate("messages_in"), rate("messages_out"), rate("dropped"),
+                gauges.get("queue_depth", 0),
+                _format_latency(histograms.get("on_message")),
+                _format_latency(histograms.get("execute")),
+                _format_latency(histograms.get("serialize"), percentiles=(50,)),
+                _format_latency(histograms.get("deserialize"), percentiles=(50,)),
+                "{:.1f}".format(counters.get("publish_bytes", 0) / 1024.0 / interval) if interval else "-"]
+
+    def render(self):
+        """
+        :return: the table of the metrics of all components, and their total, as a string
+        """
+        lines = [_format_row([title for title, _ in COLUMNS])]
+
+        total_counters = dict()
+        total_gauges = dict()
+        total_histograms = dict()
+
+        for message in self._get_metrics():
+            histograms = dict((name, LatencyHistogram.from_dict(histogram))
+                              for name, histogram in message.histograms.items())
+
+            lines.append(_format_row(self._get_row(message.ip, message.pid, message.component_name, message.interval,
+                                                   message.counters, message.gauges, histograms)))
+
+            # rates are summed, so the counters are normalized to a 1 second interval
+            for name, value in message.counters.items():
+                total_counters[name] = total_counters.get(name, 0) + value / message.interval
+            for name, value in message.gauges.items():
+                total_gauges[name] = total_gauges.get(name, 0) + value
+            for name, histogram in histograms.items():
+                total_histograms.setdefault(name, LatencyHistogram()).merge(histogram)
+
+        lines.append("")
+        lines.append(_format_row(self._get_row("all", "", "{} components".format(len(lines) - 2), 1.0,
+                                               total_counters, total_gauges, total_histograms)))
+        return "\n".join(lines)
+
+    def run(self, refresh=1.0):
+        try:
+            while True:
+                # clear the terminal and move the cursor to the top left
+                print("\033[2J\033[H" + time.strftime("sic-top - %H:%M:%S") + "\n")
+                print(self.render())
+                time.sleep(refresh)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.redis.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monitor the runtime metrics of all SIC components.")
+    parser.add_argument("--refresh", type=float, default=1.0, help="seconds between updates of the table")
+    args = parser.parse_args()
+
+    SICTop().run(refresh=args.refresh)
+
+
+if __name__ == '__main__':
+    main()
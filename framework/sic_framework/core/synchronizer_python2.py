@@ -0,0 +1,271 @@
+"""
+Timestamp based synchronization of the inputs of a SICService.
+
+Every input (a message type from a source component) gets its own buffer, which is kept sorted on the timestamp of the
+messages, so aligned messages can be found with a binary search instead of scanning all buffers. Which messages are
+combined is decided by a synchronization policy:
+
+    nearest:     align all inputs to the newest timestamp for which every input has data, and select the message
+                 closest to it in every buffer (within the window of that input).
+    latest:      use the newest message of every input, regardless of their timestamps.
+    interpolate: like nearest, but the numeric fields of inputs that have messages before and after the selected
+                 timestamp are interpolated to that timestamp (see linear_interpolation).
+"""
+import bisect
+import copy
+import numbers
+import threading
+
+import numpy as np
+
+POLICY_NEAREST = "nearest"
+POLICY_LATEST = "latest"
+POLICY_INTERPOLATE = "interpolate"
+
+POLICIES = (POLICY_NEAREST, POLICY_LATEST, POLICY_INTERPOLATE)
+
+
+class SynchronizationError(ValueError):
+    """
+    Raised when the buffers do not contain an aligned set of messages (yet).
+    """
+
+
+def linear_interpolation(before, after, timestamp):
+    """
+    Create a message at timestamp, with the numeric fields (numbers and one dimensional numeric numpy arrays, e.g.
+    joint angles) linearly interpolated between the messages before and after it. Other fields are copied from the
+    closest message, such as images (blending them would show both frames) and fields that are not decoded yet, which
+    stay undecoded. Private fields (starting with _) are also copied.
+    :param before: message with a timestamp <= timestamp
+    :param after: message with a timestamp >= timestamp
+    :param timestamp: the timestamp to interpolate to
+    :return: a copy of the closest message
+    """
+    duration = after._timestamp - before._timestamp
+    weight = (timestamp - before._timestamp) / float(duration) if duration > 0 else 0.0
+
+    closest = before if weight < .5 else after
+    message = copy.copy(closest)
+
+    # accessing a field that is not decoded yet would decode it, e.g. a JPEG image
+    lazy_fields = set(before._get_lazy_fields()) | set(after._get_lazy_fields())
+
+    for attr in list(vars(closest)):
+        if attr.startswith("_") or attr in lazy_fields:
+            continue
+
+        a, b = before.__dict__.get(attr), after.__dict__.get(attr)
+
+        if isinstance(a, bool) or isinstance(b, bool):
+            continue
+        elif isinstance(a, numbers.Number) and isinstance(b, numbers.Number):
+            setattr(message, attr, a + (b - a) * weight)
+        elif isinstance(a, np.ndarray) and isinstance(b, np.ndarray) and a.ndim == 1 and a.shape == b.shape and \
+                np.issubdtype(a.dtype, np.number):
+            setattr(message, attr, (a + (b.astype(np.float64) - a) * weight).astype(a.dtype))
+
+    message._timestamp = timestamp
+    return message
+
+
+class TimestampBuffer(object):
+    """
+    A bounded buffer of messages of one input, sorted on timestamp. Not thread safe on its own, the SICSynchronizer
+    protects all its buffers with a single lock.
+    """
+
+    def __init__(self, maxlen, logger=None, metrics=None):
+        self.maxlen = maxlen
+        self.logger = logger
+        self.metrics = metrics
+        self.dropped_messages_counter = 0
+
+        # parallel lists, so bisect can search the timestamps directly
+        self._timestamps = []
+        self._messages = []
+
+    def __len__(self):
+        return len(self._messages)
+
+    def insert(self, message):
+        """
+        Insert a message at its timestamp, and drop the oldest message if the buffer is full.
+        """
+        index = bisect.bisect_right(self._timestamps, message._timestamp)
+        self._timestamps.insert(index, message._timestamp)
+        self._messages.insert(index, message)
+
+        if len(self._messages) > self.maxlen:
+            del self._timestamps[0]
+            del self._messages[0]
+            self._log_dropped_message(message)
+
+    def _log_dropped_message(self, message):
+        # TODO when inputs arrive faster than processing, the buffer might fill up. Do we want to handle this better or
+        # just silence the logging. Maybe its better to log only when receiving lots of messages but never executing.
+        self.dropped_messages_counter += 1
+        if self.metrics:
+            self.metrics.increment("dropped")
+        if self.logger and self.dropped_messages_counter in {5, 10, 50, 100, 200, 1000, 5000, 10000}:
+            self.logger.warning("Dropped {} messages of type {}".format(self.dropped_messages_counter,
+                                                                        message.get_message_name()))
+
+    def latest_timestamp(self):
+        return self._timestamps[-1]
+
+    def nearest(self, timestamp, window):
+        """
+        Find the message closest to timestamp.
+        :return: the index of the message, or None if there is no message within window seconds
+        """
+        index = bisect.bisect_left(self._timestamps, timestamp)
+
+        candidates = [i for i in (index - 1, index) if 0 <= i < len(self._timestamps)]
+        if not candidates:
+            return None
+
+        # prefer the newer message if both are equally close
+        best = min(candidates, key=lambda i: (abs(self._timestamps[i] - timestamp), -i))
+        if window is not None and abs(self._timestamps[best] - timestamp) > window:
+            return None
+        return best
+
+    def bracket(self, timestamp, window):
+        """
+        Find the messages directly before and after timestamp.
+        :return: tuple of indices (before, after), or None if there is no message on both sides within window seconds.
+        """
+        after = bisect.bisect_left(self._timestamps, timestamp)
+        before = after - 1
+        if before < 0 or after >= len(self._timestamps):
+            return None
+
+        if window is not None and (timestamp - self._timestamps[before] > window or
+                                   self._timestamps[after] - timestamp > window):
+            return None
+        return before, after
+
+    def get(self, index):
+        return self._messages[index]
+
+    def consume(self, index):
+        """
+        Remove the message at index, and all older messages, as they can no longer be aligned with newer data.
+        """
+        del self._timestamps[:index + 1]
+        del self._messages[:index + 1]
+
+
+class SICSynchronizer(object):
+    """
+    Collects the messages of all inputs of a service, and finds aligned sets of messages. Messages are added and
+    collected from different threads, which is safe as all buffers are protected by a lock.
+    """
+
+    def __init__(self, policy=POLICY_NEAREST, window=.5, windows=None, maxlen=10, logger=None,
+                 interpolate=linear_interpolation, metrics=None):
+        """
+        :param policy: One of POLICIES.
+        :param window: The maximum difference in seconds between the selected timestamp and the messages of an input.
+                       None to allow any difference.
+        :param windows: Windows for specific inputs, as dict of message name or (message name, source component name)
+                        to seconds.
+        :param maxlen: The number of messages buffered per input.
+        :param logger: Logger to warn about dropped messages.
+        :param interpolate: The function that interpolates the messages of an input for the interpolate policy.
+        :param metrics: SICMetrics to count dropped messages.
+        """
+        assert policy in POLICIES, "Unknown synchronization policy {}, use one of {}".format(policy, POLICIES)
+        self.policy = policy
+        self.window = window
+        self.windows = windows or dict()
+        self.maxlen = maxlen
+        self.logger = logger
+        self.interpolate = interpolate
+        self.metrics = metrics
+
+        # (message name, source component name) -> TimestampBuffer
+        self._buffers = dict()
+        self._lock = threading.Lock()
+
+    def get_window(self, key):
+        if key in self.windows:
+            return self.windows[key]
+        return self.windows.get(key[0], self.window)
+
+    def add(self, message):
+        """
+        Add an input message to the buffer of its type and source.
+        """
+        key = (message.get_message_name(), message._previous_component_name)
+
+        with self._lock:
+            buffer = self._buffers.get(key)
+            if buffer is None:
+                buffer = self._buffers[key] = TimestampBuffer(self.maxlen, self.logger, self.metrics)
+            buffer.insert(message)
+
+    def buffer_sizes(self):
+        with self._lock:
+            return dict((key, len(buffer)) for key, buffer in self._buffers.items())
+
+    def pop(self, number_of_inputs):
+        """
+        Collect an aligned set of messages, one of every input, and remove them (and older messages) from the buffers.
+        :param number_of_inputs: The number of inputs the service expects, as buffers are only created once the first
+                                 message of an input arrives.
+        :return: tuple of the list of messages and the selected timestamp
+        :raises: SynchronizationError if the buffers do not contain an aligned set of messages.
+        """
+        with self._lock:
+            buffers = [(key, buffer) for key, buffer in self._buffers.items() if len(buffer)]
+
+            if len(buffers) < len(self._buffers) or not buffers:
+                raise SynchronizationError("Could not collect aligned input data from buffers, not all buffers filled")
+
+            # Buffers are created dynamically, based on the source components. Only start executing once
+            # we have at least one buffer per input
+            if len(self._buffers) != number_of_inputs:
+                raise SynchronizationError("Not enough buffers have been created yet")
+
+            # The oldest of the newest messages of all buffers is the most recent timestamp for which we have all
+            # information available
+            timestamp = min(buffer.latest_timestamp() for key, buffer in buffers)
+
+            if self.policy == POLICY_LATEST:
+                selection = [(buffer, len(buffer) - 1) for key, buffer in buffers]
+                messages = [buffer.get(index) for buffer, index in selection]
+            else:
+                selection, messages = self._select_aligned(buffers, timestamp)
+
+            for buffer, index in selection:
+                buffer.consume(index)
+
+        return messages, timestamp
+
+    def _select_aligned(self, buffers, timestamp):
+        selection = []
+        messages = []
+
+        for key, buffer in buffers:
+            window = self.get_window(key)
+            index = buffer.nearest(timestamp, window)
+
+            if self.policy == POLICY_INTERPOLATE and index is not None and buffer.get(index)._timestamp != timestamp:
+                bracket = buffer.bracket(timestamp, window)
+                if bracket is not None:
+                    before, after = bracket
+                    messages.append(self.interpolate(buffer.get(before), buffer.get(after), timestamp))
+                    # the message after the timestamp might still be needed for the next timestamp
+                    selection.append((buffer, before))
+                    continue
+
+            if index is None:
+                # the timestamps across all buffers did not align within the window, so do not pop messages
+                raise SynchronizationError("Could not collect aligned input data from buffers, no matching timestamps")
+
+            messages.append(buffer.get(index))
+            selection.append((buffer, index))
+
+        return selection, messages
@@ -0,0 +1,290 @@
+"""
+End-to-end latency tracing through chains of components.
+
+A component with TRACE = True (typically a sensor) starts a trace for the messages it outputs. The trace is carried by
+the message in _trace, as a tuple (trace id, spans), and every component (or connector callback) that handles a traced
+message appends its spans and passes the trace on to the messages, requests and replies it sends while handling it.
+A span is a tuple (component name, stage, start, duration), with start the synchronized time of all devices (see
+clock_python2.py) and duration measured with a monotonic clock (if available). The stages are:
+
+    capture:    the execute() of a sensor
+    transport:  from the end of the previous span until the message is received: serialization (including JPEG
+                compression), redis and deserialization. Uses the synchronized clocks of both devices.
+    queue:      waiting to be handled, e.g. in the synchronizer of a service or a conflated input
+    on_message, on_request, execute, callback: handling the message
+
+Each component also publishes the spans it added on the trace channel, where the SICTraceCollector reconstructs the
+traces, also of chains that end in a component that does not output anything (e.g. camera -> face detection ->
+connector callback -> motion request).
+"""
+from __future__ import print_function
+
+import collections
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from . import clock_python2 as clock
+from .message_python2 import SICMessage
+from .sic_redis import SICRedis
+
+try:
+    _monotonic = time.monotonic
+except AttributeError:
+    # python 2
+    _monotonic = time.time
+
+
+def get_trace_channel():
+    """
+    Get the global trace channel. All components on any device publish their spans to this channel.
+    """
+    return "sic:traces"
+
+
+class SICTraceMessage(SICMessage):
+    def __init__(self, trace_id, spans):
+        """
+        The spans a component added to a trace.
+        :param trace_id: the id of the trace
+        :param spans: list of (component name, stage, start, duration)
+        """
+        self.trace_id = trace_id
+        self.spans = spans
+
+
+def new_trace():
+    return uuid.uuid4().hex[:16], []
+
+
+def get_trace_start(trace):
+    _, spans = trace
+    return spans[0][2] if spans else None
+
+
+def get_trace_end(trace):
+    _, spans = trace
+    if not spans:
+        return None
+    _, _, start, duration = spans[-1]
+    return start + duration
+
+
+def add_span(trace, component_name, stage, start, duration):
+    """
+    :return: a new trace with the span added, the spans of a trace are never changed as they may be shared by messages
+    """
+    trace_id, spans = trace
+    return trace_id, spans + [(component_name, stage, start, duration)]
+
+
+def add_transport_span(trace, component_name):
+    """
+    Add the time since the end of the trace, for a traced message that was just received.
+    """
+    end = get_trace_end(trace)
+    received = clock.get_timestamp()
+    if end is None:
+        return trace
+    return add_span(trace, component_name, "transport", end, received - end)
+
+
+def get_oldest_trace(traces):
+    """
+    :return: the trace that started first, which is the critical path of a component that combines several inputs
+    """
+    traces = [trace for trace in traces if trace is not None and trace[1]]
+    if not traces:
+        return None
+    return min(traces, key=get_trace_start)
+
+
+def get_hop(component_name, trace):
+    """
+    Get the spans a component added to a trace, i.e. the spans at the end of the trace with its name.
+    :return: SICTraceMessage to publish on the trace channel, or None if the component added no spans
+    """
+    trace_id, spans = trace
+    index = len(spans)
+    while index > 0 and spans[index - 1][0] == component_name:
+        index -= 1
+
+    if index < len(spans):
+        return SICTraceMessage(trace_id, spans[index:])
+    return None
+
+
+def publish_hop(redis, component_name, trace):
+    """
+    Publish the spans a component added to a trace (see get_hop).
+    """
+    hop = get_hop(component_name, trace)
+    if hop is not None:
+        redis.send_message(get_trace_channel(), hop)
+
+
+_context = threading.local()
+
+
+def get_current_trace():
+    """
+    :return: the trace of the message the current thread is handling (including the handling so far), or None
+    """
+    span = getattr(_context, "span", None)
+    return span.get_trace() if span is not None else None
+
+
+class SICSpan(object):
+    """
+    The handling of a traced message by a component, used as a context manager:
+
+        with SICSpan(redis, "MyComponent", "on_message", message._trace):
+            self.on_message(message)
+
+    The time between the end of the trace and the start of the span is added as a queue span. While the span is
+    active, it is the current span of the thread, so messages sent from the handler continue the trace (see
+    get_current_trace). The span ends when the first message continuing the trace is sent, or when the handler returns.
+    Afterwards, the spans of this hop are published on the trace channel. Does nothing if trace is None.
+    """
+
+    def __init__(self, redis, component_name, stage, trace):
+        self.redis = redis
+        self.component_name = component_name
+        self.stage = stage
+        self.trace = trace
+
+        self._start = None
+        self._start_monotonic = None
+        self._duration = None
+        self._previous_span = None
+
+    def __enter__(self):
+        self._previous_span = getattr(_context, "span", None)
+        _context.span = self
+
+        if self.trace is not None:
+            self._start = clock.get_timestamp()
+            self._start_monotonic = _monotonic()
+
+            end = get_trace_end(self.trace)
+            if end is not None:
+                self.trace = add_span(self.trace, self.component_name, "queue", end, max(self._start - end, 0.0))
+        return self
+
+    def get_trace(self):
+        """
+        :return: the trace including this span, or None if the message was not traced
+        """
+        if self.trace is None:
+            return None
+
+        if self._duration is None:
+            self._duration = _monotonic() - self._start_monotonic
+        return add_span(self.trace, self.component_name, self.stage, self._start, self._duration)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _context.span = self._previous_span
+
+        if self.trace is not None:
+            publish_hop(self.redis, self.component_name, self.get_trace())
+
+
+class SICTraceCollector(object):
+    """
+    Reconstruct traces from the spans published by all components, and compute latency breakdowns and percentiles.
+
+    Example:
+        collector = SICTraceCollector()
+        time.sleep(10)
+        print(collector.report())
+    """
+
+    # The number of most recent traces that are kept
+    MAX_TRACES = 1000
+
+    def __init__(self, redis=None):
+        self._lock = threading.Lock()
+        # trace id -> list of spans, in the order the traces were last updated
+        self._traces = collections.OrderedDict()
+
+        self.redis = redis if redis is not None else SICRedis(parent_name="SICTraceCollector")
+        self.redis.register_message_handler(get_trace_channel(), self._handle_spans)
+
+    def _handle_spans(self, message):
+        with self._lock:
+            spans = self._traces.pop(message.trace_id, [])
+            spans.extend(message.spans)
+            self._traces[message.trace_id] = spans
+
+            while len(self._traces) > self.MAX_TRACES:
+                self._traces.popitem(last=False)
+
+    def get_trace_ids(self):
+        with self._lock:
+            return list(self._traces)
+
+    def get_spans(self, trace_id):
+        """
+        :return: the spans of a trace, ordered by their start time
+        """
+        with self._lock:
+            return sorted(self._traces.get(trace_id, []), key=lambda span: span[2])
+
+    def breakdown(self, trace_id):
+        """
+        :return: tuple of the list of (component name, stage, duration) in the order of the trace, and the total
+                 latency from the start of the first span to the end of the last span
+        """
+        spans = self.get_spans(trace_id)
+        if not spans:
+            return [], 0.0
+
+        total = max(start + duration for _, _, start, duration in spans) - spans[0][2]
+        return [(component_name, stage, duration) for component_name, stage, _, duration in spans], total
+
+    def percentiles(self, percentages=(50, 90, 99)):
+        """
+        The latency percentiles of every stage of every component, and of the total latency, over all collected traces.
+        :return: OrderedDict of (component name, stage) -> list of seconds per percentage, ordered by the start of the
+                 first occurrence of the stage. The total latency has the key ("total", "").
+        """
+        durations = collections.OrderedDict()
+        totals = []
+
+        for trace_id in self.get_trace_ids():
+            breakdown, total = self.breakdown(trace_id)
+            for component_name, stage, duration in breakdown:
+                durations.setdefault((component_name, stage), []).append(duration)
+            if breakdown:
+                totals.append(total)
+
+        durations[("total", "")] = totals
+
+        return collections.OrderedDict((key, list(np.percentile(values, percentages)) if values else [])
+                                       for key, values in durations.items())
+
+    def report(self, percentages=(50, 90, 99)):
+        """
+        :return: a table of the latency percentiles of all stages, as a string
+        """
+        lines = ["{:<32} {:<12} {}".format("COMPONENT", "STAGE", " ".join("p{:<8}".format(p) for p in percentages))]
+        for (component_name, stage), values in self.percentiles(percentages).items():
+            lines.append("{:<32} {:<12} {}".format(component_name[:32], stage,
+                                                    " ".join("{:<9.1f}".format(v * 1000) for v in values)))
+        return "\n".join(lines)
+
+    def close(self):
+        self.redis.close()
+
+
+if __name__ == '__main__':
+    collector = SICTraceCollector()
+    try:
+        while True:
+            time.sleep(2)
+            print("\033[2J\033[H" + "Latency of {} traces (ms)\n".format(len(collector.get_trace_ids())))
+            print(collector.report())
+    except KeyboardInterrupt:
+        collector.close()
@@ -0,0 +1,262 @@
+"""
+Small thread pool primitives that work on both python 2 (robots) and python 3, as concurrent.futures is not available
+on the robots.
+"""
+import threading
+import time
+
+from six.moves import queue
+
+try:
+    TimeoutError = TimeoutError
+except NameError:
+    # python 2 has no TimeoutError, import it from this module where it is raised or caught
+    class TimeoutError(Exception):
+        pass
+
+
+class SICFuture(object):
+    """
+    The result of an asynchronous computation, which can be waited for by other threads.
+    """
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+
+    def done(self):
+        return self._done.is_set()
+
+    def set_result(self, result):
+        self._set(result, None)
+
+    def set_exception(self, exception):
+        self._set(None, exception)
+
+    def _set(self, result, exception):
+        with self._lock:
+            if self._done.is_set():
+                return
+            self._result = result
+            self._exception = exception
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback):
+        """
+        Call callback(future) when the future is done, or immediately if it is already done. The callback is executed
+        by the thread that completes the future.
+        """
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def wait(self, timeout=None):
+        """
+        Wait until the future is done.
+        :return: True if the future is done, False if the timeout expired.
+        """
+        return self._done.wait(timeout)
+
+    def result(self, timeout=None):
+        """
+        Wait for the result of the computation, and raise its exception if it failed.
+        :param timeout: seconds to wait at most, or None to wait forever.
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError("Future did not complete within {} seconds".format(timeout))
+
+        if self._exception is not None:
+            raise self._exception
+
+        return self._result
+
+    def exception(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError("Future did not complete within {} seconds".format(timeout))
+
+        return self._exception
+
+
+_STOP = object()
+
+
+class _Worker(object):
+    def __init__(self, name, exception_handler):
+        self.queue = queue.Queue()
+        self.exception_handler = exception_handler
+        # whether the worker is executing work, which is no longer in the queue
+        self.busy = False
+        self.thread = threading.Thread(target=self._run, name=name)
+        # the pool is stopped explicitly by its owner, do not keep the program alive because of it
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            work = self.queue.get()
+            if work is _STOP:
+                break
+
+            future, function, args, kwargs = work
+            self.busy = True
+            try:
+                future.set_result(function(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+                if self.exception_handler:
+                    self.exception_handler(e)
+            finally:
+                self.busy = False
+
+
+class SICWorkerPool(object):
+    """
+    A bounded pool of worker threads. Each worker has its own queue, so work submitted to the same worker index is
+    executed in order, one at a time. Workers are only started when work is first submitted to them.
+    """
+
+    def __init__(self, max_workers, name="SICWorkerPool", exception_handler=None):
+        """
+        :param max_workers: The maximum number of threads in this pool.
+        :param name: The name prefix for the worker threads, to help debugging.
+        :param exception_handler: Optional function called with any exception raised by submitted work.
+        """
+        assert max_workers > 0, "A worker pool needs at least one worker"
+        self.max_workers = max_workers
+        self.name = name
+        self.exception_handler = exception_handler
+
+        self._workers = [None] * max_workers
+        self._lock = threading.Lock()
+        self._stopped = False
+
+    def _get_worker(self, index):
+        index = index % self.max_workers
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError("Cannot submit work to stopped pool {}".format(self.name))
+
+            if self._workers[index] is None:
+                self._workers[index] = _Worker("{}_{}".format(self.name, index), self.exception_handler)
+            return self._workers[index]
+
+    def submit_to(self, index, function, *args, **kwargs):
+        """
+        Execute function(*args, **kwargs) on the worker with the given index (modulo the pool size).
+        :return: SICFuture
+        """
+        future = SICFuture()
+        self._get_worker(index).queue.put((future, function, args, kwargs))
+        return future
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Execute function(*args, **kwargs) on the worker with the shortest queue (including the work it is executing).
+        :return: SICFuture
+        """
+        with self._lock:
+            queue_sizes = [w.queue.qsize() + w.busy if w is not None else 0 for w in self._workers]
+        index = queue_sizes.index(min(queue_sizes))
+        return self.submit_to(index, function, *args, **kwargs)
+
+    def num_threads(self):
+        with self._lock:
+            return len([w for w in self._workers if w is not None])
+
+    def stop(self):
+        """
+        Stop all workers after they finish the work that was already submitted.
+        """
+        with self._lock:
+            self._stopped = True
+            workers = [w for w in self._workers if w is not None]
+
+        for worker in workers:
+            worker.queue.put(_STOP)
+
+
+class SICLatestValue(object):
+    """
+    A slot that only holds the newest value put into it. Putting a value replaces the value that was not taken yet,
+    so a slow consumer always gets the most recent value instead of working through a backlog. Keeps track of the
+    number of dropped values and how long values waited in the slot (staleness).
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._value = None
+        self._has_value = False
+        self._put_time = None
+
+        self.dropped = 0
+        self.taken = 0
+        self.total_staleness = 0.0
+        self.max_staleness = 0.0
+
+    def put(self, value):
+        """
+        Store a value, replacing the previous value if it was not taken yet.
+        :return: True if a value was dropped.
+        """
+        with self._condition:
+            dropped = self._has_value
+            if dropped:
+                self.dropped += 1
+
+            self._value = value
+            self._has_value = True
+            self._put_time = time.time()
+            self._condition.notify()
+
+        return dropped
+
+    def get(self, timeout=None):
+        """
+        Take the newest value, waiting for one if the slot is empty.
+        :param timeout: seconds to wait at most, or None to wait forever.
+        :raises: queue.Empty if no value was put within the timeout.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+
+        with self._condition:
+            while not self._has_value:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty
+                self._condition.wait(remaining)
+
+            value = self._value
+            staleness = time.time() - self._put_time
+            self._value = None
+            self._has_value = False
+
+            self.taken += 1
+            self.total_staleness += staleness
+            self.max_staleness = max(self.max_staleness, staleness)
+
+        return value
+
+    def empty(self):
+        with self._condition:
+            return not self._has_value
+
+    def stats(self):
+        """
+        :return: dict with the number of dropped and taken values, and the mean and max seconds values waited.
+        """
+        with self._condition:
+            return {
+                "dropped": self.dropped,
+                "taken": self.taken,
+                "mean_staleness": self.total_staleness / self.taken if self.taken else 0.0,
+                "max_staleness": self.max_staleness,
+            }
@@ -1,2 +1,3 @@
 from .pepper import Pepper
 from .nao import Nao
+from .device_group import SICDeviceGroup
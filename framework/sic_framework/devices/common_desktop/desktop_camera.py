@@ -1,4 +1,5 @@
 import platform
+import time
 
 import cv2
 
@@ -9,7 +10,7 @@ from sic_framework.core.sensor_python2 import SICSensor
 
 
 class DesktopCameraConf(SICConfMessage):
-    def __init__(self, fx=1.0, fy=1.0, flip=None, device_id=0):
+    def __init__(self, fx=1.0, fy=1.0, flip=None, device_id=0, fps=30):
         """
         Sets desktop camera configuration parameters.
 
@@ -17,6 +18,7 @@ class DesktopCameraConf(SICConfMessage):
         :param fx: rescaling factor along x-axis (float)
         :param fy: rescaling factor along y-axis (float)
         :param device_id: The device ID of the camera for OpenCV to use. Default: 0
+        :param fps: The number of frames per second to publish, or None to publish as fast as frames are read.
 
         See https://docs.opencv.org/3.4/d2/de8/group__core__array.html#gaca7be533e3dac7feb70fc60635adf441
         :param flip: flip code for vertical (0), horizontal (>0), or both (<0) flipping. Default is None (no flipping)
@@ -27,9 +29,12 @@ class DesktopCameraConf(SICConfMessage):
         self.fx = fx
         self.fy = fy
         self.flip = flip
+        self.fps = fps
 
 
 class DesktopCameraSensor(SICSensor):
+    SHARED_MEMORY_TRANSPORT = True
+
     def __init__(self, *args, **kwargs):
         super(DesktopCameraSensor, self).__init__(*args, **kwargs)
         if platform.system() == "Windows":
@@ -41,6 +46,9 @@ class DesktopCameraSensor(SICSensor):
     def get_conf():
         return DesktopCameraConf()
 
+    def _get_target_rate(self):
+        return self.params.fps
+
     @staticmethod
     def get_inputs():
         return []
@@ -51,6 +59,7 @@ class DesktopCameraSensor(SICSensor):
 
     def execute(self):
         ret, frame = self.cam.read()
+        capture_time = time.time()
         frame = cv2.resize(frame, (0, 0), fx=self.params.fx, fy=self.params.fy)
 
         # Optionally flip image
@@ -60,7 +69,9 @@ class DesktopCameraSensor(SICSensor):
         if not ret:
             self.logger.warning("Failed to grab frame from video device")
 
-        return CompressedImageMessage(frame)
+        message = CompressedImageMessage(frame)
+        message._timestamp = self._get_capture_timestamp(capture_time)
+        return message
 
     def stop(self, *args):
         super(DesktopCameraSensor, self).stop(*args)
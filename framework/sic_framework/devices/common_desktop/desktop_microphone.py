@@ -1,3 +1,5 @@
+import time
+
 import pyaudio
 
 from sic_framework import SICComponentManager
@@ -43,8 +45,13 @@ class DesktopMicrophoneSensor(SICSensor):
     def execute(self):
         self.logger.debug("Reading audio")
         # read 250ms chunks
-        data = self.stream.read(int(self.params.sample_rate // 4))
-        return AudioMessage(data, sample_rate=self.params.sample_rate)
+        n_samples = int(self.params.sample_rate // 4)
+        data = self.stream.read(n_samples)
+
+        message = AudioMessage(data, sample_rate=self.params.sample_rate)
+        # the chunk was captured starting from the time it took to record before the read returned
+        message._timestamp = self._get_capture_timestamp(time.time() - float(n_samples) / self.params.sample_rate)
+        return message
 
     def stop(self, *args):
         super(DesktopMicrophoneSensor, self).stop(*args)
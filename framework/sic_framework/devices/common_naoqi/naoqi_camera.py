@@ -131,7 +131,11 @@ class BaseNaoqiCameraSensor(SICSensor):
 
         # Create a PIL Image from our pixel array.
         im = Image.frombytes("RGB", (imageWidth, imageHeight), image_string)
-        return CompressedImageMessage(np.asarray(im))
+        message = CompressedImageMessage(np.asarray(im))
+
+        # the time the image was captured, in seconds and microseconds
+        message._timestamp = self._get_capture_timestamp(naoImage[4] + naoImage[5] / 1e6)
+        return message
 
     def stop(self, *args):
         super(BaseNaoqiCameraSensor, self).stop(*args)
@@ -179,6 +183,7 @@ class NaoqiBottomCamera(SICConnector):
 
 class StereoImageMessage(SICMessage):
     _compress_images = True
+    _binary_serialization = True
 
     def __init__(self, left, right):
         self.left_image = left
@@ -232,7 +237,8 @@ class StereoPepperCameraSensor(BaseNaoqiCameraSensor):
 
     def execute(self):
         # Get the regular stereo image
-        img_message = super(StereoPepperCameraSensor, self).execute().image
+        stereo_message = super(StereoPepperCameraSensor, self).execute()
+        img_message = stereo_message.image
 
         if self.params.convert_bw:
             img_message = cv2.cvtColor(img_message, cv2.COLOR_BGR2GRAY)
@@ -245,7 +251,9 @@ class StereoPepperCameraSensor(BaseNaoqiCameraSensor):
             left = self.rectify(left, is_left=True)
             right = self.rectify(right, is_left=False)
 
-        return StereoImageMessage(left, right)
+        message = StereoImageMessage(left, right)
+        message._timestamp = stereo_message._timestamp
+        return message
 
     @staticmethod
     def get_output():
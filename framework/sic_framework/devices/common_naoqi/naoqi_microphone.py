@@ -60,7 +60,13 @@ class NaoqiMicrophoneSensor(SICSensor):
         self.new_sound_data_available.wait()
         self.new_sound_data_available.clear()
 
-        return AudioMessage(self.audio_buffer, sample_rate=self.params.sample_rate)
+        # the buffer and its timestamp are set together, so they always belong to each other
+        audio_buffer, naoqi_timestamp = self.audio_data
+
+        message = AudioMessage(audio_buffer, sample_rate=self.params.sample_rate)
+        # the time the buffer was captured, as [seconds, microseconds]
+        message._timestamp = self._get_capture_timestamp(naoqi_timestamp[0] + naoqi_timestamp[1] / 1e6)
+        return message
 
     def stop(self, *args):
         self.audio_service.unsubscribe(self.module_name)
@@ -76,8 +82,7 @@ class NaoqiMicrophoneSensor(SICSensor):
         :param timeStamp:
         :param inputBuffer:
         """
-        self.audio_buffer = inputBuffer
-        self.naoqi_timestamp = timeStamp
+        self.audio_data = (inputBuffer, timeStamp)
         self.new_sound_data_available.set()
 
 
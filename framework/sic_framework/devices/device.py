@@ -1,20 +1,30 @@
 from __future__ import print_function
 
+import collections
+import contextlib
+import hashlib
+import io
+import json
 import os.path
 import tarfile
-import tempfile
+import threading
 import time
 
 import six
+from six.moves import shlex_quote
 
 from sic_framework.core import utils
 from sic_framework.core.connector import SICConnector
+from sic_framework.core.worker_pool_python2 import SICWorkerPool, TimeoutError
 
 if six.PY3:
     import paramiko
     import pathlib
-    from scp import SCPClient
 
+# the content hashes of the installed files, and the libraries known to be installed, in the framework folder on the
+# device
+_MANIFEST = ".sic_manifest.json"
+_LIBRARY_INVENTORY = ".sic_libraries"
 
 
 class _SICLibrary(object):
@@ -62,12 +72,8 @@ _LIBS_TO_INSTALL = [
     _SICLibrary("sic-framework", "~/framework", "pip install --user -e .")
 ]
 
-def exclude_pyc(tarinfo):
-    if tarinfo.name.endswith(".pyc"):
-        return None
-    else:
-        return tarinfo
-
+def _is_excluded(path):
+    return path.endswith(".pyc") or "__pycache__" in path.split("/")
 
 
 class SICDevice(object):
@@ -87,6 +93,13 @@ class SICDevice(object):
         self.configs = dict()
         self.ip = ip
 
+        # connector class -> lock, so a connector is created once when it is used by several threads
+        self._connector_locks = dict()
+        self._connector_locks_lock = threading.Lock()
+
+        # stage -> seconds it took to bring up the device, e.g. "ssh", "auto_install" or "connect NaoqiTopCamera"
+        self.timings = collections.OrderedDict()
+
         if username is not None:
 
             if not isinstance(passwords, list):
@@ -96,46 +109,73 @@ class SICDevice(object):
                 raise RuntimeError(
                     "Could not connect to device on ip {}. Please check if it is reachable.".format(self.ip))
 
-            self.ssh = paramiko.SSHClient()
-            self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            # allow_agent=False, look_for_keys=False to disable asking for keyring (just use the password)
-            for p in passwords:
-                try:
-                    self.ssh.connect(self.ip, port=22, username=username, password=p, timeout=3, allow_agent=False,
-                                     look_for_keys=False)
-                    break
-                except (paramiko.ssh_exception.AuthenticationException, paramiko.ssh_exception.BadAuthenticationType):
-                    pass
-            else:
-                raise paramiko.ssh_exception.AuthenticationException(
-                    "Could not authenticate to device, please check ip adress and/or credentials. (Username: {} Passwords: {})".format(
-                        username, passwords))
+            with self._timed("ssh"):
+                self.ssh = paramiko.SSHClient()
+                self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+                # allow_agent=False, look_for_keys=False to disable asking for keyring (just use the password)
+                for p in passwords:
+                    try:
+                        self.ssh.connect(self.ip, port=22, username=username, password=p, timeout=3,
+                                         allow_agent=False, look_for_keys=False)
+                        break
+                    except (paramiko.ssh_exception.AuthenticationException,
+                            paramiko.ssh_exception.BadAuthenticationType):
+                        pass
+                else:
+                    raise paramiko.ssh_exception.AuthenticationException(
+                        "Could not authenticate to device, please check ip adress and/or credentials. (Username: {} Passwords: {})".format(
+                            username, passwords))
+
+    @contextlib.contextmanager
+    def _timed(self, stage):
+        """
+        Record the time a stage of bringing up the device takes in self.timings.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.timings[stage] = time.time() - start
 
-    def get_last_modified(self, root, paths):
-        last_modified = 0
+    def get_manifest(self, root, paths):
+        """
+        Get the content hashes of the files to install on the device.
+        :param root: the framework root folder
+        :param paths: the files and folders to install, relative to root
+        :return: dict of the path of every file, relative to root, to the sha1 hash of its content
+        """
+        manifest = dict()
 
         for file_or_folder in paths:
             file_or_folder = root + file_or_folder
             if os.path.isdir(file_or_folder):
-                sub_last_modified = max(os.path.getmtime(root) for root, _, _ in os.walk(file_or_folder))
-                last_modified = max(sub_last_modified, last_modified)
+                files = [os.path.join(folder, name) for folder, _, names in os.walk(file_or_folder) for name in names]
             elif os.path.isfile(file_or_folder):
-                last_modified = max(os.path.getmtime(file_or_folder), last_modified)
+                files = [file_or_folder]
+            else:
+                continue
+
+            for file in files:
+                path = os.path.relpath(file, root).replace(os.sep, "/")
+                if _is_excluded(path):
+                    continue
+                with open(file, "rb") as f:
+                    manifest[path] = hashlib.sha1(f.read()).hexdigest()
 
-        assert last_modified > 0, "Could not find any files to transfer."
-        last_modified = time.ctime(last_modified).replace(" ", "_").replace(":", "-")
-        return last_modified
+        assert len(manifest) > 0, "Could not find any files to transfer."
+        return manifest
 
     def auto_install(self):
         """
-        Install the SICFramework on the device.
+        Install the SICFramework on the device. Only the files that changed since the last install are transferred,
+        based on a manifest of the content hashes of the installed files that is kept on the device.
         :return:
         """
         # Find framework root folder
         root = str(pathlib.Path(__file__).parent.parent.parent.resolve())
         assert os.path.basename(root) == "framework", "Could not find SIC 'framework' directory."
 
-        # List of selected files and directories to be zipped and transferred
+        # List of selected files and directories to be transferred
         selected_files = [
             "/setup.py",
             "/conf",
@@ -145,68 +185,105 @@ class SICDevice(object):
             "/sic_framework/__init__.py",
         ]
 
+        manifest = self.get_manifest(root, selected_files)
 
-        last_modified = self.get_last_modified(root, selected_files)
-
-        # Create a signature for the framework
-        framework_signature = "~/framework/sic_version_signature_{}_{}".format(utils.get_ip_adress(), last_modified)
+        try:
+            remote_manifest = json.loads(self._read_remote_file(_MANIFEST))
+        except ValueError:
+            # nothing installed yet, or installed by a version without a manifest
+            remote_manifest = dict()
 
-        # Check if the framework signature file exists
-        stdin, stdout, stderr = self.ssh.exec_command('ls {}'.format(framework_signature))
-        file_exists = len(stdout.readlines()) > 0
+        changed = sorted(path for path, file_hash in manifest.items() if remote_manifest.get(path) != file_hash)
+        deleted = sorted(path for path in remote_manifest if path not in manifest)
 
-        if file_exists:
+        if not changed and not deleted:
             print("Up to date framework is installed on the remote device.")
             return
 
-        # prefetch slow pip freeze command
-        _, stdout_pip_freeze, _ = self.ssh.exec_command("pip freeze")
-
-        def progress(filename, size, sent):
-            print("\r {} progress: {}".format(filename.decode("utf-8"), round(float(sent) / float(size) * 100, 2)),
-                  end="")
-
-        print("Copying framework to the remote device.")
-        with SCPClient(self.ssh.get_transport(), progress=progress) as scp:
+        print("Updating the framework on the remote device ({} changed, {} removed files).".format(len(changed),
+                                                                                                  len(deleted)))
+        self._sync_files(root, changed, deleted)
 
-            # Copy the framework to the remote computer
-            with tempfile.NamedTemporaryFile(suffix='_sic_files.tar.gz', delete=False) as f:
-                with tarfile.open(fileobj=f, mode='w:gz') as tar:
-                    for file in selected_files:
-                        tar.add(root + file, arcname=file, filter=exclude_pyc)
+        # the framework is installed with pip install -e, which only needs to be redone if the setup changed
+        self._install_libraries(reinstall_framework="setup.py" in changed)
 
-                f.flush()
-                self.ssh.exec_command("mkdir ~/framework")
-                scp.put(f.name, remote_path="~/framework/sic_files.tar.gz")
-                print()  # newline after progress bar
-            # delete=False for windows compatibility, must delete file manually
-            os.unlink(f.name)
+        # the manifest is written last, so an interrupted install is completed the next time
+        self._write_remote_file(_MANIFEST, json.dumps(manifest, sort_keys=True))
 
-            # Unzip the file on the remote server
-            # use --touch to prevent files from having timestamps of 1970 which intefere with python caching
-            stdin, stdout, stderr = self.ssh.exec_command("cd framework && tar --touch -xvf sic_files.tar.gz")
+    def _sync_files(self, root, changed, deleted):
+        """
+        Transfer the changed files in a single compressed tar stream, and remove the deleted files.
+        :param changed: the paths of the files to transfer, relative to root
+        :param deleted: the paths of the files to remove on the device
+        """
+        data = io.BytesIO()
+        with tarfile.open(fileobj=data, mode='w:gz') as tar:
+            for path in changed:
+                tar.add(os.path.join(root, path), arcname=path)
+        data = data.getvalue()
+
+        commands = ["mkdir -p ~/framework", "cd ~/framework",
+                    # signature files of versions that did not use a manifest
+                    "rm -f sic_version_signature_*"]
+        if deleted:
+            commands.append("rm -f " + " ".join(shlex_quote(path) for path in deleted))
+        # use --touch to prevent files from having timestamps of 1970 which intefere with python caching
+        commands.append("tar --touch -xzf -")
+
+        stdin, stdout, stderr = self.ssh.exec_command(" && ".join(commands))
+
+        chunk_size = 64 * 1024
+        for sent in range(0, len(data), chunk_size):
+            stdin.write(data[sent:sent + chunk_size])
+            print("\r sic_files.tar.gz progress: {}".format(
+                round(float(min(sent + chunk_size, len(data))) / len(data) * 100, 2)), end="")
+        print()  # newline after progress bar
+        stdin.channel.shutdown_write()
+
+        if stdout.channel.recv_exit_status() != 0:
+            print("".join(stderr.readlines()))
+            raise RuntimeError(
+                "\n\nError while extracting library on remote device. Please consult manual installation instructions.")
 
-            err = stderr.readlines()
-            if len(err) > 0:
-                print("".join(err))
-                raise RuntimeError(
-                    "\n\nError while extracting library on remote device. Please consult manual installation instructions.")
+    def _install_libraries(self, reinstall_framework=False):
+        """
+        Install the libraries that are not installed on the device. The installed libraries are cached in an inventory
+        on the device, so the slow pip freeze only runs when a library is missing from it (e.g. on the first install).
+        :param reinstall_framework: install the sic-framework library again, e.g. because its setup.py changed
+        """
+        installed = self._read_remote_file(_LIBRARY_INVENTORY).split()
+        unknown = [lib for lib in _LIBS_TO_INSTALL if lib.name not in installed]
 
-            # Remove the zipped file
-            self.ssh.exec_command("rm ~/framework/sic_files.tar.gz")
+        remote_libs = []
+        if unknown:
+            print("Checking if libraries are installed on the remote device.")
+            _, stdout_pip_freeze, _ = self.ssh.exec_command("pip freeze")
+            remote_libs = stdout_pip_freeze.readlines()
 
-        # Check and/or install the framework and libraries on the remote computer
-        print("Checking if libraries are installed on the remote device.")
-        # stdout_pip_freeze is prefetched above because it is slow
-        remote_libs = stdout_pip_freeze.readlines()
         for lib in _LIBS_TO_INSTALL:
-            if not lib.check_if_installed(remote_libs):
+            if lib in unknown and not lib.check_if_installed(remote_libs):
+                lib.install(self.ssh)
+            elif reinstall_framework and lib.name == "sic-framework":
                 lib.install(self.ssh)
 
-        # Remove signatures from the remote computer
-        # add own signature to the remote computer
-        self.ssh.exec_command('rm ~/framework/sic_version_signature_*')
-        self.ssh.exec_command('touch {}'.format(framework_signature))
+        if unknown:
+            self._write_remote_file(_LIBRARY_INVENTORY, "\n".join(lib.name for lib in _LIBS_TO_INSTALL) + "\n")
+
+    def _read_remote_file(self, name):
+        """
+        :param name: the name of the file in the framework folder on the device
+        :return: the content of the file, or an empty string if it does not exist
+        """
+        _, stdout, _ = self.ssh.exec_command("cat ~/framework/{} 2>/dev/null".format(name))
+        return stdout.read().decode("utf-8")
+
+    def _write_remote_file(self, name, content):
+        stdin, stdout, stderr = self.ssh.exec_command("cat > ~/framework/{}".format(name))
+        stdin.write(content)
+        stdin.channel.shutdown_write()
+
+        if stdout.channel.recv_exit_status() != 0:
+            raise RuntimeError("Could not write {} on the remote device: {}".format(name, "".join(stderr.readlines())))
 
     def _get_connector(self, component_connector):
         """
@@ -218,16 +295,43 @@ class SICDevice(object):
 
         assert issubclass(component_connector, SICConnector), "Component connector must be a SICConnector"
 
-        if component_connector not in self.connectors:
-            conf = self.configs.get(component_connector, None)
+        with self._connector_locks_lock:
+            lock = self._connector_locks.setdefault(component_connector, threading.Lock())
+
+        with lock:
+            if component_connector not in self.connectors:
+                conf = self.configs.get(component_connector, None)
 
-            try:
-                self.connectors[component_connector] = component_connector(self.ip, conf=conf)
-            except TimeoutError as e:
-                raise TimeoutError("Could not connect to {} on device {}.".format(
-                    component_connector.component_class.get_component_name(), self.ip))
+                try:
+                    with self._timed("connect {}".format(component_connector.__name__)):
+                        self.connectors[component_connector] = component_connector(self.ip, conf=conf)
+                except TimeoutError as e:
+                    raise TimeoutError("Could not connect to {} on device {}.".format(
+                        component_connector.component_class.get_component_name(), self.ip))
         return self.connectors[component_connector]
 
+    def prefetch(self, component_connectors):
+        """
+        Connect to several components of the device in parallel, instead of one after the other when the properties
+        of the device are first used.
+
+        Example:
+            nao.prefetch([NaoqiTopCamera, NaoqiMicrophone, NaoqiTextToSpeech])
+
+        :param component_connectors: The component connector classes to start, e.g. [NaoqiTopCamera, NaoqiMicrophone]
+        """
+        if not component_connectors:
+            return
+
+        pool = SICWorkerPool(len(component_connectors), name="{}_prefetch".format(self.__class__.__name__))
+        try:
+            futures = [pool.submit(self._get_connector, connector) for connector in component_connectors]
+            # raises the error of the first connector that could not connect
+            for future in futures:
+                future.result()
+        finally:
+            pool.stop()
+
 
 if __name__ == '__main__':
     ssh = paramiko.SSHClient()
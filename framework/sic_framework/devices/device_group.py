@@ -0,0 +1,99 @@
+from __future__ import print_function
+
+import collections
+import time
+
+import six
+
+from sic_framework.core.worker_pool_python2 import SICWorkerPool
+
+
+class SICDeviceGroup(object):
+    """
+    Bring up several devices at the same time, e.g. for a session with multiple robots. Every device is connected to,
+    installed and started in its own thread, and then connects to the declared components in parallel (see
+    SICDevice.prefetch). Bringing up the group takes about as long as its slowest device.
+
+    Example:
+        group = SICDeviceGroup({
+            "puppet_master": functools.partial(Nao, "192.168.0.191", motion_stream_conf=conf),
+            "puppet": functools.partial(Nao, "192.168.0.239"),
+        }, prefetch=[NaoqiAutonomous, NaoqiStiffness, NaoqiMotionStreamer])
+
+        puppet_master, puppet = group["puppet_master"], group["puppet"]
+        print(group.format_timings())
+    """
+
+    def __init__(self, devices, prefetch=None):
+        """
+        :param devices: dict of a name to a function without arguments that creates the device, e.g.
+                        functools.partial(Nao, "192.168.0.191")
+        :param prefetch: The component connector classes to connect to on every device, e.g. [NaoqiTopCamera]
+        """
+        self.devices = collections.OrderedDict()
+        # device name -> seconds it took to bring up the device
+        self.timings = collections.OrderedDict()
+
+        start = time.time()
+
+        pool = SICWorkerPool(max(len(devices), 1), name="SICDeviceGroup")
+        try:
+            futures = collections.OrderedDict((name, pool.submit(self._bring_up, name, create_device, prefetch))
+                                              for name, create_device in devices.items())
+
+            errors = []
+            for name, future in futures.items():
+                exception = future.exception()
+                if exception is not None:
+                    errors.append((name, exception))
+                else:
+                    self.devices[name] = future.result()
+        finally:
+            pool.stop()
+
+        self.total_time = time.time() - start
+
+        if errors:
+            # do not leave the devices that did start running
+            self.stop()
+            name, exception = errors[0]
+            six.raise_from(RuntimeError("Could not bring up device {}: {}".format(name, exception)), exception)
+
+    def _bring_up(self, name, create_device, prefetch):
+        start = time.time()
+        device = create_device()
+        try:
+            device.prefetch(prefetch or [])
+        except Exception:
+            if hasattr(device, "stop"):
+                device.stop()
+            raise
+
+        self.timings[name] = time.time() - start
+        return device
+
+    def __getitem__(self, name):
+        return self.devices[name]
+
+    def __iter__(self):
+        return iter(self.devices.values())
+
+    def __len__(self):
+        return len(self.devices)
+
+    def format_timings(self):
+        """
+        :return: a table of the time each stage of bringing up each device took, as a string
+        """
+        lines = ["{:<20} {:<40} {:>8}".format("DEVICE", "STAGE", "SECONDS")]
+        for name, device in self.devices.items():
+            for stage, seconds in device.timings.items():
+                lines.append("{:<20} {:<40} {:>8.2f}".format(name[:20], stage[:40], seconds))
+            lines.append("{:<20} {:<40} {:>8.2f}".format(name[:20], "total", self.timings[name]))
+        lines.append("{:<20} {:<40} {:>8.2f}".format("all", "total", self.total_time))
+        return "\n".join(lines)
+
+    def stop(self):
+        for device in self.devices.values():
+            if hasattr(device, "stop"):
+                device.stop()
@@ -68,7 +68,8 @@ class Naoqi(SICDevice):
 
         assert robot_type in ["nao", "pepper"], "Robot type must be either 'nao' or 'pepper'"
 
-        self.auto_install()
+        with self._timed("auto_install"):
+            self.auto_install()
 
         redis_hostname, _ = sic_redis.get_redis_db_ip_password()
 
@@ -88,18 +89,21 @@ class Naoqi(SICDevice):
                 python2 {robot_type}.py --redis_ip={redis_host}; 
                 """.format(robot_type=robot_type, redis_host=redis_hostname)
 
-        self.ssh.exec_command(self.stop_cmd)
-        time.sleep(.1)
+        with self._timed("restart"):
+            self.ssh.exec_command(self.stop_cmd)
+            time.sleep(.1)
 
-        # on_windows = sys.platform == 'win32'
-        # use_pty = not on_windows
+            # on_windows = sys.platform == 'win32'
+            # use_pty = not on_windows
 
-        stdin, stdout, _ = self.ssh.exec_command(start_cmd, get_pty=False)
-        # merge stderr to stdout to simplify (and prevent potential deadlock as stderr is not read)
-        stdout.channel.set_combine_stderr(True)
+            stdin, stdout, _ = self.ssh.exec_command(start_cmd, get_pty=False)
+            # merge stderr to stdout to simplify (and prevent potential deadlock as stderr is not read)
+            stdout.channel.set_combine_stderr(True)
 
         print("Starting SIC on {} with redis ip {}".format(robot_type, redis_hostname))
-        self.logfile = open("sic.log", "w")
+        # one log file per robot, as several robots may be started at the same time (see SICDeviceGroup)
+        self.logfile_name = "sic_{}.log".format(self.ip)
+        self.logfile = open(self.logfile_name, "w")
 
         # Set up error monitoring
         self.stopping = False
@@ -109,22 +113,25 @@ class Naoqi(SICDevice):
             # if remote threads exits before local main thread, report to user.
             if threading.main_thread().is_alive() and not self.stopping:
                 self.logfile.flush()
-                raise RuntimeError("Remote SIC program has stopped unexpectedly.\nSee sic.log for details")
+                raise RuntimeError("Remote SIC program has stopped unexpectedly.\nSee {} for details".format(
+                    self.logfile_name))
 
         thread = threading.Thread(target=check_if_exit)
         thread.name = "remote_SIC_process_monitor"
         thread.start()
 
         # wait for 3 seconds for SIC to start
-        for i in range(300):
-            line = stdout.readline()
-            self.logfile.write(line)
-
-            if MAGIC_STARTED_COMPONENT_MANAGER_TEXT in line:
-                break
-            time.sleep(.01)
-        else:
-            raise RuntimeError("Could not start SIC on remote device\nSee sic.log for details")
+        with self._timed("start_manager"):
+            for i in range(300):
+                line = stdout.readline()
+                self.logfile.write(line)
+
+                if MAGIC_STARTED_COMPONENT_MANAGER_TEXT in line:
+                    break
+                time.sleep(.01)
+            else:
+                raise RuntimeError("Could not start SIC on remote device\nSee {} for details".format(
+                    self.logfile_name))
 
         # write the remaining output to the logfile
         def write_logs():
@@ -16,7 +16,7 @@ from sic_framework.core.component_python2 import SICComponent
 from sic_framework.core.connector import SICConnector
 from sic_framework.core.message_python2 import AudioMessage, SICConfMessage, SICMessage, SICRequest, SICStopRequest, SICIgnoreRequestMessage
 from sic_framework.core.utils import is_sic_instance
-from six.moves import queue
+from sic_framework.core.worker_pool_python2 import SICLatestValue
 
 
 class GetIntentRequest(SICRequest):
@@ -170,10 +170,10 @@ class DialogflowComponent(SICComponent):
         Requires audio to be no more than 250ms chunks as interim results are given a few times a second, and we block
         reading a request until a new audio message is available.
 
-        The buffer length is 1 such that it discards audio before we request it to listen. The buffer is updated as
-        new audio becomes available by the register_message_handler. This queue enables the generator to wait for new
-        audio messages, and yield them to dialogflow. The request generator SHOULD be quite fast, fast enough
-        that it won't drop messages due to the queue size of 1.
+        The buffer only holds the newest audio message, such that it discards audio before we request it to listen. The
+        buffer is updated as new audio becomes available by the register_message_handler. This enables the generator to
+        wait for new audio messages, and yield them to dialogflow. The request generator SHOULD be quite fast, fast
+        enough that it won't drop messages (see audio_buffer.dropped).
     """
 
     def __init__(self, *args, **kwargs):
@@ -207,7 +207,7 @@ class DialogflowComponent(SICComponent):
 
         self.query_input = dialogflow.QueryInput(audio_config=self.dialogflow_audio_config)
         self.message_was_final = threading.Event()
-        self.audio_buffer = queue.Queue(maxsize=1)
+        self.audio_buffer = SICLatestValue()
         self.dialogflow_is_init = True
 
         # Initialize a collection of contexts to be activated before this query is executed.
@@ -217,12 +217,8 @@ class DialogflowComponent(SICComponent):
     def on_message(self, message):
         if is_sic_instance(message, AudioMessage):
             self.logger.debug_framework_verbose("Received audio message")
-            # update the audio message in the queue
-            try:
-                self.audio_buffer.put_nowait(message.waveform)
-            except queue.Full:
-                self.audio_buffer.get_nowait()
-                self.audio_buffer.put_nowait(message.waveform)
+            # replace the audio message in the buffer
+            self.audio_buffer.put(message.waveform)
 
         if is_sic_instance(message, StopListeningMessage):
             # force the request generator to break, which indicates to dialogflow we want an intent for the
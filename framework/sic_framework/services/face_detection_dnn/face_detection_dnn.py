@@ -1,4 +1,3 @@
-import queue
 import pathlib
 
 import cv2
@@ -56,6 +55,9 @@ https://github.com/derronqi/yolov7-face/tree/main
 
 class DNNFaceDetectionComponent(SICComponent):
     COMPONENT_STARTUP_TIMEOUT = 10
+    RUN_IN_SUBPROCESS = True
+    # detection is slower than the camera, so only detect faces in the newest image
+    CONFLATE_INPUTS = [CompressedImageMessage]
 
     def __init__(self, *args, **kwargs):
         super(DNNFaceDetectionComponent, self).__init__(*args, **kwargs)
@@ -68,17 +70,6 @@ class DNNFaceDetectionComponent(SICComponent):
 
         self.tf = torchvision.transforms.ToTensor()
 
-        self.input_message_buffer = queue.Queue()
-
-
-    def start(self):
-        super().start()
-
-        while True:
-            message = self.input_message_buffer.get()
-            bboxes = self.detect(message.image)
-            self.output_message(bboxes)
-
 
     @staticmethod
     def get_inputs():
@@ -91,14 +82,13 @@ class DNNFaceDetectionComponent(SICComponent):
     def get_conf(self):
         return DNNFaceDetectionConf()
 
-    def on_message(self, message):
-        try:
-            self.input_message_buffer.get_nowait()  # remove previous message if its still there
-        except queue.Empty:
-            pass
-        self.input_message_buffer.put(message)
-
+    def warmup(self):
+        # the first inference initializes the model (and CUDA), which takes seconds
+        self.detect(np.zeros((480, 640, 3), dtype=np.uint8))
 
+    def on_message(self, message):
+        bboxes = self.detect(message.image)
+        self.output_message(bboxes)
 
     def on_request(self, request):
         return self.detect(request.image)
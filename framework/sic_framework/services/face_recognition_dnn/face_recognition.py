@@ -20,6 +20,7 @@ class DNNFaceRecognitionComponent(SICService):
 
     # loading resnet takes some time
     COMPONENT_STARTUP_TIMEOUT = 15
+    RUN_IN_SUBPROCESS = True
 
 
     def __init__(self, *args, **kwargs):
@@ -56,6 +57,12 @@ class DNNFaceRecognitionComponent(SICService):
         # maxlen=number of face embeddings we remember for classification
         self.features_history = collections.deque([], maxlen=3000)
 
+    def warmup(self):
+        # the first inference initializes the model (and CUDA), which takes seconds. Not through detect(), as that
+        # would remember the features of the dummy face.
+        with torch.no_grad():
+            self.model(torch.zeros((1, 3, 224, 224)).to(self.device))
+
     @staticmethod
     def get_inputs():
         return [CompressedImageMessage, CompressedImageRequest]
@@ -77,7 +77,9 @@ class WhisperComponent(SICComponent):
     """
     Dummy SICAction
     """
-    COMPONENT_STARTUP_TIMEOUT = 5
+    # the component process has to import whisper (and torch) before it can start
+    COMPONENT_STARTUP_TIMEOUT = 10
+    RUN_IN_SUBPROCESS = True
 
     def __init__(self, *args, **kwargs):
         super(WhisperComponent, self).__init__(*args, **kwargs)
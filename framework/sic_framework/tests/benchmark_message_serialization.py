@@ -0,0 +1,271 @@
+"""
+Benchmark the serialization of the SICMessage types that are sent most often in the framework.
+
+For every message type and payload size the serialize and deserialize latency, the throughput and the peak memory
+use are measured. The results can be written to a JSON file and compared to the results of a previous release, to
+catch regressions in the hot message path.
+
+Usage:
+    python3 benchmark_message_serialization.py --output results.json
+    python3 benchmark_message_serialization.py --compare results.json --max-regression 0.2
+    python3 benchmark_message_serialization.py --messages CompressedImageMessage AudioMessage --repeat 200
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import timeit
+import tracemalloc
+
+import numpy as np
+
+from sic_framework.core import message_python2
+from sic_framework.core.message_python2 import CompressedImageMessage, UncompressedImageMessage, AudioMessage, \
+    BoundingBox, BoundingBoxesMessage, SICMessage
+from sic_framework.devices.common_naoqi.naoqi_camera import StereoImageMessage
+from sic_framework.devices.common_naoqi.naoqi_motion_recorder import NaoqiMotionRecording
+
+IMAGE_SIZES = {
+    "160x120": (120, 160, 3),
+    "320x240": (240, 320, 3),
+    "640x480": (480, 640, 3),
+    "1280x960": (960, 1280, 3),
+}
+
+AUDIO_SECONDS = {
+    "0.1s": 0.1,
+    "1s": 1.0,
+    "10s": 10.0,
+}
+
+NUMBER_OF_BOUNDING_BOXES = {
+    "1": 1,
+    "10": 10,
+    "100": 100,
+}
+
+MOTION_SAMPLES = {
+    "5x10": (5, 10),
+    "26x100": (26, 100),
+    "26x1000": (26, 1000),
+}
+
+
+def random_image(shape):
+    # smooth images compress like camera images, random noise would be a worst case for JPEG
+    rng = np.random.RandomState(0)
+    small = rng.randint(0, 255, size=(shape[0] // 8 + 1, shape[1] // 8 + 1, shape[2])).astype(np.uint8)
+    return np.repeat(np.repeat(small, 8, axis=0), 8, axis=1)[:shape[0], :shape[1]]
+
+
+def create_compressed_image(size):
+    return CompressedImageMessage(random_image(IMAGE_SIZES[size]))
+
+
+def create_uncompressed_image(size):
+    return UncompressedImageMessage(random_image(IMAGE_SIZES[size]))
+
+
+def create_stereo_image(size):
+    image = random_image(IMAGE_SIZES[size])
+    return StereoImageMessage(image, image[:, ::-1].copy())
+
+
+def create_audio(size):
+    sample_rate = 16000
+    n_samples = int(AUDIO_SECONDS[size] * sample_rate)
+    waveform = np.random.RandomState(0).randint(-2 ** 15, 2 ** 15, n_samples).astype("<i2").tobytes()
+    return AudioMessage(waveform, sample_rate=sample_rate)
+
+
+def create_bounding_boxes(size):
+    bboxes = [BoundingBox(i, i * 2, 20, 30, identifier=i, confidence=.5) for i in range(NUMBER_OF_BOUNDING_BOXES[size])]
+    return BoundingBoxesMessage(bboxes)
+
+
+def create_motion_recording(size):
+    n_joints, n_samples = MOTION_SAMPLES[size]
+    joints = ["Joint{}".format(i) for i in range(n_joints)]
+    angles = [[.01 * j for j in range(n_samples)] for _ in range(n_joints)]
+    times = [[.05 * (j + 1) for j in range(n_samples)] for _ in range(n_joints)]
+    return NaoqiMotionRecording(joints, angles, times)
+
+
+# message name -> (factory function, payload sizes)
+BENCHMARKS = {
+    CompressedImageMessage.get_message_name(): (create_compressed_image, IMAGE_SIZES),
+    UncompressedImageMessage.get_message_name(): (create_uncompressed_image, IMAGE_SIZES),
+    StereoImageMessage.get_message_name(): (create_stereo_image, IMAGE_SIZES),
+    AudioMessage.get_message_name(): (create_audio, AUDIO_SECONDS),
+    BoundingBoxesMessage.get_message_name(): (create_bounding_boxes, NUMBER_OF_BOUNDING_BOXES),
+    NaoqiMotionRecording.get_message_name(): (create_motion_recording, MOTION_SAMPLES),
+}
+
+
+def payload_size(message):
+    """
+    The size in bytes of the data fields of the message before serialization.
+    """
+    size = 0
+    for value in vars(message).values():
+        if isinstance(value, np.ndarray):
+            size += value.nbytes
+        elif isinstance(value, (bytes, bytearray)):
+            size += len(value)
+    return size
+
+
+def time_function(function, repeat):
+    """
+    Time a function call repeat times.
+    :return: a dictionary with statistics in seconds
+    """
+    timings = np.array(timeit.repeat(function, number=1, repeat=repeat))
+    return {
+        "mean": float(np.mean(timings)),
+        "median": float(np.median(timings)),
+        "p90": float(np.percentile(timings, 90)),
+        "min": float(np.min(timings)),
+        "max": float(np.max(timings)),
+    }
+
+
+def peak_memory(function):
+    """
+    Measure the peak memory allocated by python (and numpy) during a single function call.
+    :return: the peak in bytes
+    """
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def benchmark_message(name, size, repeat):
+    create, _ = BENCHMARKS[name]
+    message = create(size)
+
+    serialized = message.serialize()
+
+    # messages cache their encoded fields, so clear the cache to measure the encoding itself
+    def serialize():
+        message._invalidate_serialization_cache()
+        message.serialize()
+
+    # fields are decoded when they are first accessed, so decode all fields to measure the full cost
+    def deserialize():
+        SICMessage.deserialize(serialized)._decode_lazy_fields()
+
+    def deserialize_lazy():
+        SICMessage.deserialize(serialized)
+
+    # warm up caches and lazy imports
+    serialize()
+    deserialize()
+
+    serialize_timing = time_function(serialize, repeat)
+    deserialize_timing = time_function(deserialize, repeat)
+    deserialize_lazy_timing = time_function(deserialize_lazy, repeat)
+
+    return {
+        "message": name,
+        "size": size,
+        "payload_bytes": payload_size(message),
+        "serialized_bytes": len(serialized),
+        "serialize_seconds": serialize_timing,
+        "deserialize_seconds": deserialize_timing,
+        "deserialize_lazy_seconds": deserialize_lazy_timing,
+        "serialize_messages_per_second": 1.0 / serialize_timing["median"],
+        "deserialize_messages_per_second": 1.0 / deserialize_timing["median"],
+        "serialize_megabytes_per_second": len(serialized) / serialize_timing["median"] / 1e6,
+        "deserialize_megabytes_per_second": len(serialized) / deserialize_timing["median"] / 1e6,
+        "serialize_peak_memory_bytes": peak_memory(lambda: create(size).serialize()),
+        "deserialize_peak_memory_bytes": peak_memory(deserialize),
+    }
+
+
+def run(message_names, repeat):
+    results = []
+    for name in message_names:
+        _, sizes = BENCHMARKS[name]
+        for size in sizes:
+            result = benchmark_message(name, size, repeat)
+            results.append(result)
+            print("{:<26} {:>9} {:>10} bytes  serialize {:8.3f} ms  deserialize {:8.3f} ms (lazy {:8.3f} ms)".format(
+                name, size, result["serialized_bytes"],
+                result["serialize_seconds"]["median"] * 1000,
+                result["deserialize_seconds"]["median"] * 1000,
+                result["deserialize_lazy_seconds"]["median"] * 1000))
+
+    return {
+        "metadata": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "jpeg": type(message_python2.turbojpeg).__name__,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current, max_regression):
+    """
+    Compare the median latencies of two benchmark runs.
+    :return: list of regressions as human readable strings
+    """
+    baseline_results = {(r["message"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+
+    for result in current["results"]:
+        key = (result["message"], result["size"])
+        if key not in baseline_results:
+            continue
+
+        for field in ["serialize_seconds", "deserialize_seconds", "deserialize_lazy_seconds"]:
+            if field not in baseline_results[key]:
+                continue
+            old = baseline_results[key][field]["median"]
+            new = result[field]["median"]
+            if old > 0 and (new - old) / old > max_regression:
+                regressions.append("{} {} {}: {:.3f} ms -> {:.3f} ms (+{:.0%})".format(
+                    key[0], key[1], field[:-len("_seconds")], old * 1000, new * 1000, (new - old) / old))
+
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark SICMessage serialization.")
+    parser.add_argument("--messages", nargs="+", default=sorted(BENCHMARKS), choices=sorted(BENCHMARKS),
+                        help="The message types to benchmark (default: all)")
+    parser.add_argument("--repeat", type=int, default=100,
+                        help="Number of timed serialize/deserialize calls per message and size")
+    parser.add_argument("--output", type=str, help="Write the results as JSON to this file")
+    parser.add_argument("--compare", type=str, help="JSON results of a previous run to compare against")
+    parser.add_argument("--max-regression", type=float, default=.2,
+                        help="Fraction a median latency may increase before it is reported as a regression")
+    args = parser.parse_args()
+
+    results = run(args.messages, args.repeat)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print("Results written to", args.output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+        regressions = compare(baseline, results, args.max_regression)
+        if regressions:
+            print("\nRegressions compared to {}:".format(args.compare))
+            for regression in regressions:
+                print(" - " + regression)
+            sys.exit(1)
+
+        print("\nNo regressions compared to {}".format(args.compare))
@@ -0,0 +1,22 @@
+import pytest
+
+# scripts that are run by hand, not tests
+collect_ignore = ["python3_python2_compatibility_test"]
+
+
+def _redis_is_running():
+    try:
+        from sic_framework.core.sic_redis import SICRedis
+        SICRedis(parent_name="conftest").close()
+        return True
+    except Exception:
+        return False
+
+
+@pytest.fixture(scope="session")
+def requires_redis():
+    """
+    Tests that send messages through redis are skipped if no redis server is running (see conf/redis).
+    """
+    if not _redis_is_running():
+        pytest.skip("redis is not running")
@@ -1,32 +1,44 @@
+import functools
 import time
-from sic_framework.devices import Nao
-from sic_framework.devices.common_naoqi.naoqi_autonomous import NaoBasicAwarenessRequest, NaoBackgroundMovingRequest, NaoRestRequest
-from sic_framework.devices.common_naoqi.naoqi_motion_streamer import StartStreaming, StopStreaming, NaoMotionStreamerConf
-from sic_framework.devices.common_naoqi.naoqi_stiffness import Stiffness
-from sic_framework.devices.common_naoqi.naoqi_text_to_speech import NaoqiTextToSpeechRequest
+from sic_framework.core.connector import SICRequestBatch
+from sic_framework.devices import Nao, SICDeviceGroup
+from sic_framework.devices.common_naoqi.naoqi_autonomous import NaoBasicAwarenessRequest, NaoBackgroundMovingRequest, NaoRestRequest, NaoqiAutonomous
+from sic_framework.devices.common_naoqi.naoqi_motion_streamer import StartStreaming, StopStreaming, NaoMotionStreamerConf, NaoqiMotionStreamer
+from sic_framework.devices.common_naoqi.naoqi_stiffness import Stiffness, NaoqiStiffness
+from sic_framework.devices.common_naoqi.naoqi_text_to_speech import NaoqiTextToSpeechRequest, NaoqiTextToSpeech
 
 JOINTS = ["Head", "RArm", "LArm"]
 FIXED_JOINTS = ["RLeg", "LLeg"]
 
 
 conf = NaoMotionStreamerConf(samples_per_second=30)
-puppet_master = Nao("192.168.0.191", motion_stream_conf=conf)
-puppet_master.autonomous.request(NaoBasicAwarenessRequest(False))
-puppet_master.autonomous.request(NaoBackgroundMovingRequest(False))
-puppet_master.stiffness.request(Stiffness(0.0, joints=JOINTS))
 
-puppet = Nao("192.168.0.239")
-puppet.autonomous.request(NaoBasicAwarenessRequest(False))
-puppet.autonomous.request(NaoBackgroundMovingRequest(False))
-puppet.stiffness.request(Stiffness(0.5, joints=JOINTS))
-
-# Set fixed joints to high stiffness such that the robots don't fall
-puppet_master.stiffness.request(Stiffness(0.7, joints=FIXED_JOINTS))
-puppet.stiffness.request(Stiffness(0.7, joints=FIXED_JOINTS))
-
-# Start both robots in rest pose
-puppet.autonomous.request(NaoRestRequest())
-puppet_master.autonomous.request(NaoRestRequest())
+# Start both robots, and connect to the components used below, at the same time
+group = SICDeviceGroup({
+    "puppet_master": functools.partial(Nao, "192.168.0.191", motion_stream_conf=conf),
+    "puppet": functools.partial(Nao, "192.168.0.239"),
+}, prefetch=[NaoqiAutonomous, NaoqiStiffness, NaoqiMotionStreamer, NaoqiTextToSpeech])
+puppet_master, puppet = group["puppet_master"], group["puppet"]
+print(group.format_timings())
+
+# Send the setup requests of both robots at once, instead of waiting for each reply in turn
+with SICRequestBatch() as batch:
+    batch.request(puppet_master.autonomous, NaoBasicAwarenessRequest(False))
+    batch.request(puppet_master.autonomous, NaoBackgroundMovingRequest(False))
+    batch.request(puppet_master.stiffness, Stiffness(0.0, joints=JOINTS))
+
+    batch.request(puppet.autonomous, NaoBasicAwarenessRequest(False))
+    batch.request(puppet.autonomous, NaoBackgroundMovingRequest(False))
+    batch.request(puppet.stiffness, Stiffness(0.5, joints=JOINTS))
+
+    # Set fixed joints to high stiffness such that the robots don't fall
+    batch.request(puppet_master.stiffness, Stiffness(0.7, joints=FIXED_JOINTS))
+    batch.request(puppet.stiffness, Stiffness(0.7, joints=FIXED_JOINTS))
+
+# Start both robots in rest pose (after the stiffness is set, requests to different components may run concurrently)
+with SICRequestBatch() as batch:
+    batch.request(puppet.autonomous, NaoRestRequest())
+    batch.request(puppet_master.autonomous, NaoRestRequest())
 
 # Connect the puppet master with the puppet
 puppet.motion_streaming.connect(puppet_master.motion_streaming)
@@ -44,7 +56,8 @@ puppet_master.stiffness.request(Stiffness(0.7, joints=JOINTS))
 puppet_master.motion_streaming.request(StopStreaming())
 
 # Set both robots in rest pose again
-puppet.autonomous.request(NaoRestRequest())
-puppet_master.autonomous.request(NaoRestRequest())
+with SICRequestBatch() as batch:
+    batch.request(puppet.autonomous, NaoRestRequest())
+    batch.request(puppet_master.autonomous, NaoRestRequest())
 
 print("DONE")
@@ -0,0 +1,148 @@
+import asyncio
+import os
+
+import pytest
+
+from sic_framework.core import tracing_python2 as tracing
+from sic_framework.core.async_connector import AsyncSICConnector, AsyncSICRedis
+from sic_framework.core.component_manager_python2 import SICComponentManager
+from sic_framework.core.component_python2 import SICComponent
+from sic_framework.core.connector import SICConnector
+from sic_framework.core.message_python2 import TextMessage, TextRequest
+from sic_framework.core.sic_redis import SICRedis
+
+
+class AsyncEchoComponent(SICComponent):
+    METRICS_INTERVAL = None
+
+    @staticmethod
+    def get_inputs():
+        return [TextMessage, TextRequest]
+
+    @staticmethod
+    def get_output():
+        return TextMessage
+
+    def on_message(self, message):
+        self.output_message(TextMessage(message.text))
+
+    def on_request(self, request):
+        return TextMessage(request.text)
+
+
+class AsyncEcho(SICConnector):
+    component_class = AsyncEchoComponent
+
+
+@pytest.fixture
+def redis(requires_redis):
+    redis = SICRedis(parent_name="test")
+    yield redis
+    redis.close()
+
+
+@pytest.fixture
+def manager(requires_redis):
+    manager = SICComponentManager([AsyncEchoComponent], auto_serve=False)
+    yield manager
+    manager.stop()
+
+
+def _span_names(trace):
+    return [(component_name, stage) for component_name, stage, _, _ in trace[1]]
+
+
+def test_create_starts_component(manager):
+    async def main():
+        async with AsyncSICRedis() as redis:
+            echo = await AsyncSICConnector.create(AsyncEcho, redis=redis)
+            try:
+                return echo.component_info, await echo.arequest(TextRequest("hello"), timeout=5)
+            finally:
+                await echo.astop()
+
+    component_info, reply = asyncio.run(main())
+
+    assert reply.text == "hello"
+    assert component_info["pid"] == os.getpid()
+    assert len(manager.active_components) == 1
+
+
+def test_create_connects_to_running_component(manager):
+    connector = AsyncEcho()
+
+    async def main():
+        async with AsyncSICRedis() as redis:
+            echo = await AsyncSICConnector.create(AsyncEcho, redis=redis)
+            return await echo.arequest(TextRequest("hello"), timeout=5)
+
+    try:
+        assert asyncio.run(main()).text == "hello"
+        assert len(manager.active_components) == 1
+    finally:
+        connector.stop()
+
+
+def test_messages_are_sent_and_received(manager):
+    async def main():
+        async with AsyncSICRedis() as redis:
+            echo = await AsyncSICConnector.create(AsyncEcho, redis=redis)
+            messages = echo.messages()
+            try:
+                next_message = asyncio.ensure_future(messages.__anext__())
+                # give the subscription time to be made before the component replies
+                await asyncio.sleep(.5)
+
+                await echo.asend_message(TextMessage("hello"))
+                return await asyncio.wait_for(next_message, 5)
+            finally:
+                await messages.aclose()
+                await echo.astop()
+
+    assert asyncio.run(main()).text == "hello"
+
+
+def test_arequest_continues_current_trace(manager, redis):
+    trace_id, _ = trace = tracing.new_trace()
+
+    async def main():
+        async with AsyncSICRedis() as async_redis:
+            echo = await AsyncSICConnector.create(AsyncEcho, redis=async_redis)
+            try:
+                with tracing.SICSpan(redis, "test", "handler", trace):
+                    return await echo.arequest(TextRequest("hello"), timeout=5)
+            finally:
+                await echo.astop()
+
+    reply = asyncio.run(main())
+
+    assert reply._trace[0] == trace_id
+    spans = _span_names(reply._trace)
+    assert spans[0] == ("test", "handler")
+    assert ("AsyncEchoComponent", "on_request") in spans
+    # the trace ends when the reply is received
+    assert spans[-1] == ("AsyncEcho", "transport")
+
+
+def test_asend_message_continues_current_trace(manager, redis):
+    trace_id, _ = trace = tracing.new_trace()
+
+    async def main():
+        async with AsyncSICRedis() as async_redis:
+            echo = await AsyncSICConnector.create(AsyncEcho, redis=async_redis)
+            messages = echo.messages()
+            try:
+                next_message = asyncio.ensure_future(messages.__anext__())
+                await asyncio.sleep(.5)
+
+                with tracing.SICSpan(redis, "test", "handler", trace):
+                    await echo.asend_message(TextMessage("hello"))
+                return await asyncio.wait_for(next_message, 5)
+            finally:
+                await messages.aclose()
+                await echo.astop()
+
+    message = asyncio.run(main())
+
+    assert message._trace[0] == trace_id
+    assert ("AsyncEchoComponent", "on_message") in _span_names(message._trace)
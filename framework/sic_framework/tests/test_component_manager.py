@@ -0,0 +1,85 @@
+import time
+
+import pytest
+
+from sic_framework.core import registry_python2 as registry, sic_logging
+from sic_framework.core.component_manager_python2 import SICComponentManager, SICStartComponentRequest, \
+    SICNotStartedMessage
+from sic_framework.core.component_python2 import SICComponent
+from sic_framework.core.message_python2 import SICConfMessage, SICSuccessMessage, TextMessage
+from sic_framework.core.sic_redis import SICRedis
+
+
+class FailingInitComponent(SICComponent):
+    METRICS_INTERVAL = None
+
+    def __init__(self, *args, **kwargs):
+        super(FailingInitComponent, self).__init__(*args, **kwargs)
+        raise IOError("could not load the model weights")
+
+    @staticmethod
+    def get_inputs():
+        return []
+
+    @staticmethod
+    def get_output():
+        return TextMessage
+
+
+@pytest.fixture
+def manager(requires_redis):
+    manager = SICComponentManager([FailingInitComponent], auto_serve=False)
+    yield manager
+    manager.stop()
+
+
+def test_failing_constructor_removes_registry_entry(manager):
+    redis = SICRedis(parent_name="test")
+    try:
+        name = FailingInitComponent.get_component_name()
+        reply = redis.request(manager.ip, SICStartComponentRequest(name, log_level=sic_logging.INFO), timeout=10)
+        assert isinstance(reply, SICNotStartedMessage)
+
+        # wait longer than the heartbeat interval, so a heartbeat that is still running would register it again
+        time.sleep(registry.SICRegistry.TTL / 3.0 + .5)
+        assert registry.lookup_component(redis, name, manager.ip) is None
+    finally:
+        redis.close()
+
+
+class SlowComponent(SICComponent):
+    METRICS_INTERVAL = None
+
+    def warmup(self):
+        time.sleep(.5)
+
+    @staticmethod
+    def get_inputs():
+        return []
+
+    @staticmethod
+    def get_output():
+        return TextMessage
+
+
+class SlowComponentConf(SICConfMessage):
+    def __init__(self, value=0):
+        super(SlowComponentConf, self).__init__()
+        self.value = value
+
+
+def test_simultaneous_starts_with_other_conf_are_not_merged(requires_redis):
+    manager = SICComponentManager([SlowComponent], auto_serve=False)
+    redis = SICRedis(parent_name="test")
+    try:
+        name = SlowComponent.get_component_name()
+        requests = [SICStartComponentRequest(name, sic_logging.INFO, conf=SlowComponentConf(1)),
+                    SICStartComponentRequest(name, sic_logging.INFO, conf=SlowComponentConf(1)),
+                    SICStartComponentRequest(name, sic_logging.INFO, conf=SlowComponentConf(2))]
+        replies = redis.request_many([(manager.ip, request) for request in requests], timeout=10)
+
+        assert [type(reply) for reply in replies] == [SICSuccessMessage, SICSuccessMessage, SICNotStartedMessage]
+        assert len(manager.active_components) == 1
+    finally:
+        redis.close()
+        manager.stop()
@@ -0,0 +1,70 @@
+import json
+import os
+
+import pytest
+
+from sic_framework.core import registry_python2 as registry, utils
+from sic_framework.core.component_manager_python2 import SICComponentManager
+from sic_framework.core.component_python2 import SICComponent
+from sic_framework.core.connector import SICConnector
+from sic_framework.core.message_python2 import TextMessage
+from sic_framework.core.sic_redis import SICRedis
+
+
+class EchoComponent(SICComponent):
+    METRICS_INTERVAL = None
+
+    @staticmethod
+    def get_inputs():
+        return [TextMessage]
+
+    @staticmethod
+    def get_output():
+        return TextMessage
+
+
+class Echo(SICConnector):
+    component_class = EchoComponent
+
+
+def _register_stale_component(redis, ip):
+    """
+    Register a ready component that is not running, as left behind by a manager that was killed.
+    """
+    entry = {"name": EchoComponent.get_component_name(), "ip": ip, "pid": os.getpid() + 1, "state": registry.READY}
+    redis.set_value(registry.get_component_key(EchoComponent.get_component_name(), ip), json.dumps(entry),
+                    ttl=registry.SICRegistry.TTL)
+
+
+@pytest.fixture
+def redis(requires_redis):
+    redis = SICRedis(parent_name="test")
+    yield redis
+    redis.close()
+
+
+def test_manager_removes_stale_component_entries(redis):
+    _register_stale_component(redis, utils.get_ip_adress())
+
+    manager = SICComponentManager([EchoComponent], auto_serve=False)
+    try:
+        assert registry.lookup_component(redis, EchoComponent.get_component_name(), manager.ip) is None
+    finally:
+        manager.stop()
+
+
+def test_connector_starts_component_with_stale_entry(redis):
+    manager = SICComponentManager([EchoComponent], auto_serve=False)
+    connector = None
+    try:
+        # e.g. a component that stopped just before a connector is created
+        _register_stale_component(redis, manager.ip)
+
+        connector = Echo()
+
+        assert len(manager.active_components) == 1
+        assert connector.component_info["pid"] == os.getpid()
+    finally:
+        if connector is not None:
+            connector.stop()
+        manager.stop()
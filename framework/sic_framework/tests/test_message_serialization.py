@@ -0,0 +1,119 @@
+import copy
+
+import numpy as np
+import pytest
+
+from sic_framework.core.message_python2 import CompressedImageMessage, SICMessage, UncompressedImageMessage
+from sic_framework.core.metrics_python2 import SICMetrics
+
+
+class BinaryMessage(SICMessage):
+    _binary_serialization = True
+
+    def __init__(self, array):
+        self.array = array
+
+
+def _round_trip(array):
+    message = SICMessage.deserialize(BinaryMessage(array).serialize())
+    assert isinstance(message, BinaryMessage)
+    return message.array
+
+
+@pytest.mark.parametrize("array", [
+    np.zeros((0,), dtype=np.float32),
+    np.zeros((0, 3), dtype=np.uint8),
+    np.zeros((4, 0, 2), dtype=np.int64),
+], ids=["empty", "empty_2d", "empty_3d"])
+def test_empty_array(array):
+    received = _round_trip(array)
+    assert received.dtype == array.dtype
+    assert received.shape == array.shape
+
+
+def test_numeric_array():
+    array = np.arange(24, dtype=np.float64).reshape(2, 3, 4)[:, ::2]
+    received = _round_trip(array)
+    assert received.dtype == array.dtype
+    np.testing.assert_array_equal(received, array)
+
+
+@pytest.mark.parametrize("array", [
+    np.array(["2024-01-01T12:00", "2024-06-30T08:30"], dtype="datetime64[m]"),
+    np.array([1, 2, 3], dtype="timedelta64[ms]"),
+], ids=["datetime64", "timedelta64"])
+def test_datetime_array(array):
+    received = _round_trip(array)
+    assert received.dtype == array.dtype
+    np.testing.assert_array_equal(received, array)
+
+
+def test_structured_array():
+    array = np.array([(1, 2.5, b"a"), (3, 4.5, b"bc")], dtype=[("id", "<i4"), ("score", "<f8"), ("label", "S2")])
+    received = _round_trip(array)
+    assert received.dtype == array.dtype
+    assert received.dtype.names == ("id", "score", "label")
+    np.testing.assert_array_equal(received["score"], array["score"])
+    assert list(received["label"]) == [b"a", b"bc"]
+
+
+class NestedMessage(SICMessage):
+    def __init__(self, message):
+        self.message = message
+
+
+def test_lazy_field_decode_is_timed():
+    metrics = SICMetrics()
+    message = SICMessage.deserialize(NestedMessage(BinaryMessage(np.arange(4))).serialize())
+    message._set_decode_metrics(metrics)
+    # e.g. the reply the component manager copies for every requester
+    message_copy = copy.copy(message)
+
+    np.testing.assert_array_equal(message.message.array, np.arange(4))
+    np.testing.assert_array_equal(message_copy.message.array, np.arange(4))
+
+    _, _, _, histograms = metrics.collect()
+    assert sum(histograms["deserialize"]["counts"]) == 2
+
+
+def test_arrays_modified_in_place_are_encoded_again():
+    image = np.zeros((48, 64, 3), dtype=np.uint8)
+    message = CompressedImageMessage(image)
+    message.serialize()
+
+    # e.g. a sensor that reuses its frame buffer, or cv2.rectangle on an image that is about to be sent
+    image[:] = 255
+
+    assert SICMessage.deserialize(message.serialize()).image.mean() > 250
+
+
+def test_arrays_are_encoded_once():
+    message = CompressedImageMessage(np.zeros((48, 64, 3), dtype=np.uint8))
+    assert message.serialize() == message.serialize()
+
+    encoded = message._sic_encoded_fields["image"][3]
+    message.serialize()
+    assert message._sic_encoded_fields["image"][3] is encoded
+
+
+def test_received_arrays_modified_in_place_are_encoded_again():
+    received = SICMessage.deserialize(CompressedImageMessage(np.zeros((48, 64, 3), dtype=np.uint8)).serialize())
+
+    # e.g. cv2.rectangle on a received image, before forwarding the message
+    received.image[:] = 255
+    # the received JPEG bytes are not kept once the image is decoded
+    assert "image" not in received.__dict__.get("_sic_encoded_fields", {})
+
+    assert SICMessage.deserialize(received.serialize()).image.mean() > 250
+
+
+def test_received_arrays_are_writable():
+    # as received from redis, which returns bytes
+    serialized = bytes(UncompressedImageMessage(np.zeros((48, 64, 3), dtype=np.uint8)).serialize())
+    image = SICMessage.deserialize(serialized).image
+
+    # e.g. cv2.rectangle on a received image
+    image[1:4, 1:4] = 255
+
+    assert image.flags.writeable
+    assert image[1:4, 1:4].mean() == 255 and image[10:].mean() == 0
@@ -0,0 +1,55 @@
+import os
+
+import six
+import pytest
+
+from sic_framework.core import registry_python2 as registry
+from sic_framework.core.component_manager_python2 import _create_component
+from sic_framework.core.message_python2 import SICConfMessage, TextMessage
+from sic_framework.core.service_python2 import SICService, SICMessageDictionary
+
+
+class WorkerProcessConf(SICConfMessage):
+    def __init__(self, text="conf"):
+        super(WorkerProcessConf, self).__init__()
+        self.text = text
+
+
+class WorkerProcessService(SICService):
+    METRICS_INTERVAL = None
+    EXECUTE_WORKERS = 2
+    EXECUTE_WORKER_TYPE = "process"
+
+    @staticmethod
+    def get_inputs():
+        return [TextMessage]
+
+    @staticmethod
+    def get_output():
+        return TextMessage
+
+    def get_conf(self):
+        return WorkerProcessConf()
+
+    def execute(self, inputs):
+        return TextMessage("{} {} {}".format(inputs.get(TextMessage).text, self.params.text, os.getpid()))
+
+
+@pytest.mark.skipif(six.PY2, reason="worker processes require python 3")
+def test_worker_processes_create_their_own_service(requires_redis):
+    service = _create_component(WorkerProcessService, conf=WorkerProcessConf("spawned"))
+    try:
+        service._start_workers()
+        inputs = SICMessageDictionary()
+        inputs.set(TextMessage("hello"))
+
+        text, conf_text, pid = service._execute_in_process(inputs).text.split()
+
+        assert (text, conf_text) == ("hello", "spawned")
+        assert int(pid) != os.getpid()
+        # the worker processes do not replace the registry entry of the service
+        entry = registry.lookup_component(service._redis, service.get_component_name(), service._ip)
+        assert entry["pid"] == os.getpid()
+    finally:
+        service._stop_workers()
+        service.stop()
@@ -0,0 +1,91 @@
+import threading
+
+import numpy as np
+import pytest
+
+from sic_framework.core import shared_memory_transport
+from sic_framework.core.message_python2 import CompressedImageMessage, SICMessage, SICRequest
+from sic_framework.core.sic_redis import SICRedis
+
+pytestmark = pytest.mark.skipif(not shared_memory_transport.is_available(),
+                                reason="shared memory requires python >= 3.8")
+
+
+class ImageRequest(SICRequest):
+    def __init__(self, image):
+        super(ImageRequest, self).__init__()
+        self.image = image
+
+
+class ImageSizeMessage(SICMessage):
+    def __init__(self, size):
+        super(ImageSizeMessage, self).__init__()
+        self.size = size
+
+
+def test_received_images_are_writable(requires_redis):
+    publisher = SICRedis(parent_name="publisher")
+    subscriber = SICRedis(parent_name="subscriber")
+    try:
+        assert publisher.enable_shared_memory("test_shm_camera")
+
+        received = []
+        event = threading.Event()
+
+        def on_message(message):
+            received.append(message)
+            event.set()
+
+        subscriber.register_message_handler("test_shm_camera", on_message)
+
+        image = np.random.randint(0, 255, (48, 64, 3), dtype=np.uint8)
+        assert publisher.send_message("test_shm_camera", CompressedImageMessage(image)) > 0
+        assert event.wait(5)
+
+        # e.g. cv2.rectangle draws on the received image, as it does on images received through redis
+        frame = received[0].image
+        frame[0, 0] = 0
+        frame[1:4, 1:4] = 255
+        assert (frame[1:4, 1:4] == 255).all()
+        assert (frame[10:, 10:] == image[10:, 10:]).all()
+    finally:
+        publisher.close()
+        subscriber.close()
+
+
+def test_request_many_uses_shared_memory(requires_redis):
+    client = SICRedis(parent_name="client")
+    server = SICRedis(parent_name="server")
+    try:
+        assert client.enable_shared_memory("test_shm_requests")
+        server.register_request_handler("test_shm_requests", lambda request: ImageSizeMessage(request.image.shape))
+
+        images = [np.zeros((height, 64, 3), dtype=np.uint8) for height in (16, 32, 48)]
+        replies = client.request_many([("test_shm_requests", ImageRequest(image)) for image in images])
+
+        assert [reply.size for reply in replies] == [image.shape for image in images]
+        # the three requests were written to the ring, so the next message gets the fourth sequence number
+        assert next(client._shared_memory_rings["test_shm_requests"]._sequence) == 4
+    finally:
+        client.close()
+        server.close()
+
+
+def test_shared_memory_publishers_are_looked_up_once(requires_redis):
+    publisher = SICRedis(parent_name="publisher")
+    subscriber = SICRedis(parent_name="subscriber")
+    try:
+        assert publisher.enable_shared_memory("test_shm_lookup")
+        lookups = []
+        get_values = subscriber.get_values
+        subscriber.get_values = lambda keys: lookups.append(keys) or get_values(keys)
+
+        for _ in range(3):
+            subscriber.register_message_handler(["test_shm_lookup", "test_shm_lookup_redis"], lambda message: None)
+
+        assert len(lookups) == 1
+        assert subscriber._get_shared_memory_publishers(["test_shm_lookup", "test_shm_lookup_redis"]) == \
+            {"test_shm_lookup"}
+    finally:
+        publisher.close()
+        subscriber.close()
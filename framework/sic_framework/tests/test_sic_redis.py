@@ -0,0 +1,74 @@
+import threading
+
+import pytest
+
+from sic_framework.core.message_python2 import SICRequest, SICMessage
+from sic_framework.core.metrics_python2 import SICMetrics
+from sic_framework.core.sic_redis import SICRedis
+from sic_framework.core.worker_pool_python2 import TimeoutError
+
+
+class EchoRequest(SICRequest):
+    def __init__(self, value):
+        super(EchoRequest, self).__init__()
+        self.value = value
+
+
+class EchoReply(SICMessage):
+    def __init__(self, value):
+        super(EchoReply, self).__init__()
+        self.value = value
+
+
+def test_request_many_records_metrics(requires_redis):
+    server = SICRedis(parent_name="server")
+    client = SICRedis(parent_name="client")
+    try:
+        server.register_request_handler("test_request_many", lambda request: EchoReply(request.value))
+        client.metrics = SICMetrics()
+
+        replies = client.request_many([("test_request_many", EchoRequest(value)) for value in range(3)])
+
+        assert [reply.value for reply in replies] == [0, 1, 2]
+        _, counters, _, histograms = client.metrics.collect()
+        assert sum(histograms["serialize"]["counts"]) == 3
+        assert counters["publish_bytes"] > 0
+    finally:
+        client.close()
+        server.close()
+
+
+def test_request_handler_can_wait_for_another_callback(requires_redis):
+    # e.g. Dialogflow, which replies to a GetIntentRequest once the audio it receives contains an intent
+    server = SICRedis(parent_name="server")
+    client = SICRedis(parent_name="client")
+    try:
+        received = threading.Event()
+
+        def on_request(request):
+            assert received.wait(5), "the message callback did not run while the request handler was waiting"
+            return EchoReply(request.value)
+
+        server.register_request_handler("test_wait_request", on_request)
+        for i in range(3):
+            server.register_message_handler("test_wait_other_{}".format(i), lambda message: None)
+        server.register_message_handler("test_wait_input", lambda message: received.set())
+
+        # the input arrives while the request handler is waiting
+        threading.Timer(.2, client.send_message, ("test_wait_input", EchoReply(0))).start()
+
+        assert client.request("test_wait_request", EchoRequest(1), timeout=10).value == 1
+    finally:
+        client.close()
+        server.close()
+
+
+def test_request_without_reply_times_out(requires_redis):
+    client = SICRedis(parent_name="client")
+    try:
+        with pytest.raises(TimeoutError):
+            client.request("test_no_handler", EchoRequest(0), timeout=.2)
+        with pytest.raises(TimeoutError):
+            client.request_many([("test_no_handler", EchoRequest(0))], timeout=.2)
+    finally:
+        client.close()
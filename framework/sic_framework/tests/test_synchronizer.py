@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from sic_framework.core.message_python2 import SICMessage
+from sic_framework.core.synchronizer_python2 import SICSynchronizer, SynchronizationError, POLICY_NEAREST, \
+    POLICY_LATEST, POLICY_INTERPOLATE
+
+
+class StateMessage(SICMessage):
+    _compress_images = True
+
+    def __init__(self, value, image=None):
+        self.value = value
+        self.angles = np.array([value, 2 * value], dtype=np.float64)
+        self.image = image if image is not None else np.full((8, 8, 3), value, dtype=np.uint8)
+
+
+def _message(value, timestamp, source, image=None):
+    message = StateMessage(value, image)
+    message._timestamp = timestamp
+    message._previous_component_name = source
+    return message
+
+
+def _received(value, timestamp, source):
+    # received messages decode their JPEG images when they are first accessed
+    return SICMessage.deserialize(_message(value, timestamp, source).serialize())
+
+
+def _synchronizer(policy, messages, window=.5):
+    synchronizer = SICSynchronizer(policy=policy, window=window)
+    for message in messages:
+        synchronizer.add(message)
+    return synchronizer
+
+
+def test_nearest_aligns_to_closest_messages():
+    synchronizer = _synchronizer(POLICY_NEAREST, [_message(1, 1.0, "a"), _message(2, 2.0, "a"),
+                                                  _message(3, 1.9, "b")])
+
+    messages, timestamp = synchronizer.pop(2)
+
+    assert timestamp == 1.9
+    assert sorted(m.value for m in messages) == [2, 3]
+    # the selected and older messages are consumed
+    assert synchronizer.buffer_sizes() == {("StateMessage", "a"): 0, ("StateMessage", "b"): 0}
+
+
+def test_nearest_requires_messages_within_window():
+    synchronizer = _synchronizer(POLICY_NEAREST, [_message(1, 1.0, "a"), _message(2, 2.0, "b")])
+
+    with pytest.raises(SynchronizationError):
+        synchronizer.pop(2)
+    assert synchronizer.buffer_sizes() == {("StateMessage", "a"): 1, ("StateMessage", "b"): 1}
+
+
+def test_waits_for_all_inputs():
+    synchronizer = _synchronizer(POLICY_NEAREST, [_message(1, 1.0, "a")])
+
+    with pytest.raises(SynchronizationError):
+        synchronizer.pop(2)
+
+
+def test_latest_ignores_timestamps():
+    synchronizer = _synchronizer(POLICY_LATEST, [_message(1, 1.0, "a"), _message(2, 2.0, "a"),
+                                                 _message(3, 9.0, "b")])
+
+    messages, _ = synchronizer.pop(2)
+
+    assert sorted(m.value for m in messages) == [2, 3]
+
+
+def test_interpolate_numeric_fields():
+    before = _message(0, 1.0, "a", image=np.zeros((8, 8, 3), dtype=np.uint8))
+    after = _message(10, 2.0, "a", image=np.full((8, 8, 3), 200, dtype=np.uint8))
+    synchronizer = _synchronizer(POLICY_INTERPOLATE, [before, after, _message(3, 1.6, "b")], window=1)
+
+    messages, timestamp = synchronizer.pop(2)
+    interpolated = [m for m in messages if m._previous_component_name == "a"][0]
+
+    assert timestamp == 1.6 and interpolated._timestamp == 1.6
+    assert interpolated.value == pytest.approx(6)
+    np.testing.assert_allclose(interpolated.angles, [6, 12])
+    # images are not blended, but copied from the closest message
+    assert interpolated.image is after.image
+    # the message after the timestamp is kept for the next timestamp
+    assert synchronizer.buffer_sizes()[("StateMessage", "a")] == 1
+
+
+def test_interpolate_does_not_decode_images():
+    before, after = _received(0, 1.0, "a"), _received(10, 2.0, "a")
+    synchronizer = _synchronizer(POLICY_INTERPOLATE, [before, after, _received(3, 1.4, "b")], window=1)
+
+    messages, _ = synchronizer.pop(2)
+    interpolated = [m for m in messages if m._previous_component_name == "a"][0]
+
+    assert interpolated.value == pytest.approx(4)
+    assert "image" in before._get_lazy_fields() and "image" in after._get_lazy_fields()
+    assert "image" in interpolated._get_lazy_fields()